@@ -13,30 +13,58 @@ The server starts on http://localhost:5050
 Then open index.html -> Admin -> Snowflake -> enter account -> toggle on -> Save Config
 """
 
+import argparse
+import atexit
 import base64
+import binascii
+import bisect
+import codecs
+import csv
+import functools
+import gzip
+import hashlib
+import importlib.util
 import io
+import itertools
 import json
-import uuid
+import os
+import queue
+import signal
+import sqlite3
 import sys
+import threading
+import time
+import uuid
+import zlib
+import _thread
+try:
+    import fcntl
+except ImportError:     # Windows: only single-process servers run there
+    fcntl = None
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
 # ─────────────────────────────────────────────────────────────────────────────
 # CHECK DEPENDENCIES
 # ─────────────────────────────────────────────────────────────────────────────
+REQUIRED_PACKAGES = [
+    ("snowflake.connector", "snowflake-connector-python"),
+    ("flask",               "flask"),
+    ("flask_cors",          "flask-cors"),
+]
+
 def check_dependencies():
+    """Check the required packages are installed without importing them."""
     missing = []
-    try:
-        import snowflake.connector
-    except ImportError:
-        missing.append("snowflake-connector-python")
-    try:
-        import flask
-    except ImportError:
-        missing.append("flask")
-    try:
-        import flask_cors
-    except ImportError:
-        missing.append("flask-cors")
+    for module, package in REQUIRED_PACKAGES:
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ModuleNotFoundError:     # parent package missing
+            found = False
+        if not found:
+            missing.append(package)
 
     if missing:
         print("=" * 60)
@@ -50,10 +78,11 @@ def check_dependencies():
 
 check_dependencies()
 
-import snowflake.connector
-from snowflake.connector import DictCursor
-from flask import Flask, request, jsonify, send_file
+from flask import (Flask, request, jsonify, send_file, g, copy_current_request_context,
+                   has_request_context)
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
 
 # ─────────────────────────────────────────────────────────────────────────────
 # SNOWFLAKE CONNECTION CONFIG
@@ -82,60 +111,686 @@ ACCOUNT_FORMATS = [
 # FLASK APP
 # ─────────────────────────────────────────────────────────────────────────────
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "X-Latest-Cursor", "X-Feed-Source", "X-Thumbnails"])
+
+# ─────────────────────────────────────────────────────────────────────────────
+# METRICS  (Prometheus text format at /api/metrics)
+# ─────────────────────────────────────────────────────────────────────────────
+METRICS_CONFIG = {
+    "slow_request_ms": 1000,    # log requests slower than this with per-phase timings; None = off
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(8))     # 1 KiB .. 16 MiB
+
+_metrics = []
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            yield f"{self.name}{_label_str(self.labelnames, labels)} {v}"
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}       # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            v[i] += 1
+            v[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        names = self.labelnames + ("le",)
+        for labels, v in items:
+            running = 0
+            for bound, n in zip(self.buckets + ("+Inf",), v[:-1]):
+                running += n
+                yield f"{self.name}_bucket{_label_str(names, labels + (bound,))} {running}"
+            yield f"{self.name}_sum{_label_str(self.labelnames, labels)} {v[-1]}"
+            yield f"{self.name}_count{_label_str(self.labelnames, labels)} {running}"
+
+class Gauge:
+    """Read at scrape time from `fn`, which returns a number."""
+
+    def __init__(self, name, help_text, fn):
+        self.name, self.help, self.fn = name, help_text, fn
+        _metrics.append(self)
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {value}"
+
+def render_metrics():
+    return "\n".join(line for m in _metrics for line in m.render()) + "\n"
+
+HTTP_REQUESTS = Counter("hen_http_requests_total", "HTTP requests by route, method and status.",
+                        ("route", "method", "status"))
+HTTP_LATENCY = Histogram("hen_http_request_duration_seconds",
+                         "Time to produce a response (excludes streaming the body).",
+                         ("route", "method"))
+SF_CONNECT = Histogram("hen_snowflake_connect_seconds", "Snowflake login time by outcome.",
+                       ("outcome",))
+SF_QUERY = Histogram("hen_snowflake_query_seconds",
+                     "Snowflake cursor time by statement type and phase (execute / fetch).",
+                     ("type", "phase"))
+POOL_WAIT = Histogram("hen_pool_checkout_seconds", "Time to get a pooled Snowflake session.")
+IMAGE_UPLOAD_BYTES = Histogram("hen_image_upload_bytes", "Decoded size of uploaded violation images.",
+                               buckets=SIZE_BUCKETS)
+ERRORS = Counter("hen_errors_total", "Exceptions by where they were raised and their class.",
+                 ("source", "exception"))
+
+Gauge("hen_http_in_flight", "Requests currently being handled.", lambda: _server_state["in_flight"])
+Gauge("hen_pool_open", "Open Snowflake sessions (idle + in use).", lambda: pool.stats()["open"])
+Gauge("hen_pool_in_use", "Snowflake sessions checked out.", lambda: pool.stats()["in_use"])
+Gauge("hen_ingest_queue_depth", "Rows waiting in the write-behind queue.",
+      lambda: ingest_queue.stats()["depth"])
+Gauge("hen_spool_depth", "Rows waiting in the offline spool.", lambda: spool.depth())
+Gauge("hen_event_streams_open", "Open /api/events/stream connections.",
+      lambda: event_hub.stats()["open_streams"])
+
+def count_error(source, exc):
+    ERRORS.inc(source, type(exc).__name__)
+
+def add_phase(name, seconds):
+    """Charge `seconds` to phase `name` of the current request, if there is one."""
+    if has_request_context():
+        phases = request.environ.setdefault("hen.phases", {})
+        phases[name] = phases.get(name, 0.0) + seconds
+
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+_QUERY_TYPES = {"select", "insert", "update", "delete", "merge", "copy", "put",
+                "create", "alter", "use", "show"}
+
+def query_type(sql):
+    words = sql.split(None, 1)
+    word = words[0].lower() if words else ""
+    return word if word in _QUERY_TYPES else "other"
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute and fetch calls per statement type."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self._type = "other"
+
+    def _timed(self, phase, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as exc:
+            count_error("snowflake", exc)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            SF_QUERY.observe(elapsed, self._type, phase)
+            add_phase(phase, elapsed)
+
+    def execute(self, sql, *args):
+        self._type = query_type(sql)
+        self._timed("execute", self._cur.execute, sql, *args)
+        return self
+
+    def executemany(self, sql, seq):
+        self._type = query_type(sql)
+        self._timed("execute", self._cur.executemany, sql, seq)
+        return self
+
+    def fetchone(self):
+        return self._timed("fetch", self._cur.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed("fetch", self._cur.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed("fetch", self._cur.fetchall)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursors."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+@app.before_request
+def _metrics_request_start():
+    request.environ["hen.started"] = time.perf_counter()
+
+@app.after_request
+def _metrics_request_end(response):
+    started = request.environ.get("hen.started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+    HTTP_LATENCY.observe(elapsed, route, request.method)
+    slow_ms = METRICS_CONFIG["slow_request_ms"]
+    if slow_ms is not None and elapsed * 1000 >= slow_ms:
+        phases = request.environ.get("hen.phases", {})
+        breakdown = "  ".join(f"{k}={v * 1000:.0f}ms" for k, v in sorted(phases.items()))
+        print(f"[slow]      {request.method} {request.path} {response.status_code} "
+              f"{elapsed * 1000:.0f}ms  {breakdown}")
+    return response
+
+@app.teardown_request
+def _metrics_request_error(exc):
+    if exc is not None:
+        count_error("request", exc)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # SNOWFLAKE CONNECTION HELPER
 # ─────────────────────────────────────────────────────────────────────────────
-def get_connection():
-    last_error = None
-    for account_fmt in ACCOUNT_FORMATS:
+_snowflake = None
+
+def snowflake_connector():
+    """Import snowflake.connector on first use; it is by far the slowest import."""
+    global _snowflake
+    if _snowflake is None:
+        import snowflake.connector
+        _snowflake = snowflake.connector
+    return _snowflake
+
+def _connect(account_fmt):
+    """Open one Snowflake session for a specific account string."""
+    start = time.perf_counter()
+    try:
+        conn = snowflake_connector().connect(
+            user=CONFIG["user"],
+            password=CONFIG["password"],
+            account=account_fmt,
+            warehouse=CONFIG["warehouse"],
+            database=CONFIG["database"],
+            schema=CONFIG["schema"],
+            role=CONFIG["role"],
+            autocommit=CONFIG["autocommit"],
+            login_timeout=15,
+            client_session_keep_alive=True,
+        )
+    except Exception as exc:
+        SF_CONNECT.observe(time.perf_counter() - start, "error")
+        count_error("connect", exc)
+        raise
+    elapsed = time.perf_counter() - start
+    SF_CONNECT.observe(elapsed, "ok")
+    add_phase("connect", elapsed)
+    return InstrumentedConnection(conn)
+
+BOOT_CONFIG = {
+    # Remembers the account format that last logged in and the schema
+    # version last applied, so a restart needs one login and no DDL.
+    "state_path":  os.path.join(os.path.dirname(os.path.abspath(__file__)), "hen_boot.json"),
+    "retry_initial": 2,     # seconds before the first bootstrap retry
+    "retry_max":     60,    # backoff cap while the warehouse is unreachable
+}
+
+def load_boot_state():
+    try:
+        with open(BOOT_CONFIG["state_path"]) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_boot_state(**changes):
+    with _resolve_lock:
+        state = load_boot_state()
+        state.update(changes)
+        path = BOOT_CONFIG["state_path"]
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+_account_resolved = False
+_resolve_lock = threading.RLock()
+
+def _probe_accounts(formats):
+    """Try every account format at once; the first successful login wins.
+
+    Logins that succeed after the winner are closed as they finish.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(formats), thread_name_prefix="account-probe")
+    futures = {executor.submit(_connect, fmt): fmt for fmt in formats}
+    winner, last_error = None, None
+    for future in as_completed(futures):
         try:
-            conn = snowflake.connector.connect(
-                user=CONFIG["user"],
-                password=CONFIG["password"],
-                account=account_fmt,
-                warehouse=CONFIG["warehouse"],
-                database=CONFIG["database"],
-                schema=CONFIG["schema"],
-                role=CONFIG["role"],
-                autocommit=CONFIG["autocommit"],
-                login_timeout=15,
-            )
-            CONFIG["account"] = account_fmt
-            return conn
+            future.result()
+            winner = future
+            break
         except Exception as e:
             last_error = e
-            continue
+    executor.shutdown(wait=False)
 
-    print("\n" + "=" * 60)
-    print("ERROR - Could not connect to Snowflake.")
-    print("Last error:", last_error)
-    print("=" * 60 + "\n")
-    raise last_error
+    def close_late(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+    for future in futures:
+        if future is not winner:
+            future.add_done_callback(close_late)
+    if winner is None:
+        raise last_error
+    return futures[winner], winner.result()
+
+def resolve_account():
+    """Find the account format that logs in and remember it.
+
+    The format saved by the last successful boot is tried alone first;
+    only if it fails are all ACCOUNT_FORMATS probed in parallel. Returns an
+    open connection on the winning format so the caller can reuse it
+    instead of paying for a second login.
+    """
+    global _account_resolved
+    with _resolve_lock:
+        if _account_resolved:
+            return _connect(CONFIG["account"])
+        cached = load_boot_state().get("account")
+        conn = None
+        if cached in ACCOUNT_FORMATS:
+            try:
+                conn = _connect(cached)
+                account_fmt = cached
+            except Exception as e:
+                print(f"[boot]      saved account {cached} failed ({e}), probing all formats")
+        if conn is None:
+            try:
+                account_fmt, conn = _probe_accounts(ACCOUNT_FORMATS)
+            except Exception as last_error:
+                print("\n" + "=" * 60)
+                print("ERROR - Could not connect to Snowflake.")
+                print("Last error:", last_error)
+                print("=" * 60 + "\n")
+                raise
+        CONFIG["account"] = account_fmt
+        _account_resolved = True
+        if account_fmt != cached:
+            save_boot_state(account=account_fmt)
+        return conn
+
+def get_connection():
+    """Open a brand-new (unpooled) connection.
+
+    The account format is resolved on the first call only; afterwards the
+    known-good CONFIG["account"] is used directly.
+    """
+    if not _account_resolved:
+        return resolve_account()
+    return _connect(CONFIG["account"])
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CONNECTION POOL
+# ─────────────────────────────────────────────────────────────────────────────
+POOL_CONFIG = {
+    "max_size":               8,     # hard cap on open sessions
+    "checkout_timeout":       10,    # seconds to wait for a free session
+    "validate_after_seconds": 60,    # ping sessions idle longer than this
+    "max_idle_seconds":       900,   # close sessions idle longer than this
+    "max_lifetime_seconds":   3600,  # recycle sessions older than this
+}
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within checkout_timeout."""
+
+class _PooledConn:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of live Snowflake sessions.
+
+    Idle sessions are kept in LIFO order so the warmest one is reused first.
+    A session is pinged before reuse if it has been idle a while, and closed
+    instead of reused once it passes max_idle_seconds / max_lifetime_seconds.
+    """
+
+    def __init__(self, factory, max_size=8, checkout_timeout=10,
+                 validate_after_seconds=60, max_idle_seconds=900,
+                 max_lifetime_seconds=3600):
+        self._factory = factory
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.validate_after_seconds = validate_after_seconds
+        self.max_idle_seconds = max_idle_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+
+        self._lock = threading.Condition()
+        self._idle = []          # stack of _PooledConn
+        self._open = 0           # idle + checked out
+        self._stats = {
+            "checkouts":        0,
+            "created":          0,
+            "recycled":         0,
+            "failed_validations": 0,
+            "timeouts":         0,
+            "waits":            0,
+            "wait_time_total":  0.0,
+            "wait_time_max":    0.0,
+        }
+
+    # -- internal -------------------------------------------------------------
+    def _expired(self, pc, now):
+        return (now - pc.created_at > self.max_lifetime_seconds or
+                now - pc.last_used > self.max_idle_seconds)
+
+    def _is_alive(self, pc):
+        try:
+            if pc.conn.is_closed():
+                return False
+            pc.conn.cursor().execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pc):
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats["recycled"] += 1
+            self._lock.notify()
+
+    # -- public ---------------------------------------------------------------
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        waited = False
+        while True:
+            with self._lock:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        ERRORS.inc("pool", "PoolTimeout")
+                        raise PoolTimeout(
+                            f"No Snowflake connection free after {self.checkout_timeout}s "
+                            f"(pool size {self.max_size})")
+                    waited = True
+                    self._lock.wait(remaining)
+                pc = self._idle.pop() if self._idle else None
+                if pc is None:
+                    self._open += 1     # reserve a slot before connecting
+
+            if pc is None:
+                try:
+                    pc = _PooledConn(self._factory())
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._stats["created"] += 1
+                break
+
+            now = time.monotonic()
+            if self._expired(pc, now):
+                self._discard(pc)
+                continue
+            if now - pc.last_used > self.validate_after_seconds and not self._is_alive(pc):
+                with self._lock:
+                    self._stats["failed_validations"] += 1
+                self._discard(pc)
+                continue
+            break
+
+        wait = time.monotonic() - start
+        POOL_WAIT.observe(wait)
+        add_phase("checkout", wait)
+        with self._lock:
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time_total"] += wait
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait)
+        return pc
+
+    def checkin(self, pc, broken=False):
+        if broken:
+            self._discard(pc)
+            return
+        pc.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(pc)
+            self._lock.notify()
+
+    @staticmethod
+    def _broke_session(conn, exc):
+        """Whether `exc` (raised inside a ``with`` block) means the session
+        itself is unusable, as opposed to a bad statement or row, or the
+        caller just stopping early (GeneratorExit from a closed download).
+        """
+        try:
+            errors = snowflake_connector().errors
+            if isinstance(exc, (errors.OperationalError, errors.InterfaceError)):
+                return True
+            return conn.is_closed()
+        except Exception:
+            return True
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out for the duration of a ``with`` block.
+
+        The session is closed rather than returned only if the block failed
+        in a way that points at the connection (network, login, closed
+        session); a data error or an abandoned export keeps it pooled.
+        """
+        pc = self.checkout()
+        try:
+            yield pc.conn
+        except BaseException as exc:
+            self.checkin(pc, broken=self._broke_session(pc.conn, exc))
+            raise
+        else:
+            self.checkin(pc)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pc in idle:
+            self._discard(pc)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["max_size"] = self.max_size
+            s["open"] = self._open
+            s["idle"] = len(self._idle)
+            s["in_use"] = self._open - len(self._idle)
+        s["wait_time_avg"] = s["wait_time_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        return s
+
+pool = ConnectionPool(get_connection, **POOL_CONFIG)
+
+def db_connection():
+    """Shorthand for ``pool.connection()`` used by every data function."""
+    return pool.connection()
 
 # ─────────────────────────────────────────────────────────────────────────────
-# CONNECTION TEST
+# CONNECTION TEST / HEALTH PROBE
 # ─────────────────────────────────────────────────────────────────────────────
+HEALTH_CONFIG = {
+    "interval_seconds":    60,   # how often the background prober asks Snowflake
+    "stale_after_seconds": 180,  # readiness fails once the last good probe is older
+    "first_probe_wait":    15,   # how long /api/health waits for the very first probe
+}
+
+class HealthProber:
+    """Refreshes warehouse status in the background so health checks don't.
+
+    Load balancer polls are answered from the cached result; only this
+    thread talks to Snowflake, through the pool, every `interval_seconds`.
+    """
+
+    def __init__(self, interval_seconds, stale_after_seconds, first_probe_wait):
+        self.interval = interval_seconds
+        self.stale_after = stale_after_seconds
+        self.first_probe_wait = first_probe_wait
+        self._cond = threading.Condition()
+        self._result = None
+        self._last_ok = None
+        self._last_error = None
+        self._failures = 0
+        self._thread = None
+        self._wake = threading.Event()
+
+    def probe_once(self):
+        """Run one probe now and cache its result."""
+        started = time.monotonic()
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT CURRENT_USER(), CURRENT_ACCOUNT(), CURRENT_TIMESTAMP()")
+                row = cur.fetchone()
+            result = {"ok": True, "user": row[0], "account": row[1], "time": str(row[2]),
+                      "error": None}
+        except Exception as exc:
+            result = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        result["checked_at"] = time.time()
+        with self._cond:
+            if result["ok"]:
+                self._last_ok = result
+                self._failures = 0
+            else:
+                self._last_error = result
+                self._failures += 1
+            self._result = result
+            self._cond.notify_all()
+        return result
+
+    def _run(self):
+        while True:
+            if self._result is not None:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+            self.probe_once()
+
+    def start(self):
+        # After a fork the thread object survives but the thread does not.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+            self._thread.start()
+
+    def snapshot(self, wait=0):
+        """Latest probe plus its age, last error and last success; None if none yet."""
+        self.start()
+        with self._cond:
+            if self._result is None and wait:
+                self._cond.wait_for(lambda: self._result is not None, timeout=wait)
+            if self._result is None:
+                return None
+            now = time.time()
+            snap = dict(self._result)
+            snap["age_seconds"] = round(now - snap["checked_at"], 1)
+            snap["consecutive_failures"] = self._failures
+            snap["last_error"] = None
+            if self._last_error is not None:
+                snap["last_error"] = self._last_error["error"]
+                snap["last_error_age_seconds"] = round(now - self._last_error["checked_at"], 1)
+            if self._last_ok is not None:
+                snap["last_ok_age_seconds"] = round(now - self._last_ok["checked_at"], 1)
+                for key in ("user", "account", "time"):
+                    snap.setdefault(key, self._last_ok[key])
+            snap["ready"] = (self._last_ok is not None and snap["ok"]
+                             and now - self._last_ok["checked_at"] <= self.stale_after)
+        return snap
+
+health_prober = HealthProber(**HEALTH_CONFIG)
+
 def test_connection():
     print("\nTesting Snowflake connection...")
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT CURRENT_USER(), CURRENT_ACCOUNT(), CURRENT_TIMESTAMP()")
-        row = cur.fetchone()
-        conn.close()
-        print(f"  OK - Connected as user={row[0]}  account={row[1]}  time={row[2]}")
+    result = health_prober.probe_once()
+    if result["ok"]:
+        print(f"  OK - Connected as user={result['user']}  account={result['account']}  "
+              f"time={result['time']}  ({result['latency_ms']} ms)")
         return True
-    except Exception as e:
-        print(f"  FAILED - {e}")
-        return False
+    print(f"  FAILED - {result['error']}")
+    return False
 
 # ─────────────────────────────────────────────────────────────────────────────
 # SCHEMA SETUP  (runs on startup)
 # ─────────────────────────────────────────────────────────────────────────────
-def setup_schema():
-    """Create tables if they don't already exist (preserves existing data)."""
+# Bump whenever the statements in setup_schema() change, so units that
+# already applied the old version run the DDL once more on their next boot.
+#   1  CROSSING_LOGS, JAYWALKING_VIOLATIONS, APP_SETTINGS
+#   2  JAYWALKING_VIOLATIONS.image_ref
+SCHEMA_VERSION = 2
+
+def _schema_target():
+    return f"{CONFIG['database']}.{CONFIG['schema']}"
+
+def setup_schema(force=False):
+    """Create tables if they don't already exist (preserves existing data).
+
+    Skipped when the boot state says this SCHEMA_VERSION was already
+    applied to the same database and schema, unless `force` is set.
+    Returns True when the DDL actually ran.
+    """
+    state = load_boot_state()
+    if (not force and state.get("schema_version") == SCHEMA_VERSION
+            and state.get("schema_target") == _schema_target()):
+        print(f"  OK - Schema v{SCHEMA_VERSION} already applied, skipping DDL.")
+        return False
+
     statements = [
         "USE WAREHOUSE CROSSWALK_WH",
         "USE DATABASE SMART_CITY",
@@ -165,10 +820,14 @@ def setup_schema():
             image_data     TEXT,
             image_filename STRING,
             pedestrian_id  STRING,
-            location       STRING DEFAULT 'Hen-Tersection Unit'
+            location       STRING DEFAULT 'Hen-Tersection Unit',
+            image_ref      STRING
         )
         """,
 
+        # Tables created before the image store existed
+        "ALTER TABLE JAYWALKING_VIOLATIONS ADD COLUMN IF NOT EXISTS image_ref STRING",
+
         # App settings / config persistence table
         """
         CREATE TABLE IF NOT EXISTS APP_SETTINGS (
@@ -180,303 +839,3579 @@ def setup_schema():
         """,
     ]
 
-    conn = get_connection()
     try:
-        cur = conn.cursor()
-        for stmt in statements:
-            cur.execute(stmt.strip())
+        with db_connection() as conn:
+            cur = conn.cursor()
+            for stmt in statements:
+                cur.execute(stmt.strip())
         print("  OK - Tables ready.")
     except Exception as e:
         print(f"  ERROR - Schema setup failed: {e}")
         raise
-    finally:
-        conn.close()
+    save_boot_state(schema_version=SCHEMA_VERSION, schema_target=_schema_target())
+    return True
 
 # ─────────────────────────────────────────────────────────────────────────────
-# CROSSING LOG
+# WAREHOUSE BOOTSTRAP  (runs in the background; ingest spools until it's done)
 # ─────────────────────────────────────────────────────────────────────────────
-def log_crossing(pedestrian_type, duration_seconds, was_light_extended,
-                 persons_count=1, confidence_pct=None, notes=""):
-    event_id = str(uuid.uuid4())
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    sql = """
-        INSERT INTO CROSSING_LOGS
-            (event_id, timestamp, pedestrian_type, duration_seconds,
-             was_light_extended, persons_count, confidence_pct, notes)
-        VALUES (%s, %s::TIMESTAMP_NTZ, %s, %s, %s, %s, %s, %s)
-    """
-    conn = get_connection()
-    try:
-        conn.cursor().execute(sql, (
-            event_id, ts, pedestrian_type, duration_seconds,
-            was_light_extended, persons_count, confidence_pct, notes,
-        ))
-        print(f"[crossing]  OK - {pedestrian_type} at {ts}")
-        return event_id
-    finally:
-        conn.close()
+warehouse_ready = threading.Event()
+_boot_state = {"attempts": 0, "last_error": None, "schema_applied": None,
+               "started": None, "ready_after_seconds": None}
 
-# ─────────────────────────────────────────────────────────────────────────────
-# JAYWALKING VIOLATIONS
-# ─────────────────────────────────────────────────────────────────────────────
-def log_jaywalking_violation_from_dataurl(severity, description, data_url=None,
-                                          pedestrian_id=None, location="Hen-Tersection Unit"):
-    violation_id = str(uuid.uuid4())
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    image_b64 = None
-    image_filename = f"jaywalk-violation-{int(datetime.now().timestamp() * 1000)}.png"
+def bootstrap_warehouse(force_schema=False, retry=True):
+    """Log in, make sure the schema is current, then open the ingest gates.
 
-    if data_url and data_url.startswith("data:"):
-        header, b64data = data_url.split(",", 1)
-        ext = "png" if "png" in header else "jpg"
-        image_filename = f"jaywalk-violation-{int(datetime.now().timestamp() * 1000)}.{ext}"
-        image_b64 = b64data
+    With `retry` it keeps trying with backoff until it succeeds; otherwise
+    it returns False after the first failure.
+    """
+    _boot_state["started"] = time.time()
+    delay = BOOT_CONFIG["retry_initial"]
+    while True:
+        _boot_state["attempts"] += 1
+        try:
+            if not test_connection():
+                raise RuntimeError("Snowflake login failed (see above)")
+            print("\nSetting up Snowflake schema...")
+            _boot_state["schema_applied"] = setup_schema(force=force_schema)
+            break
+        except Exception as e:
+            _boot_state["last_error"] = str(e)
+            if not retry:
+                return False
+            print(f"[boot]      warehouse not ready ({e}); rows are spooled, retrying in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, BOOT_CONFIG["retry_max"])
 
-    sql = """
-        INSERT INTO JAYWALKING_VIOLATIONS
-            (violation_id, timestamp, severity, description,
-             image_data, image_filename, pedestrian_id, location)
-        VALUES (%s, %s::TIMESTAMP_NTZ, %s, %s, %s, %s, %s, %s)
-    """
-    conn = get_connection()
-    try:
-        conn.cursor().execute(sql, (
-            violation_id, ts, severity, description,
-            image_b64, image_filename, pedestrian_id, location,
-        ))
-        print(f"[jaywalk]   OK - {severity} at {ts}")
-        return violation_id
-    finally:
-        conn.close()
+    _boot_state["ready_after_seconds"] = round(time.time() - _boot_state["started"], 2)
+    warehouse_ready.set()
+    print(f"[boot]      warehouse ready after {_boot_state['ready_after_seconds']}s")
+    spool.wake()
+    health_prober.start()
+    return True
+
+def start_bootstrap(force_schema=False):
+    threading.Thread(target=bootstrap_warehouse, args=(force_schema,),
+                     name="warehouse-bootstrap", daemon=True).start()
+
+def boot_stats():
+    return dict(_boot_state, ready=warehouse_ready.is_set(), account=CONFIG["account"],
+                account_resolved=_account_resolved, schema_version=SCHEMA_VERSION)
 
 # ─────────────────────────────────────────────────────────────────────────────
-# SETTINGS PERSISTENCE
+# ROW INSERTS
 # ─────────────────────────────────────────────────────────────────────────────
-def get_settings(key="app_settings"):
-    sql = "SELECT setting_value FROM APP_SETTINGS WHERE setting_key = %s LIMIT 1"
-    conn = get_connection()
-    try:
+TABLE_COLUMNS = {
+    "CROSSING_LOGS": (
+        "event_id", "timestamp", "pedestrian_type", "duration_seconds",
+        "was_light_extended", "persons_count", "confidence_pct", "notes",
+    ),
+    "JAYWALKING_VIOLATIONS": (
+        "violation_id", "timestamp", "severity", "description",
+        "image_data", "image_filename", "pedestrian_id", "location", "image_ref",
+    ),
+}
+
+ID_COLUMNS = {
+    "CROSSING_LOGS":         "event_id",
+    "JAYWALKING_VIOLATIONS": "violation_id",
+}
+
+def _utc_now_str():
+    # Millisecond precision keeps (timestamp, id) cursors stable for bursts.
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+def insert_sql(table):
+    cols = TABLE_COLUMNS[table]
+    values = ", ".join("%s::TIMESTAMP_NTZ" if c == "timestamp" else "%s" for c in cols)
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({values})"
+
+def insert_rows(table, rows):
+    """Insert row dicts into `table` in a single round trip.
+
+    More than one row goes through ``executemany``, which the connector
+    rewrites into one multi-row INSERT.
+    """
+    cols = TABLE_COLUMNS[table]
+    params = [tuple(row.get(c) for c in cols) for row in rows]
+    if not params:
+        return
+    with db_connection() as conn:
         cur = conn.cursor()
-        cur.execute(sql, (key,))
-        row = cur.fetchone()
-        if row and row[0]:
-            return json.loads(row[0])
-        return {}
-    finally:
-        conn.close()
+        if len(params) == 1:
+            cur.execute(insert_sql(table), params[0])
+        else:
+            cur.executemany(insert_sql(table), params)
 
-def save_settings(data, key="app_settings"):
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-    value = json.dumps(data)
-    # MERGE: update if exists, insert if not
-    sql = """
-        MERGE INTO APP_SETTINGS AS target
-        USING (SELECT %s AS setting_key, %s AS setting_value, %s::TIMESTAMP_NTZ AS updated_at) AS src
-        ON target.setting_key = src.setting_key
-        WHEN MATCHED THEN UPDATE SET setting_value = src.setting_value, updated_at = src.updated_at
-        WHEN NOT MATCHED THEN INSERT (setting_key, setting_value, updated_at)
-            VALUES (src.setting_key, src.setting_value, src.updated_at)
+def existing_ids(table, ids):
+    """Return the subset of `ids` already present in `table`."""
+    if not ids:
+        return set()
+    id_col = ID_COLUMNS[table]
+    sql = f"SELECT {id_col} FROM {table} WHERE {id_col} IN ({', '.join(['%s'] * len(ids))})"
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, tuple(ids))
+        return {r[0] for r in cur.fetchall()}
+
+# Snowflake error numbers that mean a value in the row is bad.
+DATA_ERROR_CODES = {
+    100035,     # timestamp not recognized
+    100038,     # numeric value not recognized
+    100040,     # date not recognized
+    100072,     # NULL result in a non-nullable column
+    100078,     # string too long, would be truncated
+    252004,     # connector could not bind a parameter value
+}
+
+def is_data_error(exc):
+    """True for errors caused by the rows themselves rather than the link.
+
+    Retrying these can never succeed, so they are not spooled. Only SQL
+    data exceptions (sqlstate 22xxx), constraint violations (23xxx) and
+    DATA_ERROR_CODES count. Everything else the server raises, such as an
+    expired token, no active warehouse, a missing table, a privilege error
+    or a statement timeout, is worth retrying.
     """
-    conn = get_connection()
-    try:
-        conn.cursor().execute(sql, (key, value, ts))
-        print(f"[settings]  OK - saved key={key}")
-    finally:
-        conn.close()
+    if not isinstance(exc, snowflake_connector().errors.Error):
+        return False
+    sqlstate = str(getattr(exc, "sqlstate", None) or "")
+    return sqlstate[:2] in ("22", "23") or getattr(exc, "errno", None) in DATA_ERROR_CODES
 
 # ─────────────────────────────────────────────────────────────────────────────
-# QUERIES
+# LOCAL SPOOL  (store-and-forward while Snowflake is unreachable)
 # ─────────────────────────────────────────────────────────────────────────────
-def get_recent_violations(limit=50):
-    sql = """
-        SELECT
-            violation_id,
-            TO_CHAR(timestamp, 'YYYY-MM-DD HH24:MI:SS') AS timestamp,
-            severity, description, image_filename, pedestrian_id, location
-        FROM JAYWALKING_VIOLATIONS
-        ORDER BY timestamp DESC LIMIT %s
+@contextmanager
+def exclusive_file_lock(path):
+    """Yield True while holding an exclusive lock on `path` across processes,
+    or False straight away if another process (or thread) holds it.
     """
-    conn = get_connection()
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
     try:
-        cur = conn.cursor(DictCursor)
-        cur.execute(sql, (limit,))
-        return [dict(r) for r in cur.fetchall()]
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
     finally:
-        conn.close()
+        os.close(fd)   # releases the lock
 
-def get_violation_image(violation_id):
-    sql = """
-        SELECT image_data, image_filename FROM JAYWALKING_VIOLATIONS
-        WHERE violation_id = %s LIMIT 1
-    """
-    conn = get_connection()
+def pid_alive(pid):
+    """Whether process `pid` still exists (on Windows only this one can)."""
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        return False
     try:
-        cur = conn.cursor(DictCursor)
-        cur.execute(sql, (violation_id,))
-        row = cur.fetchone()
-        if not row or not row.get("IMAGE_DATA"):
-            return None, None
-        image_bytes = base64.b64decode(row["IMAGE_DATA"])
-        return image_bytes, row.get("IMAGE_FILENAME", "violation.png")
-    finally:
-        conn.close()
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
 
-def get_recent_crossings(limit=100):
-    sql = """
-        SELECT
-            event_id,
-            TO_CHAR(timestamp, 'YYYY-MM-DD HH24:MI:SS') AS timestamp,
-            pedestrian_type, duration_seconds, was_light_extended,
-            persons_count, confidence_pct, notes
-        FROM CROSSING_LOGS
-        ORDER BY timestamp DESC LIMIT %s
+SPOOL_CONFIG = {
+    "path":            os.path.join(os.path.dirname(os.path.abspath(__file__)), "hen_spool.sqlite3"),
+    "replay_batch":    500,    # rows read from the spool per replay step
+    "replay_interval": 5,      # seconds between replay attempts while rows are waiting
+}
+
+class Spool:
+    """Append-only SQLite spool that is replayed to Snowflake in order.
+
+    While the spool holds anything, new rows are appended behind it rather
+    than inserted directly, so the warehouse always receives rows in the
+    order they were accepted. Replay skips ids that are already in the
+    table, so a crash between INSERT and DELETE never duplicates a row.
+    Rows Snowflake rejects as invalid are moved to ``spool_dead``.
+
+    Several processes may append to one spool (see share()); replay takes
+    an exclusive lock on ``<path>.lock`` so only one of them replays at a
+    time and the existing-id check can't race.
     """
-    conn = get_connection()
-    try:
-        cur = conn.cursor(DictCursor)
-        cur.execute(sql, (limit,))
-        return [dict(r) for r in cur.fetchall()]
-    finally:
-        conn.close()
 
-# ─────────────────────────────────────────────────────────────────────────────
-# FLASK API ROUTES
-# ─────────────────────────────────────────────────────────────────────────────
+    def __init__(self, path, replay_batch=500, replay_interval=5):
+        self.path = path
+        self.replay_batch = replay_batch
+        self.replay_interval = replay_interval
+        self.shared = False
 
-@app.route("/api/snowflake", methods=["POST"])
-def api_snowflake():
-    payload = request.get_json(force=True)
-    table   = payload.get("table", "").upper()
-    record  = payload.get("record", {})
+        self._db = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {
+            "appended":            0,
+            "replayed":            0,
+            "duplicates_skipped":  0,
+            "quarantined":         0,
+            "replay_errors":       0,
+            "last_error":          None,
+            "last_replay_rows":    0,
+            "last_replay_seconds": 0.0,
+        }
 
-    try:
-        if table == "CROSSING_LOGS":
-            event_id = log_crossing(
-                pedestrian_type    = record.get("pedestrian_type", "normal"),
-                duration_seconds   = record.get("duration_seconds", 0),
-                was_light_extended = record.get("was_light_extended", False),
-                persons_count      = record.get("persons_count", 1),
-                confidence_pct     = record.get("confidence_pct"),
-                notes              = record.get("notes", ""),
-            )
-            return jsonify({"ok": True, "event_id": event_id})
-
-        elif table == "JAYWALKING_VIOLATIONS":
-            violation_id = log_jaywalking_violation_from_dataurl(
-                severity      = record.get("severity", "WARNING"),
-                description   = record.get("description", ""),
-                data_url      = record.get("image_dataurl"),
-                pedestrian_id = str(record.get("pedestrian_id", "")),
-                location      = record.get("location", "Hen-Tersection Unit"),
-            )
-            return jsonify({"ok": True, "violation_id": violation_id})
+    # -- storage --------------------------------------------------------------
+    def _conn(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            for table in ("spool", "spool_dead"):
+                db.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+                        table_name TEXT NOT NULL,
+                        row_json   TEXT NOT NULL,
+                        spooled_at REAL NOT NULL
+                    )""")
+            self._pending = db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+            self._db = db
+            if self._pending:
+                self.start()
+        return self._db
 
-        else:
-            return jsonify({"ok": False, "error": f"Unknown table: {table}"}), 400
+    def share(self):
+        """Other processes append to and replay this spool too, so the
+        in-memory row count can't be trusted and is re-read from the file.
+        """
+        self.shared = True
 
-    except Exception as exc:
-        print(f"[api_snowflake] ERROR: {exc}")
-        return jsonify({"ok": False, "error": str(exc)}), 500
+    def has_pending(self):
+        with self._lock:
+            db = self._conn()
+            if self.shared:
+                return db.execute("SELECT EXISTS (SELECT 1 FROM spool)").fetchone()[0] == 1
+            return self._pending > 0
 
+    def depth(self):
+        with self._lock:
+            db = self._conn()
+            if self.shared:
+                self._pending = db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+            return self._pending
 
-@app.route("/api/settings", methods=["GET"])
-def api_get_settings():
-    """Return persisted app settings from Snowflake."""
-    key = request.args.get("key", "app_settings")
-    try:
-        data = get_settings(key)
-        return jsonify({"ok": True, "settings": data})
-    except Exception as exc:
-        return jsonify({"ok": False, "error": str(exc)}), 500
+    def append(self, table, rows):
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.executemany(
+                    "INSERT INTO spool (table_name, row_json, spooled_at) VALUES (?, ?, ?)",
+                    [(table, json.dumps(row), now) for row in rows])
+            self._pending += len(rows)
+            self._stats["appended"] += len(rows)
+        self.start()
+        self._wake.set()
 
+    def _read(self, limit):
+        with self._lock:
+            return self._conn().execute(
+                "SELECT seq, table_name, row_json FROM spool ORDER BY seq LIMIT ?",
+                (limit,)).fetchall()
 
-@app.route("/api/settings", methods=["POST"])
-def api_save_settings():
-    """Persist app settings to Snowflake."""
-    payload = request.get_json(force=True)
-    key     = payload.get("key", "app_settings")
-    data    = payload.get("settings", {})
-    try:
-        save_settings(data, key)
-        return jsonify({"ok": True})
-    except Exception as exc:
-        return jsonify({"ok": False, "error": str(exc)}), 500
+    def _delete(self, seqs):
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.executemany("DELETE FROM spool WHERE seq = ?", [(q,) for q in seqs])
+            self._pending -= len(seqs)
 
+    def _quarantine(self, table, seq, row):
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute("INSERT INTO spool_dead (table_name, row_json, spooled_at) "
+                           "VALUES (?, ?, ?)", (table, json.dumps(row), time.time()))
+                db.execute("DELETE FROM spool WHERE seq = ?", (seq,))
+            self._pending -= 1
+            self._stats["quarantined"] += 1
+        rollups.forget(table, [row])
 
-@app.route("/api/violations", methods=["GET"])
-def api_violations():
-    limit = int(request.args.get("limit", 50))
+    # -- replay ---------------------------------------------------------------
+    def _replay_run(self, table, run):
+        """Insert one same-table run of spooled rows, then drop it from the spool."""
+        rows = [row for _, row in run]
+        present = existing_ids(table, [r[ID_COLUMNS[table]] for r in rows])
+        fresh = [(seq, row) for seq, row in run if row[ID_COLUMNS[table]] not in present]
+        dead = set()
+        try:
+            insert_rows(table, [row for _, row in fresh])
+        except Exception as e:
+            if not is_data_error(e):
+                raise
+            # Isolate the bad row(s) so they don't block the rest of the spool.
+            for seq, row in fresh:
+                try:
+                    insert_rows(table, [row])
+                except Exception as row_err:
+                    if not is_data_error(row_err):
+                        raise
+                    print(f"[spool]     DEAD - {table} {row[ID_COLUMNS[table]]}: {row_err}")
+                    self._quarantine(table, seq, row)
+                    dead.add(seq)
+        self._delete([seq for seq, _ in run if seq not in dead])
+        with self._lock:
+            self._stats["duplicates_skipped"] += len(present)
+            self._stats["replayed"] += len(fresh) - len(dead)
+
+    def replay_once(self):
+        """Replay up to replay_batch rows. Returns the number of rows handled
+        (0 as well when another process is replaying).
+        """
+        with exclusive_file_lock(self.path + ".lock") as locked:
+            return self._replay_locked() if locked else 0
+
+    def _replay_locked(self):
+        records = self._read(self.replay_batch)
+        if not records:
+            return 0
+        start = time.monotonic()
+        run, run_table = [], None
+        for seq, table, row_json in records:
+            if table != run_table and run:
+                self._replay_run(run_table, run)
+                run = []
+            run_table = table
+            run.append((seq, json.loads(row_json)))
+        if run:
+            self._replay_run(run_table, run)
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._stats["last_replay_rows"] = len(records)
+            self._stats["last_replay_seconds"] = elapsed
+        return len(records)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.replay_interval)
+            self._wake.clear()
+            if not warehouse_ready.is_set():
+                continue        # bootstrap wakes us once the warehouse is confirmed
+            try:
+                while self.replay_once():
+                    pass
+            except Exception as e:
+                with self._lock:
+                    self._stats["replay_errors"] += 1
+                    self._stats["last_error"] = str(e)
+                print(f"[spool]     replay paused ({self.stats()['depth']} rows waiting): {e}")
+                time.sleep(self.replay_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Replay now rather than at the next interval."""
+        self.start()
+        self._wake.set()
+
+    def stats(self):
+        depth = self.depth()
+        with self._lock:
+            db = self._conn()
+            s = dict(self._stats)
+            s["depth"] = depth
+            oldest = db.execute("SELECT MIN(spooled_at) FROM spool").fetchone()[0]
+            s["dead"] = db.execute("SELECT COUNT(*) FROM spool_dead").fetchone()[0]
+        s["oldest_age_seconds"] = time.time() - oldest if oldest else 0.0
+        s["bytes"] = sum(os.path.getsize(f) for f in (self.path, self.path + "-wal")
+                         if os.path.exists(f))
+        s["replay_rows_per_second"] = (s["last_replay_rows"] / s["last_replay_seconds"]
+                                       if s["last_replay_seconds"] else 0.0)
+        s["running"] = self._thread is not None and self._thread.is_alive()
+        return s
+
+spool = Spool(**SPOOL_CONFIG)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# WRITE-BEHIND INGEST QUEUE
+# ─────────────────────────────────────────────────────────────────────────────
+INGEST_CONFIG = {
+    "mode":              "direct",  # "direct" | "write_behind" (queue + batch) | "stage" (PUT + COPY)
+    "max_batch":         200,       # rows per executemany
+    "max_age_seconds":   0.5,       # flush a partial batch once its oldest row is this old
+    "max_queue_depth":   5000,      # submit() blocks, then rejects, past this
+    "put_timeout":       0.25,      # seconds submit() waits for room before rejecting
+    "drain_timeout":     30,        # seconds to wait for the queue to empty on shutdown
+}
+
+class IngestQueueFull(Exception):
+    """Raised when the write-behind queue has no room (backpressure)."""
+
+class IngestQueue:
+    """In-process queue that groups rows per table into multi-row inserts.
+
+    A single background thread pulls rows off the queue and flushes them
+    when ``max_batch`` rows are pending or the oldest pending row is
+    ``max_age_seconds`` old, whichever comes first. A batch that fails to
+    insert is handed to ``fallback_fn`` (the local spool).
+
+    Each submit() is queued as one item after room for all of its rows has
+    been reserved, so a batch is either wholly accepted or wholly rejected.
+    """
+
+    _STOP = object()
+
+    def __init__(self, insert_fn, fallback_fn, max_batch=200, max_age_seconds=0.5,
+                 max_queue_depth=5000, put_timeout=0.25, drain_timeout=30, **_):
+        self._insert = insert_fn
+        self._fallback = fallback_fn
+        self.max_batch = max_batch
+        self.max_age_seconds = max_age_seconds
+        self.put_timeout = put_timeout
+        self.drain_timeout = drain_timeout
+
+        self.max_queue_depth = max_queue_depth
+        self._q = queue.Queue()         # (table, rows) per submit()
+        self._depth = 0                 # rows queued, bounded by max_queue_depth
+        self._space = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            "enqueued":           0,
+            "rejected":           0,
+            "flushes":            0,
+            "flushed_rows":       0,
+            "flush_errors":       0,
+            "spooled_rows":       0,
+            "flush_latency_last": 0.0,
+            "flush_latency_max":  0.0,
+            "flush_latency_total": 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ingest-flusher",
+                                                daemon=True)
+                self._thread.start()
+
+    def submit(self, table, rows):
+        """Queue rows for a later bulk insert, or raise IngestQueueFull.
+
+        All-or-nothing: either every row is queued or none is.
+        """
+        self._ensure_started()
+        rows = list(rows)
+        with self._space:
+            fits = len(rows) <= self.max_queue_depth and self._space.wait_for(
+                lambda: self._depth + len(rows) <= self.max_queue_depth, timeout=self.put_timeout)
+            if not fits:
+                with self._stats_lock:
+                    self._stats["rejected"] += len(rows)
+                raise IngestQueueFull(
+                    f"Ingest queue full ({self._depth} of {self.max_queue_depth} rows pending, "
+                    f"{len(rows)} more submitted)")
+            self._depth += len(rows)
+        self._q.put((table, rows))
+        with self._stats_lock:
+            self._stats["enqueued"] += len(rows)
+
+    def _take(self, item):
+        """Hand an item's rows over from the queue to the flusher."""
+        with self._space:
+            self._depth -= len(item[1])
+            self._space.notify_all()
+        return item
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._q.get()
+            if item is self._STOP:
+                break
+            batch = [self._take(item)]
+            count = len(item[1])
+            deadline = time.monotonic() + self.max_age_seconds
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(self._take(item))
+                count += len(item[1])
+            self._flush(batch)
+
+        # Drain whatever was queued before the stop sentinel.
+        batch, count = [], 0
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                continue
+            batch.append(self._take(item))
+            count += len(item[1])
+            if count >= self.max_batch:
+                self._flush(batch)
+                batch, count = [], 0
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        by_table = {}
+        for table, rows in batch:
+            by_table.setdefault(table, []).extend(rows)
+
+        with self._stats_lock:
+            self._in_flight = sum(len(rows) for rows in by_table.values())
+        for table, rows in by_table.items():
+            start = time.monotonic()
+            try:
+                self._insert(table, rows)
+            except Exception as e:
+                print(f"[ingest]    ERROR - flush of {len(rows)} {table} rows failed, spooling: {e}")
+                with self._stats_lock:
+                    self._stats["flush_errors"] += 1
+                    self._stats["spooled_rows"] += len(rows)
+                self._fallback(table, rows)
+                continue
+            elapsed = time.monotonic() - start
+            with self._stats_lock:
+                self._stats["flushes"] += 1
+                self._stats["flushed_rows"] += len(rows)
+                self._stats["flush_latency_last"] = elapsed
+                self._stats["flush_latency_max"] = max(self._stats["flush_latency_max"], elapsed)
+                self._stats["flush_latency_total"] += elapsed
+        with self._stats_lock:
+            self._in_flight = 0
+
+    def stop(self, timeout=None):
+        """Flush everything still queued and stop the flusher thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._q.put(self._STOP)
+        self._thread.join(self.drain_timeout if timeout is None else timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+            s["in_flight"] = self._in_flight
+        s["depth"] = self._depth
+        s["max_depth"] = self.max_queue_depth
+        s["flush_latency_avg"] = s["flush_latency_total"] / s["flushes"] if s["flushes"] else 0.0
+        s["running"] = self._thread is not None and self._thread.is_alive()
+        return s
+
+def _insert_unless_spooling(table, rows):
+    """Flusher insert that keeps order behind anything already spooled."""
+    if spool.has_pending() or not warehouse_ready.is_set():
+        spool.append(table, rows)
+    else:
+        insert_rows(table, rows)
+
+ingest_queue = IngestQueue(_insert_unless_spooling, spool.append, **INGEST_CONFIG)
+atexit.register(ingest_queue.stop)
+
+def write_rows(table, rows):
+    """Single entry point for every CROSSING_LOGS / JAYWALKING_VIOLATIONS write.
+
+    Returns "inserted" when the rows are already in Snowflake, "queued" in
+    write-behind mode, "staged" in stage mode, or "spooled" when they went
+    to the local spool because the warehouse is unreachable (or older rows
+    are still waiting there, or the warehouse bootstrap hasn't finished).
+    Data errors are raised to the caller instead of spooled.
+    """
+    if INGEST_CONFIG["mode"] == "write_behind":
+        ingest_queue.submit(table, rows)
+        status = "queued"
+    elif INGEST_CONFIG["mode"] == "stage":
+        stage_loader.add(table, rows)
+        status = "staged"
+    elif spool.has_pending() or not warehouse_ready.is_set():
+        spool.append(table, rows)
+        status = "spooled"
+    else:
+        try:
+            insert_rows(table, rows)
+            status = "inserted"
+        except Exception as e:
+            if is_data_error(e):
+                raise
+            print(f"[spool]     Snowflake unavailable, spooling {len(rows)} {table} rows: {e}")
+            spool.append(table, rows)
+            status = "spooled"
+    feeds[table].add(rows)
+    rollups.record(table, rows)
+    event_hub.publish(table, rows)
+    return status
+
+# ─────────────────────────────────────────────────────────────────────────────
+# STAGE-AND-COPY LOADER
+# ─────────────────────────────────────────────────────────────────────────────
+STAGE_CONFIG = {
+    "dir":              os.path.join(os.path.dirname(os.path.abspath(__file__)), "hen_stage"),
+    "max_rows":         50000,             # seal a file after this many rows
+    "max_bytes":        64 * 1024 ** 2,    # ...or this much uncompressed CSV
+    "max_age_seconds":  60,                # ...or once its first row is this old
+    "retry_interval":   10,                # seconds between upload / load attempts
+    "max_copy_attempts": 5,                # COPYs a file may fail before it is set aside as dead
+}
+
+_CSV_NULL = "\\N"     # written for None; COPY maps it back to NULL
+
+class StageClient:
+    """The two warehouse operations StageLoader needs.
+
+    Kept separate from the loader so it can run against a local stand-in.
+    """
+
+    def put(self, table, local_path):
+        """Upload `local_path` to the table's internal stage."""
+        raise NotImplementedError
+
+    def copy(self, table, columns, filenames):
+        """COPY the named staged files into `table`.
+
+        Returns the subset of `filenames` that are now loaded, including
+        files the warehouse skipped because it had already loaded them.
+        """
+        raise NotImplementedError
+
+class SnowflakeStageClient(StageClient):
+    """PUT to the table stage (@%TABLE) and COPY INTO with PURGE."""
+
+    def put(self, table, local_path):
+        path = os.path.abspath(local_path).replace("\\", "/")
+        with db_connection() as conn:
+            conn.cursor().execute(
+                f"PUT 'file://{path}' @%{table} AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=GZIP OVERWRITE=TRUE")
+
+    def copy(self, table, columns, filenames):
+        select = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+        files = ", ".join(f"'{name}'" for name in filenames)
+        sql = f"""
+            COPY INTO {table} ({', '.join(columns)})
+            FROM (SELECT {select} FROM @%{table})
+            FILES = ({files})
+            FILE_FORMAT = (TYPE = CSV COMPRESSION = GZIP SKIP_HEADER = 0
+                           FIELD_OPTIONALLY_ENCLOSED_BY = '"' NULL_IF = ('\\\\N')
+                           EMPTY_FIELD_AS_NULL = FALSE)
+            ON_ERROR = SKIP_FILE
+            PURGE = TRUE
+        """
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql)
+            results = cur.fetchall()
+        # One row per file processed: (file, status, rows_parsed, rows_loaded,
+        # error_limit, errors_seen, first_error, ...). A bad file is skipped
+        # on its own; files already loaded earlier produce no row at all.
+        failed = set()
+        for r in results:
+            if len(r) > 1 and str(r[1]).upper() not in ("LOADED", "LOAD_SKIPPED"):
+                name = os.path.basename(str(r[0]))
+                failed.add(name)
+                print(f"[stage]     {table} {name} not loaded: {r[6] if len(r) > 6 else r[1]}")
+        return {name for name in filenames if name not in failed}
+
+class StageLoader:
+    """Buffers rows into gzip CSV files, then PUTs and COPYs them in bulk.
+
+    Every file moves through open -> sealed -> uploaded in a SQLite
+    manifest next to the files, and leaves it once loaded. A retry only
+    repeats the step that failed, and COPY's own load history makes a
+    repeated COPY a no-op, so no row is ever loaded twice. A file the
+    warehouse rejects max_copy_attempts times is marked ``dead`` and kept
+    on disk, so one bad value can't hold up the rest of its table.
+
+    Each open file belongs to the process that writes it. Several
+    processes can share one directory: upload/load passes take an
+    exclusive lock on ``manifest.lock``, and an open file is only
+    recovered once the process that owned it is gone.
+    """
+
+    def __init__(self, client, dir, max_rows=50000, max_bytes=64 * 1024 ** 2,
+                 max_age_seconds=60, retry_interval=10, max_copy_attempts=5):
+        self.client = client
+        self.dir = dir
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.retry_interval = retry_interval
+        self.max_copy_attempts = max_copy_attempts
+
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()   # one upload/load pass at a time
+        self._open = {}         # table -> {"name", "gz", "writer", "rows", "bytes", "opened"}
+        self._db = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stats = {"rows_buffered": 0, "files_loaded": 0, "rows_loaded": 0,
+                       "files_dead": 0, "put_errors": 0, "copy_errors": 0, "last_error": None}
+
+    # -- manifest -------------------------------------------------------------
+    def _manifest(self):
+        if self._db is None:
+            os.makedirs(self.dir, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.dir, "manifest.sqlite3"),
+                                 check_same_thread=False, isolation_level=None)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    name       TEXT PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    rows       INTEGER NOT NULL DEFAULT 0,
+                    state      TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    owner_pid  INTEGER,
+                    attempts   INTEGER NOT NULL DEFAULT 0
+                )""")
+            for column in ("owner_pid INTEGER", "attempts INTEGER NOT NULL DEFAULT 0"):
+                try:
+                    db.execute(f"ALTER TABLE files ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    pass    # already there
+            self._db = db
+        return self._db
+
+    def _recover_orphans(self):
+        """Seal files left open by a process that has since died, keeping
+        whatever was fully written. Called with the manifest lock held.
+        """
+        for name, owner in self._manifest().execute(
+                "SELECT name, owner_pid FROM files WHERE state = 'open'").fetchall():
+            if owner is not None and pid_alive(owner):
+                continue
+            rows = self._recover(os.path.join(self.dir, name))
+            print(f"[stage]     recovered {rows} rows from {name} (left open by pid {owner})")
+            self._set_state(name, "sealed", rows=rows)
+
+    def _recover(self, path):
+        good = []
+        try:
+            with gzip.open(path, "rt", newline="") as f:
+                for line in f:
+                    good.append(line)
+        except (OSError, EOFError, zlib.error):
+            pass
+        if good and not good[-1].endswith("\n"):
+            good.pop()
+        with gzip.open(path, "wt", newline="") as f:
+            f.writelines(good)
+        return len(good)
+
+    def _set_state(self, name, state, **extra):
+        sets = ", ".join(["state = ?"] + [f"{k} = ?" for k in extra])
+        with self._lock:
+            self._manifest().execute(f"UPDATE files SET {sets} WHERE name = ?",
+                                     (state, *extra.values(), name))
+
+    # -- buffering ------------------------------------------------------------
+    def _open_file(self, table):
+        name = f"{table.lower()}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:12]}.csv.gz"
+        self._manifest().execute(
+            "INSERT INTO files (name, table_name, state, created_at, owner_pid) "
+            "VALUES (?, ?, 'open', ?, ?)", (name, table, time.time(), os.getpid()))
+        gz = gzip.open(os.path.join(self.dir, name), "wt", newline="")
+        return {"name": name, "gz": gz, "writer": csv.writer(gz), "rows": 0, "bytes": 0,
+                "opened": time.monotonic()}
+
+    def _seal(self, table):
+        f = self._open.pop(table, None)
+        if f is None:
+            return
+        f["gz"].close()
+        self._manifest().execute("UPDATE files SET state = 'sealed', rows = ? WHERE name = ?",
+                                 (f["rows"], f["name"]))
+        self._wake.set()
+
+    def add(self, table, rows):
+        cols = TABLE_COLUMNS[table]
+        with self._lock:
+            f = self._open.get(table)
+            if f is None:
+                f = self._open[table] = self._open_file(table)
+            for row in rows:
+                values = [_CSV_NULL if row.get(c) is None else row.get(c) for c in cols]
+                f["writer"].writerow(values)
+                f["bytes"] += sum(len(str(v)) + 1 for v in values)
+            f["rows"] += len(rows)
+            f["gz"].flush()
+            self._stats["rows_buffered"] += len(rows)
+            if f["rows"] >= self.max_rows or f["bytes"] >= self.max_bytes:
+                self._seal(table)
+        self.start()
+
+    # -- upload / load ----------------------------------------------------------
+    def process(self):
+        """Seal aged files, then PUT sealed files and COPY uploaded ones.
+
+        Skips the upload/load step while another process is running it.
+        """
+        with self._process_lock:
+            with self._lock:
+                now = time.monotonic()
+                for table in [t for t, f in self._open.items()
+                              if now - f["opened"] >= self.max_age_seconds]:
+                    self._seal(table)
+            if not warehouse_ready.is_set():
+                return      # sealed files wait on disk until the bootstrap finishes
+            self._manifest()
+            with exclusive_file_lock(os.path.join(self.dir, "manifest.lock")) as locked:
+                if locked:
+                    self._recover_orphans()
+                    self._process()
+
+    def _process(self):
+        with self._lock:
+            pending = self._manifest().execute(
+                "SELECT name, table_name, state, rows, attempts FROM files "
+                "WHERE state IN ('sealed', 'uploaded') ORDER BY created_at").fetchall()
+
+        uploaded = {}
+        for name, table, state, rows, attempts in pending:
+            if state == "sealed":
+                try:
+                    self.client.put(table, os.path.join(self.dir, name))
+                except Exception as e:
+                    self._error("put_errors", f"PUT {name}: {e}")
+                    continue
+                self._set_state(name, "uploaded")
+            uploaded.setdefault(table, []).append((name, rows, attempts))
+
+        for table, files in uploaded.items():
+            names = [n for n, _, _ in files]
+            try:
+                loaded = self.client.copy(table, TABLE_COLUMNS[table], names)
+            except Exception as e:
+                # The statement itself failed (warehouse down, ...): no file is to blame.
+                self._error("copy_errors", f"COPY INTO {table}: {e}")
+                continue
+            for name, rows, attempts in files:
+                if name in loaded:
+                    self._loaded(name, rows)
+                elif attempts + 1 >= self.max_copy_attempts:
+                    print(f"[stage]     DEAD - {table} {name} ({rows} rows) failed "
+                          f"{attempts + 1} COPYs, kept in {self.dir}")
+                    self._set_state(name, "dead", attempts=attempts + 1)
+                    with self._lock:
+                        self._stats["files_dead"] += 1
+                else:
+                    self._set_state(name, "uploaded", attempts=attempts + 1)
+            if len(loaded) < len(names):
+                self._error("copy_errors", f"COPY INTO {table}: {len(names) - len(loaded)} files failed")
+
+    def _loaded(self, name, rows):
+        """Drop a loaded file and its manifest entry; the warehouse's load
+        history is what stops it from being loaded again.
+        """
+        try:
+            os.remove(os.path.join(self.dir, name))
+        except OSError:
+            pass
+        with self._lock:
+            self._manifest().execute("DELETE FROM files WHERE name = ?", (name,))
+            self._stats["files_loaded"] += 1
+            self._stats["rows_loaded"] += rows
+
+    def _error(self, counter, message):
+        print(f"[stage]     ERROR - {message}")
+        with self._lock:
+            self._stats[counter] += 1
+            self._stats["last_error"] = message
+
+    def _run(self):
+        while True:
+            self._wake.wait(min(self.retry_interval, self.max_age_seconds))
+            self._wake.clear()
+            try:
+                self.process()
+            except Exception as e:
+                self._error("copy_errors", str(e))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stage-loader", daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        """Seal every open file and try one upload/load pass (used at shutdown)."""
+        with self._lock:
+            for table in list(self._open):
+                self._seal(table)
+        if self._db is not None:
+            self.process()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["open_files"] = {t: f["rows"] for t, f in self._open.items()}
+            if self._db is not None:
+                s["files"] = dict(self._db.execute(
+                    "SELECT state, COUNT(*) FROM files GROUP BY state").fetchall())
+        return s
+
+stage_loader = StageLoader(SnowflakeStageClient(), **STAGE_CONFIG)
+
+_STATUS_LABELS = {"inserted": "OK", "queued": "QUEUED", "spooled": "SPOOLED", "staged": "STAGED"}
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CROSSING LOG
+# ─────────────────────────────────────────────────────────────────────────────
+def crossing_row(pedestrian_type, duration_seconds, was_light_extended,
+                 persons_count=1, confidence_pct=None, notes=""):
+    return {
+        "event_id":           str(uuid.uuid4()),
+        "timestamp":          _utc_now_str(),
+        "pedestrian_type":    pedestrian_type,
+        "duration_seconds":   duration_seconds,
+        "was_light_extended": was_light_extended,
+        "persons_count":      persons_count,
+        "confidence_pct":     confidence_pct,
+        "notes":              notes,
+    }
+
+def log_crossing(pedestrian_type, duration_seconds, was_light_extended,
+                 persons_count=1, confidence_pct=None, notes=""):
+    row = crossing_row(pedestrian_type, duration_seconds, was_light_extended,
+                       persons_count, confidence_pct, notes)
+    status = write_rows("CROSSING_LOGS", [row])
+    print(f"[crossing]  {_STATUS_LABELS[status]} - {pedestrian_type} at {row['timestamp']}")
+    return row["event_id"], status
+
+# ─────────────────────────────────────────────────────────────────────────────
+# IMAGE STORE
+# ─────────────────────────────────────────────────────────────────────────────
+IMAGE_STORE_CONFIG = {
+    "backend": "filesystem",
+    "root":    os.path.join(os.path.dirname(os.path.abspath(__file__)), "violation_images"),
+}
+
+class ImageStore:
+    """Where violation photos live. JAYWALKING_VIOLATIONS.image_ref holds the key."""
+
+    def put(self, data, ext):
+        """Store `data` and return its reference string."""
+        raise NotImplementedError
+
+    def path(self, ref):
+        """Local file path for `ref`, or None if this store doesn't have it."""
+        raise NotImplementedError
+
+    def open_writer(self):
+        """An ImageWriter for storing an image that arrives in chunks."""
+        return ImageWriter(self)
+
+class ImageWriter:
+    """Incremental put(): write() chunks, then commit(ext) -> ref, or abort().
+
+    This default buffers in memory; stores that can do better override
+    ImageStore.open_writer().
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._buf = io.BytesIO()
+
+    def write(self, data):
+        self._buf.write(data)
+
+    def commit(self, ext):
+        return self.store.put(self._buf.getvalue(), ext)
+
+    def abort(self):
+        self._buf = None
+
+class FilesystemImageStore(ImageStore):
+    """Content-addressed store: ``<root>/ab/cd/<sha256>.<ext>``.
+
+    Identical frames hash to the same file, so they are only written once.
+    Files are written to a temp name and renamed so readers never see a
+    partial image.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest, ext):
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    def put(self, data, ext):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return f"{digest}.{ext}"
+
+    def open_writer(self):
+        return _FilesystemImageWriter(self)
+
+    def path(self, ref):
+        digest, _, ext = ref.partition(".")
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest) \
+                or not ext.isalnum():
+            return None
+        path = self._path(digest, ext)
+        return path if os.path.exists(path) else None
+
+class _FilesystemImageWriter(ImageWriter):
+    """Streams to a temp file while hashing, then renames it into place."""
+
+    def __init__(self, store):
+        os.makedirs(store.root, exist_ok=True)
+        self.store = store
+        self._sha = hashlib.sha256()
+        self._tmp = os.path.join(store.root, f".upload-{uuid.uuid4().hex}.tmp")
+        self._f = open(self._tmp, "wb")
+
+    def write(self, data):
+        self._sha.update(data)
+        self._f.write(data)
+
+    def commit(self, ext):
+        self._f.close()
+        digest = self._sha.hexdigest()
+        path = self.store._path(digest, ext)
+        if os.path.exists(path):
+            os.remove(self._tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp, path)
+        return f"{digest}.{ext}"
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png",  "png"),
+    (b"\xff\xd8\xff",        "image/jpeg", "jpg"),
+    (b"GIF87a",               "image/gif",  "gif"),
+    (b"GIF89a",               "image/gif",  "gif"),
+    (b"RIFF",                 "image/webp", "webp"),   # checked further in sniff_image_type
+)
+
+def sniff_image_type(head):
+    """(mimetype, ext) from an image's first bytes, or (None, None)."""
+    for magic, mimetype, ext in IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            if ext == "webp" and head[8:12] != b"WEBP":
+                continue
+            return mimetype, ext
+    return None, None
+
+IMAGE_STORE_BACKENDS = {
+    "filesystem": lambda cfg: FilesystemImageStore(cfg["root"]),
+}
+
+image_store = IMAGE_STORE_BACKENDS[IMAGE_STORE_CONFIG["backend"]](IMAGE_STORE_CONFIG)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BINARY IMAGE UPLOADS  (multipart part or raw body, streamed to the store)
+# ─────────────────────────────────────────────────────────────────────────────
+UPLOAD_CONFIG = {
+    "max_bytes":      10 * 1024 ** 2,   # largest accepted image
+    "max_form_bytes": 64 * 1024,        # all non-file multipart fields together
+    "chunk_size":     64 * 1024,        # read size from the request stream
+    "file_field":     "image",          # multipart part that carries the photo
+}
+
+class UploadTooLarge(Exception):
+    """The image or the form fields went over their UPLOAD_CONFIG limit."""
+
+class UnsupportedImage(Exception):
+    """The uploaded bytes are not a PNG, JPEG, GIF or WebP image."""
+
+class ImageUpload:
+    """Push-style upload into the image store.
+
+    The type is sniffed from the first bytes (never from client headers or
+    file names) and the size limit is checked as each chunk arrives, so a
+    bad or oversized upload is rejected without buffering it.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or UPLOAD_CONFIG["max_bytes"]
+        self.size = 0
+        self.mimetype = self.ext = None
+        self._head = b""
+        self._writer = image_store.open_writer()
+
+    def _sniff(self):
+        self.mimetype, self.ext = sniff_image_type(self._head)
+        if self.mimetype is None:
+            raise UnsupportedImage("Upload is not a PNG, JPEG, GIF or WebP image")
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Image is larger than {self.max_bytes} bytes")
+        if self.mimetype is None:
+            self._head = (self._head + data)[:16]
+            if len(self._head) >= 12:
+                self._sniff()
+        self._writer.write(data)
+
+    def finish(self):
+        """Commit the image and return its image_ref (None for an empty upload)."""
+        if self.size == 0:
+            self.abort()
+            return None
+        if self.mimetype is None:
+            self._sniff()
+        ref = self._writer.commit(self.ext)
+        IMAGE_UPLOAD_BYTES.observe(self.size)
+        pregenerate_thumbnails(ref)
+        return ref
+
+    def abort(self):
+        self._writer.abort()
+
+def _read_chunks(stream):
+    size = UPLOAD_CONFIG["chunk_size"]
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+def store_image_stream(stream, max_bytes=None):
+    """Stream a raw image body into the store.
+
+    Returns (upload, image_ref), or (None, None) if the body was empty.
+    """
+    upload = ImageUpload(max_bytes)
+    try:
+        for chunk in _read_chunks(stream):
+            upload.feed(chunk)
+        image_ref = upload.finish()
+        return (upload, image_ref) if image_ref else (None, None)
+    except BaseException:
+        upload.abort()
+        raise
+
+def read_multipart_upload(stream, boundary, max_bytes=None):
+    """Parse multipart/form-data as it streams in.
+
+    The first `file_field` part goes straight into the image store through
+    an ImageUpload; other fields are collected (up to max_form_bytes).
+    Returns (fields, upload, image_ref); upload and image_ref are None if
+    the form had no (or an empty) image part.
+    """
+    # The decoder's own limit only caps its internal buffer (unparsed bytes
+    # such as part headers); field and image sizes are counted below.
+    decoder = MultipartDecoder(boundary.encode("latin-1"),
+                               max_form_memory_size=UPLOAD_CONFIG["chunk_size"] +
+                               UPLOAD_CONFIG["max_form_bytes"])
+    fields, form_bytes = {}, 0
+    part, buf = None, []
+    upload = image_ref = None
+    receiving = done = False    # current part is the image / image already read
+    try:
+        chunks = _read_chunks(stream)
+        while True:
+            chunk = next(chunks, None)
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, (Field, File)):
+                    part, buf = event, []
+                    receiving = (isinstance(event, File) and not done
+                                 and event.name == UPLOAD_CONFIG["file_field"])
+                    if receiving:
+                        upload = ImageUpload(max_bytes)
+                elif isinstance(event, Data):
+                    if receiving:
+                        upload.feed(event.data)
+                        if not event.more_data:
+                            image_ref = upload.finish()
+                            upload = upload if image_ref else None
+                            receiving, done = False, True
+                    elif isinstance(part, Field):
+                        form_bytes += len(event.data)
+                        if form_bytes > UPLOAD_CONFIG["max_form_bytes"]:
+                            raise UploadTooLarge("Form fields are too large")
+                        buf.append(event.data)
+                        if not event.more_data:
+                            fields[part.name] = b"".join(buf).decode("utf-8", "replace")
+                event = decoder.next_event()
+            if chunk is None:
+                break
+    except BaseException as exc:
+        if receiving:
+            upload.abort()
+        if isinstance(exc, RequestEntityTooLarge):
+            raise UploadTooLarge("Form fields are too large") from exc
+        raise
+    if receiving:
+        upload.abort()
+        raise ValueError("Multipart body ended inside the image part")
+    return fields, upload, image_ref
+
+# ─────────────────────────────────────────────────────────────────────────────
+# JAYWALKING VIOLATIONS
+# ─────────────────────────────────────────────────────────────────────────────
+class InvalidImage(ValueError):
+    """An image_dataurl that isn't base64, or doesn't hold a PNG, JPEG, GIF or WebP image."""
+
+def decode_image_dataurl(data_url):
+    """(image bytes, ext) from a ``data:image/...;base64,`` URL.
+
+    Raises InvalidImage before anything reaches the image store.
+    """
+    header, sep, b64data = data_url.partition(",")
+    if not sep or not header.lower().endswith(";base64"):
+        raise InvalidImage("image_dataurl must be a base64 data: URL")
+    try:
+        image = base64.b64decode(b64data, validate=True)
+    except binascii.Error as exc:
+        raise InvalidImage(f"image_dataurl is not valid base64: {exc}") from None
+    if not image:
+        raise InvalidImage("image_dataurl holds no image data")
+    ext = sniff_image_type(image[:16])[1]
+    if ext is None:
+        raise InvalidImage("image_dataurl is not a PNG, JPEG, GIF or WebP image")
+    return image, ext
+
+def violation_row(severity, description, data_url=None,
+                  pedestrian_id=None, location="Hen-Tersection Unit", image_ref=None):
+    """Row for JAYWALKING_VIOLATIONS; the photo is either a data URL or an already-stored image_ref."""
+    if data_url and data_url.startswith("data:"):
+        with timed_phase("decode"):
+            image, ext = decode_image_dataurl(data_url)
+        IMAGE_UPLOAD_BYTES.observe(len(image))
+        with timed_phase("image_store"):
+            image_ref = image_store.put(image, ext)
+        pregenerate_thumbnails(image_ref)
+    image_filename = None
+    if image_ref:
+        ext = image_ref.rpartition(".")[2]
+        image_filename = f"jaywalk-violation-{int(datetime.now().timestamp() * 1000)}.{ext}"
+
+    return {
+        "violation_id":   str(uuid.uuid4()),
+        "timestamp":      _utc_now_str(),
+        "severity":       severity,
+        "description":    description,
+        "image_data":     None,
+        "image_filename": image_filename,
+        "pedestrian_id":  pedestrian_id,
+        "location":       location,
+        "image_ref":      image_ref,
+    }
+
+def log_jaywalking_violation_from_dataurl(severity, description, data_url=None,
+                                          pedestrian_id=None, location="Hen-Tersection Unit",
+                                          image_ref=None):
+    row = violation_row(severity, description, data_url, pedestrian_id, location, image_ref)
+    status = write_rows("JAYWALKING_VIOLATIONS", [row])
+    print(f"[jaywalk]   {_STATUS_LABELS[status]} - {severity} at {row['timestamp']}")
+    return row["violation_id"], status
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SETTINGS PERSISTENCE
+# ─────────────────────────────────────────────────────────────────────────────
+SETTINGS_CACHE_CONFIG = {
+    "ttl_seconds": 60,    # how long a cached value is served without re-reading APP_SETTINGS
+}
+
+def _settings_etag(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:32]
+
+class SettingsCache:
+    """Read-through, write-through cache of APP_SETTINGS keyed by setting_key.
+
+    Entries are re-read after ttl_seconds. If that re-read fails, the last
+    known value keeps being served (flagged stale) so the admin UI keeps
+    working through a warehouse outage.
+    """
+
+    def __init__(self, ttl_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}      # key -> (value, etag, fetched_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale_served": 0, "writes": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key, loader):
+        """Return ``(value, etag, stale)``, calling ``loader(key)`` on a miss."""
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[2] < self.ttl_seconds:
+            self._count("hits")
+            return entry[0], entry[1], False
+        self._count("misses")
+        try:
+            value = loader(key)
+        except Exception:
+            if entry is None:
+                raise
+            self._count("stale_served")
+            return entry[0], entry[1], True
+        return self.put(key, value, count=False) + (False,)
+
+    def put(self, key, value, count=True):
+        etag = _settings_etag(value)
+        self._entries[key] = (value, etag, time.monotonic())
+        if count:
+            self._count("writes")
+        return value, etag
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s["keys"] = len(self._entries)
+        s["ttl_seconds"] = self.ttl_seconds
+        return s
+
+settings_cache = SettingsCache(**SETTINGS_CACHE_CONFIG)
+
+def load_settings(key="app_settings"):
+    """Read one settings row straight from Snowflake (bypasses the cache)."""
+    sql = "SELECT setting_value FROM APP_SETTINGS WHERE setting_key = %s LIMIT 1"
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (key,))
+        row = cur.fetchone()
+        if row and row[0]:
+            return json.loads(row[0])
+        return {}
+
+def get_settings(key="app_settings"):
+    return settings_cache.get(key, load_settings)[0]
+
+def save_settings(data, key="app_settings"):
+    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    value = json.dumps(data)
+    # MERGE: update if exists, insert if not
+    sql = """
+        MERGE INTO APP_SETTINGS AS target
+        USING (SELECT %s AS setting_key, %s AS setting_value, %s::TIMESTAMP_NTZ AS updated_at) AS src
+        ON target.setting_key = src.setting_key
+        WHEN MATCHED THEN UPDATE SET setting_value = src.setting_value, updated_at = src.updated_at
+        WHEN NOT MATCHED THEN INSERT (setting_key, setting_value, updated_at)
+            VALUES (src.setting_key, src.setting_value, src.updated_at)
+    """
+    # A failed save leaves the stored value, and so the cached entry, as it was.
+    with db_connection() as conn:
+        conn.cursor().execute(sql, (key, value, ts))
+    etag = settings_cache.put(key, json.loads(value))[1]
+    print(f"[settings]  OK - saved key={key}")
+    return etag
+
+# ─────────────────────────────────────────────────────────────────────────────
+# QUERIES
+# ─────────────────────────────────────────────────────────────────────────────
+class LRUCache:
+    """Small thread-safe LRU map bounded by entry count and, optionally,
+    by the total ``len()`` of its values."""
+
+    def __init__(self, max_items, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = len(value) if self.max_bytes else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None and self.max_bytes:
+                self._bytes -= len(old)
+            self._data[key] = value
+            self._bytes += size
+            while len(self._data) > self.max_items or \
+                    (self.max_bytes and self._bytes > self.max_bytes and len(self._data) > 1):
+                _, evicted = self._data.popitem(last=False)
+                if self.max_bytes:
+                    self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._data), "bytes": self._bytes}
+
+ViolationImage = namedtuple("ViolationImage", "source filename etag mimetype")
+
+# violation_id -> ViolationImage with source=None, or NO_IMAGE for a row that
+# has no photo. Neither changes once written, so this lets conditional
+# requests and misses be answered without Snowflake.
+image_meta_cache = LRUCache(10000)
+NO_IMAGE = ViolationImage(None, None, None, None)
+
+def get_violation_image(violation_id):
+    """Return a ViolationImage for a violation, or None if it has no photo.
+
+    `source` is a file path when the photo is in the image store, or raw
+    bytes for rows that still carry a legacy base64 ``image_data`` column.
+    """
+    if image_meta_cache.get(violation_id) is NO_IMAGE:
+        return None
+    sql = """
+        SELECT image_ref, image_filename,
+               IFF(image_ref IS NULL, image_data, NULL) AS image_data
+        FROM JAYWALKING_VIOLATIONS
+        WHERE violation_id = %s LIMIT 1
+    """
+    with db_connection() as conn:
+        cur = conn.cursor(snowflake_connector().DictCursor)
+        cur.execute(sql, (violation_id,))
+        row = cur.fetchone()
+    if not row:
+        return None
+    filename = row.get("IMAGE_FILENAME") or "violation.png"
+    if row.get("IMAGE_REF"):
+        source = image_store.path(row["IMAGE_REF"])
+        if not source:
+            return None
+        etag = row["IMAGE_REF"].partition(".")[0]
+        with open(source, "rb") as f:
+            head = f.read(16)
+    elif row.get("IMAGE_DATA"):
+        with timed_phase("decode"):
+            source = base64.b64decode(row["IMAGE_DATA"])
+        etag = hashlib.sha256(source).hexdigest()
+        head = source[:16]
+    else:
+        # The row exists and has no photo. (A row that isn't found may just
+        # not be loaded yet, so that miss isn't cached.)
+        image_meta_cache.put(violation_id, NO_IMAGE)
+        return None
+    mimetype = sniff_image_type(head)[0] or "application/octet-stream"
+    image_meta_cache.put(violation_id, ViolationImage(None, filename, etag, mimetype))
+    return ViolationImage(source, filename, etag, mimetype)
+
+def migrate_images(batch_size=100):
+    """Backfill: move legacy base64 ``image_data`` into the image store.
+
+    Walks the table in violation_id order so a row that fails to decode is
+    skipped rather than retried forever. Safe to re-run.
+    """
+    select_sql = """
+        SELECT violation_id, image_data, image_filename FROM JAYWALKING_VIOLATIONS
+        WHERE image_data IS NOT NULL AND image_ref IS NULL AND violation_id > %s
+        ORDER BY violation_id LIMIT %s
+    """
+    update_sql = """
+        UPDATE JAYWALKING_VIOLATIONS SET image_ref = %s, image_data = NULL
+        WHERE violation_id = %s
+    """
+    last_id, moved, skipped = "", 0, 0
+    while True:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(select_sql, (last_id, batch_size))
+            rows = cur.fetchall()
+        if not rows:
+            break
+        updates = []
+        for violation_id, image_data, image_filename in rows:
+            last_id = violation_id
+            ext = (image_filename or "").rsplit(".", 1)[-1].lower()
+            try:
+                ref = image_store.put(base64.b64decode(image_data), ext if ext.isalnum() else "png")
+            except (ValueError, TypeError) as e:
+                print(f"[migrate]   SKIP - {violation_id}: {e}")
+                skipped += 1
+                continue
+            updates.append((ref, violation_id))
+        if updates:
+            with db_connection() as conn:
+                conn.cursor().executemany(update_sql, updates)
+        moved += len(updates)
+        print(f"[migrate]   {moved} images moved so far")
+    print(f"[migrate]   OK - {moved} moved, {skipped} skipped")
+    return moved
+
+# ─────────────────────────────────────────────────────────────────────────────
+# EVENT FEEDS  (keyset pagination + recent-events ring buffer)
+# ─────────────────────────────────────────────────────────────────────────────
+FEED_CONFIG = {
+    "ring_size":         1000,   # newest rows kept in memory per table
+    "resync_seconds":    300,    # re-read the window from Snowflake this often
+    "serve_from_memory": True,   # False = always query Snowflake
+}
+
+FEED_COLUMNS = {
+    "JAYWALKING_VIOLATIONS": (
+        "violation_id", "timestamp", "severity", "description",
+        "image_filename", "pedestrian_id", "location",
+    ),
+    "CROSSING_LOGS": (
+        "event_id", "timestamp", "pedestrian_type", "duration_seconds",
+        "was_light_extended", "persons_count", "confidence_pct", "notes",
+    ),
+}
+
+# Computed booleans added to feed rows. HAS_IMAGE tells the dashboard which
+# rows have a photo (rows from before the image store always have a filename).
+FEED_FLAGS = {
+    "JAYWALKING_VIOLATIONS": {
+        "has_image": "t.image_ref IS NOT NULL OR t.image_data IS NOT NULL",
+    },
+}
+
+def encode_cursor(key):
+    """Opaque cursor for a ``(sort_ts, id)`` row key."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_ts, row_id = json.loads(raw)
+        datetime.strptime(sort_ts, "%Y-%m-%d %H:%M:%S.%f")
+        return str(sort_ts), str(row_id)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+def query_feed(table, limit, before=None, since=None):
+    """Keyset query against Snowflake. Returns ``[(key, row)]`` newest first.
+
+    `before` pages back from a cursor; `since` returns the `limit` rows
+    immediately after one.
+    """
+    id_col = ID_COLUMNS[table]
+    select = ",\n               ".join(
+        "TO_CHAR(t.timestamp, 'YYYY-MM-DD HH24:MI:SS') AS timestamp" if c == "timestamp" else f"t.{c}"
+        for c in FEED_COLUMNS[table])
+    for name, condition in FEED_FLAGS.get(table, {}).items():
+        select += f",\n               IFF({condition}, TRUE, FALSE) AS {name}"
+    where, params, order = "", [], "DESC"
+    if before or since:
+        cursor, op = (before, "<") if before else (since, ">")
+        where = (f"WHERE t.timestamp {op} %s::TIMESTAMP_NTZ "
+                 f"OR (t.timestamp = %s::TIMESTAMP_NTZ AND t.{id_col} {op} %s)")
+        params = [cursor[0], cursor[0], cursor[1]]
+        order = "ASC" if since else "DESC"
+    sql = f"""
+        SELECT {select},
+               TO_CHAR(t.timestamp, 'YYYY-MM-DD HH24:MI:SS.FF3') AS sort_ts
+        FROM {table} t
+        {where}
+        ORDER BY t.timestamp {order}, t.{id_col} {order} LIMIT %s
+    """
+    with db_connection() as conn:
+        cur = conn.cursor(snowflake_connector().DictCursor)
+        cur.execute(sql, (*params, limit))
+        rows = [dict(r) for r in cur.fetchall()]
+    for r in rows:
+        for name in FEED_FLAGS.get(table, {}):
+            r[name.upper()] = bool(r[name.upper()])
+    out = [((r.pop("SORT_TS"), r[id_col.upper()]), r) for r in rows]
+    return out[::-1] if since else out
+
+def feed_row(table, row):
+    """An accepted row in the shape the feed routes return."""
+    out = {c.upper(): row.get(c) for c in FEED_COLUMNS[table]}
+    out["TIMESTAMP"] = row["timestamp"][:19]
+    if table == "JAYWALKING_VIOLATIONS":
+        out["HAS_IMAGE"] = row.get("image_ref") is not None or row.get("image_data") is not None
+    return out
+
+class RecentEvents:
+    """The newest rows of one table, kept in memory and fed by write_rows().
+
+    After the first read primes it from Snowflake, every row newer than
+    `_floor` is known to be in memory, so any page that falls inside that
+    window is answered without a query. The window is re-read every
+    resync_seconds to pick up rows written by other units, by one request
+    at a time. If that read fails, whatever is in memory is served and
+    flagged "stale" (this includes rows accepted while the warehouse was
+    down and the ring was never primed).
+    """
+
+    _EVERYTHING = ("", "")     # floor when the whole table fits in memory
+    retry_seconds = 10         # wait this long after a failed resync before trying again
+
+    def __init__(self, table, ring_size, resync_seconds, **_):
+        self.table = table
+        self.ring_size = ring_size
+        self.resync_seconds = resync_seconds
+        self._keys = []         # ascending (sort_ts, id)
+        self._rows = {}
+        self._floor = None      # None = not primed yet
+        self._primed_at = 0.0
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._resync_lock = threading.Lock()
+
+    def _insert(self, key, public):
+        if key in self._rows:
+            self._rows[key] = public
+            return
+        bisect.insort(self._keys, key)
+        self._rows[key] = public
+        while len(self._keys) > self.ring_size:
+            evicted = self._keys.pop(0)
+            del self._rows[evicted]
+            if self._floor is not None:
+                self._floor = max(self._floor, evicted)
+
+    def add(self, rows):
+        id_col = ID_COLUMNS[self.table]
+        with self._lock:
+            for row in rows:
+                self._insert((row["timestamp"], row[id_col]), feed_row(self.table, row))
+
+    def prime(self):
+        loaded = query_feed(self.table, self.ring_size)
+        with self._lock:
+            # Set the floor first so evictions during the merge can raise it.
+            self._floor = self._EVERYTHING if len(loaded) < self.ring_size else loaded[-1][0]
+            for key, row in loaded:
+                self._insert(key, row)
+            self._primed_at = time.monotonic()
+
+    def _from_memory(self, limit, before, since, partial=False):
+        """A page from memory, or None if memory may be missing rows of it.
+
+        `partial` serves whatever is there anyway (used when Snowflake is down).
+        """
+        with self._lock:
+            floor, keys = self._floor, self._keys
+            if partial:
+                floor = self._EVERYTHING
+            elif floor is None:
+                return None
+            lo = bisect.bisect_right(keys, floor)
+            if since:
+                if since < floor:
+                    return None
+                start = bisect.bisect_right(keys, since)
+                picked = keys[start:start + limit][::-1]
+            else:
+                hi = bisect.bisect_left(keys, before) if before else len(keys)
+                if hi - lo < limit and floor != self._EVERYTHING:
+                    return None
+                picked = keys[max(lo, hi - limit):hi][::-1]
+            return [(k, dict(self._rows[k])) for k in picked]
+
+    def _resync_state(self):
+        """True = window fresh, False = failed recently, None = resync due."""
+        now = time.monotonic()
+        if self._floor is not None and now - self._primed_at <= self.resync_seconds:
+            return True
+        if self._failed_at is not None and now - self._failed_at < self.retry_seconds:
+            return False
+        return None
+
+    def _resync(self):
+        """Re-prime if due. Returns False if Snowflake couldn't be read."""
+        state = self._resync_state()
+        if state is not None:
+            return state
+        # Before the first prime there is no window to fall back on, so wait.
+        if not self._resync_lock.acquire(blocking=self._floor is None):
+            return True     # another request is re-reading; the current window will do
+        try:
+            state = self._resync_state()
+            if state is not None:
+                return state
+            self.prime()
+            self._failed_at = None
+            return True
+        except Exception as e:
+            count_error("feeds", e)
+            print(f"[feeds]     {self.table} resync failed, serving from memory: {e}")
+            self._failed_at = time.monotonic()
+            return False
+        finally:
+            self._resync_lock.release()
+
+    def read(self, limit, before=None, since=None):
+        """Return ``([(key, row)], source)`` newest first.
+
+        source is "memory", "snowflake", or "stale" when Snowflake couldn't
+        be read and the page came from memory regardless.
+        """
+        if FEED_CONFIG["serve_from_memory"]:
+            if not self._resync():
+                return self._from_memory(limit, before, since, partial=True), "stale"
+            hit = self._from_memory(limit, before, since)
+            if hit is not None:
+                return hit, "memory"
+        return query_feed(self.table, limit, before, since), "snowflake"
+
+feeds = {table: RecentEvents(table, **FEED_CONFIG) for table in FEED_COLUMNS}
+
+def get_recent_violations(limit=50, before=None, since=None):
+    return [row for _, row in feeds["JAYWALKING_VIOLATIONS"].read(limit, before, since)[0]]
+
+def get_recent_crossings(limit=100, before=None, since=None):
+    return [row for _, row in feeds["CROSSING_LOGS"].read(limit, before, since)[0]]
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LIVE EVENTS  (server-sent event fan-out for the dashboard)
+# ─────────────────────────────────────────────────────────────────────────────
+EVENTS_CONFIG = {
+    "history":       1000,   # newest events kept for Last-Event-ID resume
+    "max_streams":   64,     # open /api/events/stream connections per process
+    "heartbeat":     15,     # seconds of silence before a keep-alive comment
+    "retry_ms":      3000,   # reconnect delay suggested to EventSource
+    "coalesce_ms":   50,     # after a send, wait this long so bursts go out as one write
+    "poll_interval": 5,      # seconds between Snowflake polls when following the warehouse
+    "poll_batch":    500,    # rows per table per poll
+    "unit_location": "Hen-Tersection Unit",  # location of crossings (CROSSING_LOGS has none)
+}
+
+EVENT_NAMES = {"CROSSING_LOGS": "crossing", "JAYWALKING_VIOLATIONS": "violation"}
+
+class EventHub:
+    """Fans every accepted crossing / violation out to the open event streams.
+
+    Each event is JSON-encoded once into its SSE frame and appended to one
+    ring shared by all streams. A stream only remembers the last sequence
+    number it sent and sleeps on a condition variable, so 50 dashboards
+    cost one encode per row and nothing is queued per client. Under load a
+    stream wakes at most once per coalesce_ms and sends everything new in
+    one write. Event ids are ``<epoch>-<seq>``; a Last-Event-ID from another
+    process, or older than the ring, gets ``resync`` so the client reloads
+    over REST.
+    """
+
+    _START_KEY = ("1970-01-01 00:00:00.000", "")
+
+    def __init__(self, history, max_streams, heartbeat, retry_ms, coalesce_ms, poll_interval,
+                 poll_batch, unit_location):
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+        self.coalesce = coalesce_ms / 1000
+        self.poll_interval = poll_interval
+        self.poll_batch = poll_batch
+        self.unit_location = unit_location
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.following = False
+        self._ring = deque(maxlen=history)   # (seq, location, frame)
+        self._seq = 0
+        self._streams = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._follower = None
+        self._stats = {"published": 0, "opened": 0, "resumed": 0, "resyncs": 0}
+
+    def _frame(self, seq, event, data):
+        return f"id: {self.epoch}-{seq}\nevent: {event}\ndata: {data}\n\n".encode()
+
+    # -- publishing -----------------------------------------------------------
+    def publish(self, table, rows):
+        """Called by write_rows() with every accepted batch."""
+        if not self.following:
+            self._append(table, [feed_row(table, row) for row in rows])
+
+    def _append(self, table, public_rows):
+        event = EVENT_NAMES[table]
+        encoded = [(row.get("LOCATION") or self.unit_location, json.dumps(row, default=_json_default))
+                   for row in public_rows]
+        with self._cond:
+            for location, data in encoded:
+                self._seq += 1
+                self._ring.append((self._seq, location, self._frame(self._seq, event, data)))
+            self._stats["published"] += len(encoded)
+            self._cond.notify_all()
+
+    def follow_warehouse(self):
+        """Publish what Snowflake has instead of what this process wrote.
+
+        With several worker processes each one only sees its own share of
+        the ingest, so each polls the tables instead: one query per table
+        per poll_interval while a stream is open, however many are.
+        """
+        self.following = True
+
+    def _start_follower(self):
+        with self._cond:
+            if not self.following or (self._follower and self._follower.is_alive()):
+                return
+            self._follower = threading.Thread(target=self._follow, name="event-follower", daemon=True)
+            self._follower.start()
+
+    def _follow(self):
+        cursors = {}
+        while not self._stop.wait(self.poll_interval):
+            if not self._streams or not warehouse_ready.is_set():
+                cursors.clear()     # don't replay what arrived while nobody watched
+                continue
+            for table in EVENT_NAMES:
+                try:
+                    if table not in cursors:
+                        latest = query_feed(table, 1)
+                        cursors[table] = latest[0][0] if latest else self._START_KEY
+                        continue
+                    rows = query_feed(table, self.poll_batch, since=cursors[table])
+                except Exception as e:
+                    count_error("events", e)
+                    print(f"[events]    warehouse poll failed: {e}")
+                    continue
+                if rows:
+                    cursors[table] = rows[0][0]
+                    self._append(table, [row for _, row in reversed(rows)])
+
+    # -- streaming ------------------------------------------------------------
+    def _resume_point(self, last_event_id):
+        """Sequence to continue after, and whether the client must resync."""
+        if not last_event_id:
+            return self._seq, False
+        epoch, _, seq = last_event_id.partition("-")
+        oldest = self._ring[0][0] if self._ring else self._seq + 1
+        if epoch != self.epoch or not seq.isdigit() or not oldest - 1 <= int(seq) <= self._seq:
+            self._stats["resyncs"] += 1
+            return self._seq, True
+        self._stats["resumed"] += 1
+        return int(seq), False
+
+    def stream(self, last_event_id=None, locations=None):
+        """SSE bytes for one client until it disconnects or close() is called,
+        or None when max_streams are already open.
+
+        The limit is checked and the stream counted under one lock, so
+        concurrent connects can't overshoot it. The slot is given back when
+        the response is closed, even if its body never started. `locations`
+        (a set, None = all) filters on the violation's location; crossings
+        count as `unit_location`.
+        """
+        with self._cond:
+            if self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+            self._stats["opened"] += 1
+            last, resync = self._resume_point(last_event_id)
+        self._start_follower()
+        return _EventStream(self._frames(last, resync, locations), self._release)
+
+    def _release(self):
+        with self._cond:
+            self._streams -= 1
+
+    def _frames(self, last, resync, locations):
+        hello = json.dumps({"resync": resync, "locations": sorted(locations) if locations else None})
+        yield f"retry: {self.retry_ms}\n".encode() + self._frame(last, "hello", hello)
+        sent_at = time.monotonic()
+        while True:
+            with self._cond:
+                if self._seq == last and not self._closed:
+                    self._cond.wait(self.heartbeat)
+                if self._closed:
+                    return
+                if self._seq == last:
+                    batch = []
+                elif self._ring[0][0] > last + 1:
+                    # The client read too slowly and the ring moved past it.
+                    self._stats["resyncs"] += 1
+                    last, batch = self._seq, None
+                else:
+                    batch = list(itertools.islice(self._ring, last + 1 - self._ring[0][0], None))
+                    last = batch[-1][0]
+            if batch is None:
+                chunk = self._frame(last, "resync", json.dumps({"resync": True}))
+            else:
+                chunk = b"".join(frame for _, location, frame in batch
+                                 if locations is None or location in locations)
+            if not chunk and time.monotonic() - sent_at >= self.heartbeat:
+                chunk = b": ping\n\n"
+            if chunk:
+                yield chunk
+                sent_at = time.monotonic()
+                time.sleep(self.coalesce)
+
+    def close(self):
+        """End every open stream (clients reconnect elsewhere) and stop polling."""
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, open_streams=self._streams, max_streams=self.max_streams,
+                        last_event_id=f"{self.epoch}-{self._seq}", history=len(self._ring),
+                        source="warehouse" if self.following else "local")
+
+class _EventStream:
+    """Response body for one event stream; closing it frees the hub slot."""
+
+    def __init__(self, frames, release):
+        self._frames = frames
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._frames)
+
+    def close(self):
+        self._frames.close()
+        if not self._released:
+            self._released = True
+            self._release()
+
+event_hub = EventHub(**EVENTS_CONFIG)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ROLLUPS  (incrementally maintained hourly aggregates for /api/stats)
+# ─────────────────────────────────────────────────────────────────────────────
+STATS_CONFIG = {
+    "retention_days":      14,
+    "checkpoint_path":     os.path.join(os.path.dirname(os.path.abspath(__file__)), "hen_stats.json"),
+    "checkpoint_interval": 60,     # seconds
+    "reconcile_hours":     24,     # recent hours re-read from Snowflake...
+    "reconcile_interval":  300,    # ...this often (seconds), to fold in other writers
+}
+
+def _hour_of(ts):
+    """Epoch hour (UTC) of a 'YYYY-MM-DD HH:MM:SS[.fff]' timestamp string."""
+    dt = datetime.strptime(ts[:13], "%Y-%m-%d %H").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp()) // 3600
+
+def _hour_label(hour):
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%d %H:00")
+
+def _empty_bucket():
+    return {
+        "crossings": 0, "duration_sum": 0.0, "duration_count": 0, "extended": 0,
+        "persons_total": 0, "by_pedestrian_type": {},
+        "violations": 0, "by_severity": {}, "by_location": {},
+    }
+
+def _merge_bucket(into, other):
+    for k, v in other.items():
+        if isinstance(v, dict):
+            for name, n in v.items():
+                into[k][name] = into[k].get(name, 0) + n
+        else:
+            into[k] += v
+    return into
+
+def _finish_bucket(b):
+    """Public view of a bucket: raw sums replaced by averages / rates."""
+    out = {k: v for k, v in b.items() if k not in ("duration_sum", "duration_count", "extended")}
+    out["avg_duration_seconds"] = round(b["duration_sum"] / b["duration_count"], 2) if b["duration_count"] else None
+    out["extension_rate"] = round(b["extended"] / b["crossings"], 4) if b["crossings"] else None
+    return out
+
+class Rollups:
+    """Hourly crossing / violation aggregates updated on every accepted row.
+
+    `_segments` lists the hour ranges ``[start, end)`` (end None = still
+    open) that memory can answer. The hour the process starts in is only
+    partly seen, so coverage begins at the next hour. A clean shutdown
+    keeps the open segment going across a restart. After a crash, the
+    hours since the last checkpoint are dropped from coverage.
+
+    Other units writing to the same warehouse never pass through
+    `record`, so every `reconcile_interval` the last `reconcile_hours`
+    are re-read from Snowflake and replace the in-memory buckets (which
+    also covers those hours again after a crash). Between reconciles,
+    rows accepted here are added and rows the spool dead-letters are
+    taken back out.
+    """
+
+    def __init__(self, retention_days, checkpoint_path, checkpoint_interval,
+                 reconcile_hours, reconcile_interval):
+        self.retention_hours = retention_days * 24
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.reconcile_hours = reconcile_hours
+        self.reconcile_interval = reconcile_interval
+        self._buckets = {}          # epoch hour -> bucket
+        self._segments = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reconciled_at = 0.0
+        self.enabled = True
+        self._load()
+
+    def disable(self):
+        """Stop maintaining rollups; every hour is then read from Snowflake.
+
+        Used when several worker processes each see only part of the ingest.
+        """
+        with self._lock:
+            self.enabled = False
+            self._buckets, self._segments = {}, []
+
+    # -- checkpointing --------------------------------------------------------
+    def _load(self):
+        now_hour = int(time.time()) // 3600
+        try:
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+            self._buckets = {int(h): b for h, b in data["buckets"].items()}
+            self._segments = data["segments"]
+            if not data.get("clean") and self._segments and self._segments[-1][1] is None:
+                self._segments[-1][1] = data["saved_hour"]
+                self._buckets = {h: b for h, b in self._buckets.items() if h < data["saved_hour"]}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[stats]     ignoring unreadable checkpoint: {e}")
+            self._buckets, self._segments = {}, []
+        if not self._segments or self._segments[-1][1] is not None:
+            self._segments.append([now_hour + 1, None])
+
+    def checkpoint(self, clean=False):
+        if not self.enabled:
+            return
+        now_hour = int(time.time()) // 3600
+        with self._lock:
+            cutoff = now_hour - self.retention_hours
+            self._buckets = {h: b for h, b in self._buckets.items() if h >= cutoff}
+            self._segments = [[max(s, cutoff), e] for s, e in self._segments if e is None or e > cutoff]
+            data = {"buckets": self._buckets, "segments": self._segments,
+                    "saved_hour": now_hour, "clean": clean}
+            tmp = f"{self.checkpoint_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.checkpoint_path)
+
+    def reconcile(self):
+        """Replace the last `reconcile_hours` with Snowflake's aggregates,
+        which include every writer's rows. Returns False if Snowflake
+        couldn't be read (memory is then left as it was).
+        """
+        if not self.enabled:
+            return False
+        now_hour = int(time.time()) // 3600
+        start = now_hour - self.reconcile_hours
+        try:
+            fetched = query_hourly_stats(start, now_hour + 1)
+        except Exception as e:
+            print(f"[stats]     reconcile failed: {e}")
+            return False
+        with self._lock:
+            for h in range(start, now_hour + 1):
+                if h in fetched:
+                    self._buckets[h] = fetched[h]
+                else:
+                    self._buckets.pop(h, None)
+            # Everything from `start` on is now known; fold overlapping segments into one.
+            keep = [[s, e] for s, e in self._segments if e is not None and e < start]
+            start = min([start] + [s for s, e in self._segments if e is None or e >= start])
+            self._segments = keep + [[start, None]]
+            self._reconciled_at = time.time()
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.checkpoint_interval)
+            if warehouse_ready.is_set() and time.time() - self._reconciled_at >= self.reconcile_interval:
+                self.reconcile()
+            try:
+                self.checkpoint()
+            except OSError as e:
+                print(f"[stats]     checkpoint failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stats-checkpoint", daemon=True)
+            self._thread.start()
+
+    # -- updates --------------------------------------------------------------
+    def record(self, table, rows, sign=1):
+        """Add accepted rows to their hours (``sign=-1`` takes them back out)."""
+        if not self.enabled:
+            return
+        self.start()
+        with self._lock:
+            for row in rows:
+                try:
+                    hour = _hour_of(row["timestamp"])
+                except (TypeError, ValueError):
+                    continue        # no usable timestamp: never counted either way
+                b = self._buckets.setdefault(hour, _empty_bucket())
+                if table == "CROSSING_LOGS":
+                    b["crossings"] += sign
+                    if row.get("duration_seconds") is not None:
+                        b["duration_sum"] += sign * float(row["duration_seconds"])
+                        b["duration_count"] += sign
+                    b["extended"] += sign if row.get("was_light_extended") else 0
+                    b["persons_total"] += sign * int(row.get("persons_count") or 0)
+                    kind = str(row.get("pedestrian_type"))
+                    b["by_pedestrian_type"][kind] = b["by_pedestrian_type"].get(kind, 0) + sign
+                else:
+                    b["violations"] += sign
+                    sev, loc = str(row.get("severity")), str(row.get("location"))
+                    b["by_severity"][sev] = b["by_severity"].get(sev, 0) + sign
+                    b["by_location"][loc] = b["by_location"].get(loc, 0) + sign
+
+    def forget(self, table, rows):
+        """Take back rows that were accepted but will never reach Snowflake."""
+        self.record(table, rows, sign=-1)
+
+    # -- queries --------------------------------------------------------------
+    def covered(self, hour):
+        return any(s <= hour and (e is None or hour < e) for s, e in self._segments)
+
+    def hours(self, start, end):
+        """Hourly buckets for ``[start, end)``: ``({hour: bucket}, uncovered_hours)``."""
+        if self.enabled:
+            self.start()
+        with self._lock:
+            out, missing = {}, []
+            for h in range(start, end):
+                if self.covered(h):
+                    out[h] = json.loads(json.dumps(self._buckets.get(h) or _empty_bucket()))
+                else:
+                    missing.append(h)
+        return out, missing
+
+rollups = Rollups(**STATS_CONFIG)
+atexit.register(lambda: rollups.checkpoint(clean=True))
+
+def query_hourly_stats(start, end):
+    """Hourly buckets for ``[start, end)`` epoch hours, aggregated in Snowflake."""
+    lo = datetime.fromtimestamp(start * 3600, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    hi = datetime.fromtimestamp(end * 3600, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    hour_expr = "DATE_PART(EPOCH_SECOND, DATE_TRUNC('HOUR', timestamp))"
+    crossings_sql = f"""
+        SELECT {hour_expr} AS hour, pedestrian_type, COUNT(*),
+               SUM(duration_seconds), COUNT(duration_seconds),
+               COUNT_IF(was_light_extended), SUM(persons_count)
+        FROM CROSSING_LOGS
+        WHERE timestamp >= %s::TIMESTAMP_NTZ AND timestamp < %s::TIMESTAMP_NTZ
+        GROUP BY 1, 2
+    """
+    violations_sql = f"""
+        SELECT {hour_expr} AS hour, severity, location, COUNT(*)
+        FROM JAYWALKING_VIOLATIONS
+        WHERE timestamp >= %s::TIMESTAMP_NTZ AND timestamp < %s::TIMESTAMP_NTZ
+        GROUP BY 1, 2, 3
+    """
+    buckets = {}
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(crossings_sql, (lo, hi))
+        for epoch, kind, n, dur_sum, dur_n, ext, persons in cur.fetchall():
+            b = buckets.setdefault(int(epoch) // 3600, _empty_bucket())
+            b["crossings"] += n
+            b["duration_sum"] += float(dur_sum or 0)
+            b["duration_count"] += dur_n
+            b["extended"] += ext
+            b["persons_total"] += int(persons or 0)
+            b["by_pedestrian_type"][str(kind)] = b["by_pedestrian_type"].get(str(kind), 0) + n
+        cur.execute(violations_sql, (lo, hi))
+        for epoch, sev, loc, n in cur.fetchall():
+            b = buckets.setdefault(int(epoch) // 3600, _empty_bucket())
+            b["violations"] += n
+            b["by_severity"][str(sev)] = b["by_severity"].get(str(sev), 0) + n
+            b["by_location"][str(loc)] = b["by_location"].get(str(loc), 0) + n
+    return buckets
+
+def get_stats(start, end, bucket="hour"):
+    """Aggregates for ``[start, end)`` epoch hours, grouped per hour or day.
+
+    Hours covered by the in-memory rollups are answered from memory; only
+    the remaining hours are aggregated in Snowflake (in one query pair).
+    """
+    hourly, missing = rollups.hours(start, end)
+    result = {"memory_hours": len(hourly), "snowflake_hours": len(missing), "complete": True}
+    if missing:
+        try:
+            fetched = query_hourly_stats(min(missing), max(missing) + 1)
+            for h in missing:
+                hourly[h] = fetched.get(h) or _empty_bucket()
+        except Exception as e:
+            result["complete"] = False
+            result["error"] = f"Snowflake unavailable for {len(missing)} hours: {e}"
+
+    step = 24 if bucket == "day" else 1
+    grouped, totals = {}, _empty_bucket()
+    for h, b in sorted(hourly.items()):
+        _merge_bucket(grouped.setdefault(h - h % step, _empty_bucket()), b)
+        _merge_bucket(totals, b)
+    result["buckets"] = [dict(start=_hour_label(h), **_finish_bucket(b)) for h, b in sorted(grouped.items())]
+    result["totals"] = _finish_bucket(totals)
+    return result
+
+# ─────────────────────────────────────────────────────────────────────────────
+# STREAMING EXPORT  (CSV / NDJSON / Parquet; Parquet needs: pip install pyarrow)
+# ─────────────────────────────────────────────────────────────────────────────
+EXPORT_CONFIG = {
+    "fetch_size": 2000,     # rows pulled from the result set per fetchmany()
+}
+
+EXPORT_FILTERS = {
+    "CROSSING_LOGS":         ("pedestrian_type",),
+    "JAYWALKING_VIOLATIONS": ("severity", "location", "pedestrian_id"),
+}
+
+EXPORT_FORMATS = {
+    "csv":     ("text/csv", "csv"),
+    "ndjson":  ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+class ExportUnavailable(Exception):
+    """The requested export format needs a package that isn't installed."""
+
+def export_columns(table, include_images=False):
+    cols = [c for c in TABLE_COLUMNS[table] if c not in ("image_data", "image_ref")]
+    if include_images:
+        cols.append("image_base64")
+    return cols
+
+def _export_query(table, filters, t_from=None, t_to=None, include_images=False):
+    select = []
+    for c in export_columns(table):
+        if c == "timestamp":
+            select.append("TO_CHAR(timestamp, 'YYYY-MM-DD HH24:MI:SS.FF3') AS timestamp")
+        else:
+            select.append(c)
+    if include_images:
+        select += ["image_ref", "image_data"]
+    where, params = [], []
+    if t_from is not None:
+        where.append("timestamp >= %s::TIMESTAMP_NTZ")
+        params.append(t_from)
+    if t_to is not None:
+        where.append("timestamp < %s::TIMESTAMP_NTZ")
+        params.append(t_to)
+    for col, value in filters.items():
+        where.append(f"{col} = %s")
+        params.append(value)
+    sql = (f"SELECT {', '.join(select)} FROM {table}"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + f" ORDER BY timestamp, {ID_COLUMNS[table]}")
+    return sql, params
+
+def _image_base64(image_ref, image_data):
+    if image_data:
+        return image_data
+    path = image_store.path(image_ref) if image_ref else None
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+def iter_export_batches(table, filters, t_from=None, t_to=None, include_images=False):
+    """Yield lists of row tuples (in export_columns order) straight off the cursor.
+
+    The connector downloads result chunks lazily as fetchmany() advances, so
+    neither side ever holds more than one batch.
+    """
+    sql, params = _export_query(table, filters, t_from, t_to, include_images)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        while True:
+            batch = cur.fetchmany(EXPORT_CONFIG["fetch_size"])
+            if not batch:
+                return
+            if include_images:
+                batch = [row[:-2] + (_image_base64(row[-2], row[-1]),) for row in batch]
+            yield batch
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def export_csv(columns, batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def export_ndjson(columns, batches):
+    for batch in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+                      for row in batch).encode()
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained after each row group."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+def _parquet_schema(pa, columns):
+    types = {
+        "duration_seconds": pa.float64(), "confidence_pct": pa.float64(),
+        "was_light_extended": pa.bool_(), "persons_count": pa.int64(),
+    }
+    return pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+def export_parquet(columns, batches):
+    """One Parquet row group per fetched batch; bytes are yielded as written."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportUnavailable("Parquet export needs pyarrow: pip install pyarrow") from None
+    schema = _parquet_schema(pa, columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for batch in batches:
+            arrays = [pa.array([row[i] for row in batch], type=schema.field(i).type)
+                      for i in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+EXPORT_WRITERS = {"csv": export_csv, "ndjson": export_ndjson, "parquet": export_parquet}
+
+# ─────────────────────────────────────────────────────────────────────────────
+# THUMBNAILS / DERIVATIVES  (optional: pip install pillow)
+# ─────────────────────────────────────────────────────────────────────────────
+THUMBNAIL_CONFIG = {
+    "root":               os.path.join(os.path.dirname(os.path.abspath(__file__)), "violation_thumbs"),
+    "default_size":       160,               # longest edge, px
+    "min_size":           32,
+    "max_size":           640,
+    "default_quality":    70,                # JPEG quality
+    "memory_cache_bytes": 32 * 1024 ** 2,
+    "disk_cache_bytes":   512 * 1024 ** 2,
+    "pregenerate_sizes":  (),                # e.g. (160,) to render at ingest time
+}
+
+class ThumbnailUnavailable(Exception):
+    """Pillow isn't installed, so derivatives can't be rendered."""
+
+# Checked once (without importing Pillow) so requests can be refused
+# before they touch the warehouse.
+THUMBNAILS_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+class DerivativeCache:
+    """Rendered thumbnails: an in-memory LRU in front of an on-disk LRU.
+
+    Disk entries are plain JPEG files named by source hash, size and
+    quality. Their mtime is bumped on every hit and the oldest files are
+    pruned once the directory grows past disk_cache_bytes.
+    """
+
+    def __init__(self, root, memory_cache_bytes, disk_cache_bytes, **_):
+        self.root = root
+        self.disk_cache_bytes = disk_cache_bytes
+        self._mem = LRUCache(100000, max_bytes=memory_cache_bytes)
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = None     # scanned lazily
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "rendered": 0}
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.jpg")
+
+    def get(self, key):
+        data = self._mem.get(key)
+        if data is not None:
+            self._stats["memory_hits"] += 1
+            return data
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self._stats["misses"] += 1
+            return None
+        self._stats["disk_hits"] += 1
+        self._mem.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self._mem.put(key, data)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._disk_lock:
+            self._stats["rendered"] += 1
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(e[2] for e in self._disk_entries())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_cache_bytes:
+                self._prune()
+
+    def _disk_entries(self):
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, path, st.st_size
+
+    def _prune(self):
+        target = self.disk_cache_bytes * 0.9
+        for _, path, size in sorted(self._disk_entries()):
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        s = dict(self._stats)
+        s["memory"] = self._mem.stats()
+        s["disk_bytes"] = self._disk_bytes
+        return s
+
+derivative_cache = DerivativeCache(**THUMBNAIL_CONFIG)
+
+def thumbnail_key(etag, size, quality):
+    return f"{etag}_{size}_q{quality}"
+
+def render_thumbnail(source, size, quality):
+    """JPEG bytes of `source` (path or bytes) scaled to fit size x size."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ThumbnailUnavailable("Thumbnails need Pillow: pip install pillow") from None
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+        img.draft("RGB", (size, size))     # lets JPEG decode at reduced scale
+        img.thumbnail((size, size))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+def get_thumbnail(violation_id, size, quality):
+    """Return ``(jpeg_bytes, etag)`` for a violation photo, rendering on a miss."""
+    if not THUMBNAILS_AVAILABLE:
+        raise ThumbnailUnavailable("Thumbnails need Pillow: pip install pillow")
+    meta = image_meta_cache.get(violation_id)
+    if meta is NO_IMAGE:
+        return None, None
+    if meta:
+        data = derivative_cache.get(thumbnail_key(meta.etag, size, quality))
+        if data is not None:
+            return data, meta.etag
+    image = get_violation_image(violation_id)
+    if image is None:
+        return None, None
+    key = thumbnail_key(image.etag, size, quality)
+    data = derivative_cache.get(key)
+    if data is None:
+        data = render_thumbnail(image.source, size, quality)
+        derivative_cache.put(key, data)
+    return data, image.etag
+
+_thumbnail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnails")
+
+def pregenerate_thumbnails(image_ref):
+    """Render the configured sizes for a freshly stored image in the background."""
+    sizes = THUMBNAIL_CONFIG["pregenerate_sizes"]
+    if not sizes or not THUMBNAILS_AVAILABLE:
+        return
+
+    def work():
+        path = image_store.path(image_ref)
+        if not path:
+            return
+        etag = image_ref.partition(".")[0]
+        quality = THUMBNAIL_CONFIG["default_quality"]
+        for size in sizes:
+            key = thumbnail_key(etag, size, quality)
+            if derivative_cache.get(key) is None:
+                try:
+                    derivative_cache.put(key, render_thumbnail(path, size, quality))
+                except Exception as e:
+                    print(f"[thumbs]    ERROR - {image_ref} @ {size}px: {e}")
+                    return
+
+    _thumbnail_executor.submit(work)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RECORD PARSING
+# ─────────────────────────────────────────────────────────────────────────────
+BATCH_CONFIG = {
+    "rows_per_insert": 500,        # rows buffered per table before a bulk write
+    "max_records":     50000,      # per request
+    "read_chunk":      64 * 1024,  # bytes read from the request body at a time
+    "max_line_bytes":  16 * 1024 ** 2,  # longest NDJSON line (a record may carry a photo)
+}
+
+def _number(record, field, default, cast):
+    value = record.get(field, default)
+    if value is None:
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number, got {value!r}") from None
+
+def record_kwargs(table, record):
+    """Turn a browser `{table, record}` payload into log_* keyword arguments.
+
+    This is where /api/snowflake and /api/snowflake/batch apply their
+    defaults; raises ValueError for anything that can't be inserted.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+    if table == "CROSSING_LOGS":
+        return {
+            "pedestrian_type":    record.get("pedestrian_type", "normal"),
+            "duration_seconds":   _number(record, "duration_seconds", 0, float),
+            "was_light_extended": record.get("was_light_extended", False),
+            "persons_count":      _number(record, "persons_count", 1, int),
+            "confidence_pct":     _number(record, "confidence_pct", None, float),
+            "notes":              record.get("notes", ""),
+        }
+    if table == "JAYWALKING_VIOLATIONS":
+        return {
+            "severity":      record.get("severity", "WARNING"),
+            "description":   record.get("description", ""),
+            "data_url":      record.get("image_dataurl"),
+            "pedestrian_id": str(record.get("pedestrian_id", "")),
+            "location":      record.get("location", "Hen-Tersection Unit"),
+        }
+    raise ValueError(f"Unknown table: {table}")
+
+def row_from_record(table, record):
+    kwargs = record_kwargs(table, record)
+    if table == "CROSSING_LOGS":
+        return crossing_row(**kwargs)
+    return violation_row(**kwargs)
+
+class _Utf8Reader:
+    """Incrementally decoded text from a byte stream, for the parsers below.
+
+    Each read asks for at least as much as is already buffered, so an
+    element bigger than the buffer doesn't get re-parsed once per chunk.
+    """
+
+    def __init__(self, stream, chunk_size, head=b""):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = self.utf8.decode(head)
+        self.eof = False
+
+    def more(self):
+        chunk = self.stream.read(max(self.chunk_size, len(self.buf)))
+        self.eof = not chunk
+        self.buf += self.utf8.decode(chunk or b"", final=self.eof)
+
+def iter_ndjson(stream, chunk_size=64 * 1024, head=b"", max_line_bytes=16 * 1024 ** 2):
+    """Yield the value on each non-blank NDJSON line, or a ValueError in its
+    place for a line that isn't valid JSON, so a bad line costs one record.
+
+    Only the current line (plus one read chunk) is held in memory; a line
+    longer than max_line_bytes is dropped up to its newline.
+    """
+    buf = bytearray(head)
+    start = scan = 0        # current line starts at `start`; no newline before `scan`
+    line_no, too_long, eof = 0, False, False
+    while True:
+        nl = buf.find(b"\n", scan)
+        if nl < 0:
+            if not eof:
+                del buf[:start]
+                start = 0
+                if len(buf) > max_line_bytes:
+                    too_long = True
+                    buf.clear()
+                scan = len(buf)
+                chunk = stream.read(chunk_size)
+                eof = not chunk
+                buf += chunk
+                continue
+            if start >= len(buf) and not too_long:
+                return
+            nl = len(buf)
+        line, start = bytes(buf[start:nl]).strip(), nl + 1
+        scan = start
+        line_no += 1
+        if too_long:
+            too_long = False
+            yield ValueError(f"line {line_no}: longer than {max_line_bytes} bytes")
+        elif line:
+            try:
+                value = json.loads(line)
+            except ValueError as e:     # includes bad UTF-8
+                value = ValueError(f"line {line_no}: invalid JSON: {e}")
+            yield value
+
+def iter_json_array(stream, chunk_size=64 * 1024, head=b""):
+    """Yield the elements of a top-level JSON array, reading it in chunks.
+
+    Only the current element (plus one read chunk) is ever held in memory.
+    Anything but whitespace after the closing bracket is an error.
+    """
+    decoder = json.JSONDecoder()
+    r = _Utf8Reader(stream, chunk_size, head)
+
+    state = "start"     # start -> first -> (value -> sep)* -> end
+    while True:
+        r.buf = r.buf.lstrip()
+        if not r.buf:
+            if r.eof:
+                if state == "end":
+                    return
+                raise ValueError("unexpected end of JSON array")
+            r.more()
+            continue
+        if state == "end":
+            raise ValueError(f"unexpected data after the JSON array: {r.buf[:20]!r}")
+        if state == "start":
+            if r.buf[0] != "[":
+                raise ValueError("body must be a JSON array or NDJSON")
+            r.buf, state = r.buf[1:], "first"
+            continue
+        if r.buf[0] == "]" and state in ("first", "sep"):
+            r.buf, state = r.buf[1:], "end"
+            continue
+        if state == "sep":
+            if r.buf[0] != ",":
+                raise ValueError(f"expected ',' or ']' in JSON array, got {r.buf[0]!r}")
+            r.buf, state = r.buf[1:], "value"
+            continue
+        try:
+            obj, end = decoder.raw_decode(r.buf)
+        except json.JSONDecodeError as e:
+            if r.eof:
+                raise ValueError(f"invalid JSON array element: {e}") from None
+            r.more()
+            continue
+        if end == len(r.buf) and not r.eof:
+            r.more()    # a bare number may continue in the next chunk
+            continue
+        r.buf, state = r.buf[end:], "sep"
+        yield obj
+
+def iter_batch_items(stream, chunk_size=64 * 1024, max_line_bytes=16 * 1024 ** 2):
+    """Items of a batch body, whatever its Content-Type says.
+
+    The first non-whitespace byte decides: ``[`` is a JSON array, anything
+    else is NDJSON (which also covers a single one-line object). NDJSON
+    yields a ValueError in place of each line that doesn't parse.
+    """
+    head = b""
+    while not head.lstrip():
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        head += chunk
+    if not head.strip():
+        raise ValueError("empty body: expected a JSON array or NDJSON")
+    if head.lstrip()[:1] == b"[":
+        yield from iter_json_array(stream, chunk_size, head)
+    else:
+        yield from iter_ndjson(stream, chunk_size, head, max_line_bytes)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SERVING  (per-route executors and limits, graceful drain)
+# ─────────────────────────────────────────────────────────────────────────────
+SERVE_CONFIG = {
+    "threads":           16,    # request threads per process (prod server)
+    "workers":           1,     # processes; >1 uses gunicorn
+    "queue_wait":        1.0,   # seconds a request waits for its route's slot before 503
+    "drain_timeout":     30,    # seconds to let in-flight requests finish on shutdown
+    "reserved_threads":  4,     # request threads limited routes may never take (health, metrics, ...)
+    # route group -> (max concurrent requests, response deadline in seconds or None).
+    # Each group runs on its own executor of that many threads, so a slow
+    # group never holds up another (slow image reads can't stall ingest).
+    # Writes get no deadline: a 504 for a row that is then written anyway
+    # only invites a retry that duplicates it.
+    "route_limits": {
+        "ingest":   (32, None),
+        "settings": (8, None),
+        "feeds":    (8, 15),
+        "images":   (8, 30),
+        "stats":    (4, 30),
+        "export":   (2, None),  # streams for as long as the download takes
+    },
+}
+
+class RouteBusy(Exception):
+    """A route group is at its concurrency limit."""
+
+class _RouteLimit:
+    def __init__(self, name, max_concurrent, timeout):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.sem = threading.BoundedSemaphore(max_concurrent)
+        # Never needs to queue: a task is only submitted with a slot held.
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent,
+                                           thread_name_prefix=f"route-{name}")
+        self.stats = {"served": 0, "rejected": 0, "timeouts": 0}
+
+route_limits = {name: _RouteLimit(name, *spec) for name, spec in SERVE_CONFIG["route_limits"].items()}
+
+# Request threads limited routes may occupy in total (prod server only).
+_thread_budget = {"sem": None, "size": None}
+
+def budget_request_threads(threads):
+    """Keep SERVE_CONFIG["reserved_threads"] of `threads` away from limited routes.
+
+    The per-group limits add up to more than a server has threads, so
+    without this a burst of slow ingest could take every thread and
+    leave none for /api/health/live.
+    """
+    size = max(1, threads - SERVE_CONFIG["reserved_threads"])
+    _thread_budget.update(sem=threading.BoundedSemaphore(size), size=size)
+
+def _busy(group):
+    return jsonify({"ok": False, "error": f"Too many concurrent {group} requests"}), \
+        503, {"Retry-After": "1"}
+
+def _run_limited(limit, view, args, kwargs):
+    """Executor side of limited(). Returns ``(response, streamed)``.
+
+    The route slot is released when the view has actually finished, or
+    for a streamed response once the client has read it, even if the
+    request thread gave up waiting with a 504 long before.
+    """
+    try:
+        resp = app.make_response(view(*args, **kwargs))
+    except BaseException:
+        limit.sem.release()
+        raise
+    # Passthrough bodies (send_file) are never closed by Werkzeug and
+    # don't touch Snowflake, so only generators keep the slot.
+    if resp.is_streamed and not resp.direct_passthrough:
+        resp.call_on_close(limit.sem.release)
+        return resp, True
+    limit.sem.release()
+    return resp, False
+
+def _close_abandoned(future):
+    """Release a streamed response nobody will read (its request got a 504)."""
+    if not future.cancelled() and future.exception() is None:
+        resp, streamed = future.result()
+        if streamed:
+            resp.close()
+
+def limited(group):
+    """Run a view under its route group's concurrency limit and deadline.
+
+    The view body runs on the group's own executor, so slow Snowflake
+    calls in one group can't take threads another group needs. The
+    group's slot is held until the view finishes, so the limit bounds the
+    real work and not just the waiting. Under the prod server the request
+    threads these routes block are also capped (see budget_request_threads()).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            limit = route_limits[group]
+            budget = _thread_budget["sem"]
+            if budget is not None and not budget.acquire(blocking=False):
+                limit.stats["rejected"] += 1
+                return _busy(group)
+            hold_thread = budget is not None
+            try:
+                with timed_phase("route_queue"):
+                    acquired = limit.sem.acquire(timeout=SERVE_CONFIG["queue_wait"])
+                if not acquired:
+                    limit.stats["rejected"] += 1
+                    return _busy(group)
+                try:
+                    future = limit.executor.submit(copy_current_request_context(_run_limited),
+                                                   limit, view, args, kwargs)
+                except BaseException:
+                    limit.sem.release()
+                    raise
+                try:
+                    resp, streamed = future.result(timeout=limit.timeout)
+                except FuturesTimeout:
+                    limit.stats["timeouts"] += 1
+                    future.add_done_callback(_close_abandoned)
+                    return jsonify({"ok": False, "error": f"{group} request timed out "
+                                                          f"after {limit.timeout}s"}), 504
+                limit.stats["served"] += 1
+                if streamed and hold_thread:
+                    # The request thread stays busy while it writes the body.
+                    resp.call_on_close(budget.release)
+                    hold_thread = False
+                return resp
+            finally:
+                if hold_thread:
+                    budget.release()
+        return wrapper
+    return decorator
+
+_server_state = {"draining": False, "in_flight": 0, "started": time.time()}
+_server_lock = threading.Lock()
+
+@app.before_request
+def _track_request_start():
+    if _server_state["draining"]:
+        return jsonify({"ok": False, "error": "Server is shutting down"}), 503, {"Retry-After": "5"}
+    with _server_lock:
+        _server_state["in_flight"] += 1
+    g.counted = True
+
+def _request_done():
+    with _server_lock:
+        _server_state["in_flight"] -= 1
+
+@app.after_request
+def _track_streamed_response(response):
+    """A streamed body (export, event stream) stays in flight until the
+    server closes it, not just until the view returns its generator.
+    """
+    if g.get("counted") and response.is_streamed and not response.direct_passthrough:
+        g.counted = False
+        response.call_on_close(_request_done)
+    return response
+
+@app.teardown_request
+def _track_request_end(exc):
+    if g.pop("counted", False):
+        _request_done()
+
+def drain(timeout):
+    """Refuse new requests and wait up to `timeout` for in-flight ones."""
+    _server_state["draining"] = True
+    event_hub.close()
+    deadline = time.monotonic() + timeout
+    while _server_state["in_flight"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return _server_state["in_flight"]
+
+def shutdown_background_services():
+    """Flush everything buffered in this process. Safe to call more than once."""
+    event_hub.close()
+    ingest_queue.stop()
+    stage_loader.flush()
+    rollups.checkpoint(clean=True)
+    pool.close_all()
+
+def serving_stats():
+    return {
+        "in_flight": _server_state["in_flight"],
+        "draining": _server_state["draining"],
+        "uptime_seconds": round(time.time() - _server_state["started"], 1),
+        "routes": {name: dict(l.stats, max_concurrent=l.max_concurrent, timeout=l.timeout)
+                   for name, l in route_limits.items()},
+        "limited_threads": _thread_budget["size"],
+        "event_streams": event_hub.stats(),
+    }
+
+def serve_waitress(host, port, threads, drain_timeout):
+    """Multi-threaded production server (pip install waitress).
+
+    The first SIGINT / SIGTERM starts a drain: new requests get 503 while
+    in-flight ones finish, then the server stops. A second signal stops
+    it immediately. Each open event stream parks a thread, so the pool
+    gets EVENTS_CONFIG["max_streams"] threads on top of `threads`.
+    """
+    from waitress import create_server
+    streams = EVENTS_CONFIG["max_streams"]
+    budget_request_threads(threads)
+    server = create_server(app, host=host, port=port, threads=threads + streams)
+    stopping = {"done": False}
+
+    def finish():
+        left = drain(drain_timeout)
+        if left:
+            print(f"[serve]     drain timed out with {left} requests in flight")
+        stopping["done"] = True
+        _thread.interrupt_main()
+
+    def on_signal(signum, frame):
+        if stopping["done"] or _server_state["draining"]:
+            raise KeyboardInterrupt
+        print(f"\n[serve]     signal {signum}: draining (up to {drain_timeout}s)...")
+        threading.Thread(target=finish, name="drain", daemon=True).start()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    print(f"[serve]     waitress on http://{host}:{port} with {threads} threads "
+          f"(+{streams} for event streams)")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+def serve_gunicorn(host, port, workers, threads, drain_timeout, force_schema=False):
+    """Multi-process production server (pip install gunicorn; not on Windows).
+
+    Each worker keeps its own pool and ingest queue. The in-memory feeds
+    and rollups only see one worker's share of the ingest, so they are
+    switched off and those reads go to Snowflake; the event hub polls
+    Snowflake for the same reason. Workers share the spool and stage
+    directory behind file locks, and settings are re-read on every GET.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    FEED_CONFIG["serve_from_memory"] = False
+    rollups.disable()
+    event_hub.follow_warehouse()
+    budget_request_threads(threads)
+    # The spool and stage directory are shared by every worker. A save in
+    # one worker can't invalidate another's settings cache, so always re-read
+    # (the last value still covers warehouse outages).
+    spool.share()
+    settings_cache.ttl_seconds = 0
+    pool.close_all()    # never share sockets across fork()
+
+    def post_worker_init(worker):
+        start_bootstrap(force_schema)
+        # gunicorn's graceful stop waits for open requests, and event
+        # streams never finish on their own.
+        graceful_exit = signal.getsignal(signal.SIGTERM)
+
+        def on_term(signum, frame):
+            event_hub.close()
+            graceful_exit(signum, frame)
+
+        signal.signal(signal.SIGTERM, on_term)
+
+    class _App(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                "bind": f"{host}:{port}", "workers": workers,
+                "threads": threads + EVENTS_CONFIG["max_streams"],
+                "worker_class": "gthread", "graceful_timeout": drain_timeout,
+                "timeout": max(60, drain_timeout),
+                "post_worker_init": post_worker_init,
+                "worker_exit": lambda arbiter, worker: shutdown_background_services(),
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    print(f"[serve]     gunicorn on http://{host}:{port} with {workers} workers x {threads} threads")
+    _App().run()
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FLASK API ROUTES
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _ingest_response(body, status):
+    """200 once the row is in Snowflake, 202 when it is queued or spooled."""
+    if status != "inserted":
+        body[status] = True
+        return jsonify(body), 202
+    return jsonify(body)
+
+
+@app.route("/api/snowflake", methods=["POST"])
+@limited("ingest")
+def api_snowflake():
+    payload = request.get_json(force=True)
+    table   = payload.get("table", "").upper()
+    record  = payload.get("record", {})
+
+    try:
+        kwargs = record_kwargs(table, record)
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+
+    try:
+        if table == "CROSSING_LOGS":
+            event_id, status = log_crossing(**kwargs)
+            return _ingest_response({"ok": True, "event_id": event_id}, status)
+        else:
+            violation_id, status = log_jaywalking_violation_from_dataurl(**kwargs)
+            return _ingest_response({"ok": True, "violation_id": violation_id}, status)
+
+    except InvalidImage as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+
+    except IngestQueueFull as exc:
+        print(f"[api_snowflake] BUSY: {exc}")
+        return jsonify({"ok": False, "error": str(exc)}), 503, {"Retry-After": "1"}
+
+    except Exception as exc:
+        print(f"[api_snowflake] ERROR: {exc}")
+        return jsonify({"ok": False, "error": str(exc)}), 500
+
+
+@app.route("/api/snowflake/batch", methods=["POST"])
+@limited("ingest")
+def api_snowflake_batch():
+    """Bulk ingest: a JSON array or NDJSON stream of `{table, record}` items
+    (told apart by the body, not the Content-Type).
+
+    Records are parsed as the body streams in and written per table in
+    chunks of BATCH_CONFIG["rows_per_insert"]. The response lists an id or
+    an error for every record, in request order.
+    """
+    items = iter_batch_items(request.stream, BATCH_CONFIG["read_chunk"],
+                             BATCH_CONFIG["max_line_bytes"])
+
+    results = []
+    pending = {table: [] for table in TABLE_COLUMNS}   # table -> [(index, row)]
+    counts = {"accepted": 0, "failed": 0, "inserted": 0, "queued": 0, "spooled": 0, "staged": 0}
+
+    def flush(table):
+        chunk = pending[table]
+        if not chunk:
+            return
+        pending[table] = []
+        try:
+            status = write_rows(table, [row for _, row in chunk])
+            counts["accepted"] += len(chunk)
+            counts[status] += len(chunk)
+        except Exception as exc:
+            counts["failed"] += len(chunk)
+            for index, _ in chunk:
+                results[index] = {"index": index, "ok": False, "error": str(exc)}
+
+    parse_error = None
+    try:
+        for index, item in enumerate(items):
+            if index >= BATCH_CONFIG["max_records"]:
+                parse_error = f"More than {BATCH_CONFIG['max_records']} records in one batch"
+                break
+            try:
+                if isinstance(item, ValueError):
+                    raise item      # an NDJSON line that didn't parse
+                if not isinstance(item, dict):
+                    raise ValueError("each item must be a {table, record} object")
+                table = str(item.get("table", "")).upper()
+                row = row_from_record(table, item.get("record", {}))
+            except ValueError as exc:
+                results.append({"index": index, "ok": False, "error": str(exc)})
+                counts["failed"] += 1
+                continue
+            results.append({"index": index, "ok": True, "id": row[ID_COLUMNS[table]]})
+            pending[table].append((index, row))
+            if len(pending[table]) >= BATCH_CONFIG["rows_per_insert"]:
+                flush(table)
+    except ValueError as exc:
+        parse_error = str(exc)
+
+    for table in pending:
+        flush(table)
+
+    print(f"[batch]     {counts['accepted']} accepted, {counts['failed']} failed"
+          + (f" - stopped: {parse_error}" if parse_error else ""))
+    body = {"ok": parse_error is None and counts["failed"] == 0,
+            "accepted": counts["accepted"], "failed": counts["failed"],
+            "queued": counts["queued"], "spooled": counts["spooled"], "staged": counts["staged"],
+            "results": results}
+    if parse_error:
+        body["error"] = parse_error
+        return jsonify(body), 400
+    return jsonify(body)
+
+
+@app.route("/api/violations", methods=["POST"])
+@limited("ingest")
+def api_upload_violation():
+    """Violation with a binary photo, without base64 or JSON in the way.
+
+    Either multipart/form-data with an ``image`` file part plus severity /
+    description / pedestrian_id / location fields, or a raw image body
+    (any Content-Type) with those fields in the query string. The photo is
+    streamed into the image store; its type comes from its bytes.
+    """
+    max_bytes = UPLOAD_CONFIG["max_bytes"]
+    if (request.content_length or 0) > max_bytes + UPLOAD_CONFIG["max_form_bytes"]:
+        return jsonify({"ok": False, "error": f"Upload is larger than {max_bytes} bytes"}), 413
+
+    try:
+        if request.mimetype == "multipart/form-data":
+            boundary = request.mimetype_params.get("boundary")
+            if not boundary:
+                raise ValueError("multipart/form-data body without a boundary")
+            with timed_phase("upload"):
+                fields, upload, image_ref = read_multipart_upload(request.stream, boundary, max_bytes)
+            kwargs = record_kwargs("JAYWALKING_VIOLATIONS", fields)
+        else:
+            kwargs = record_kwargs("JAYWALKING_VIOLATIONS", request.args.to_dict())
+            with timed_phase("upload"):
+                upload, image_ref = store_image_stream(request.stream, max_bytes)
+    except UploadTooLarge as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 413
+    except UnsupportedImage as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 415
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+
+    kwargs["data_url"] = None
+    try:
+        violation_id, status = log_jaywalking_violation_from_dataurl(image_ref=image_ref, **kwargs)
+    except IngestQueueFull as exc:
+        print(f"[api_upload] BUSY: {exc}")
+        return jsonify({"ok": False, "error": str(exc)}), 503, {"Retry-After": "1"}
+    except Exception as exc:
+        print(f"[api_upload] ERROR: {exc}")
+        return jsonify({"ok": False, "error": str(exc)}), 500
+
+    body = {"ok": True, "violation_id": violation_id}
+    if upload is not None:
+        body["image"] = {"bytes": upload.size, "mimetype": upload.mimetype}
+    return _ingest_response(body, status)
+
+
+@app.route("/api/settings", methods=["GET"])
+@limited("settings")
+def api_get_settings():
+    """Return persisted app settings (cached; honours If-None-Match)."""
+    key = request.args.get("key", "app_settings")
+    try:
+        data, etag, stale = settings_cache.get(key, load_settings)
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
+    if etag in request.if_none_match:
+        resp = app.response_class(status=304)
+    else:
+        body = {"ok": True, "settings": data}
+        if stale:
+            body["stale"] = True
+        resp = jsonify(body)
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@app.route("/api/settings", methods=["POST"])
+@limited("settings")
+def api_save_settings():
+    """Persist app settings to Snowflake."""
+    payload = request.get_json(force=True)
+    key     = payload.get("key", "app_settings")
+    data    = payload.get("settings", {})
+    try:
+        etag = save_settings(data, key)
+        resp = jsonify({"ok": True})
+        resp.set_etag(etag)
+        return resp
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
+
+
+@app.route("/api/settings/cache", methods=["GET"])
+def api_settings_cache():
+    """Settings cache hit / miss / stale-served counters."""
+    return jsonify({"ok": True, "cache": settings_cache.stats()})
+
+
+def _feed_response(table, default_limit):
+    """Shared body of /api/violations and /api/crossings.
+
+    The body stays a plain newest-first list. Cursors ride in headers:
+    pass X-Next-Cursor back as ?before= for the next older page, or
+    X-Latest-Cursor as ?since= to fetch only what is new.
+    """
+    try:
+        limit = max(1, int(request.args.get("limit", default_limit)))
+        before = request.args.get("before")
+        since = request.args.get("since")
+        before = decode_cursor(before) if before else None
+        since = decode_cursor(since) if since else None
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+    try:
+        rows, source = feeds[table].read(limit, before, since)
+    except Exception as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 500
+    resp = jsonify([row for _, row in rows])
+    resp.headers["X-Feed-Source"] = source
+    if rows:
+        resp.headers["X-Next-Cursor"] = encode_cursor(rows[-1][0])
+        resp.headers["X-Latest-Cursor"] = encode_cursor(rows[0][0])
+    elif since:
+        resp.headers["X-Latest-Cursor"] = encode_cursor(since)
+    return resp
+
+
+def _parse_stats_time(value):
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time {value!r} (use YYYY-MM-DD[ HH:MM[:SS]], UTC)")
+
+
+@app.route("/api/stats", methods=["GET"])
+@limited("stats")
+def api_stats():
+    """Time-bucketed crossing / violation aggregates.
+
+    ?from=&to= (UTC, default the last 24 hours) &bucket=hour|day
+    """
+    bucket = request.args.get("bucket", "hour")
+    if bucket not in ("hour", "day"):
+        return jsonify({"ok": False, "error": "bucket must be 'hour' or 'day'"}), 400
+    now = time.time()
+    try:
+        t_from = _parse_stats_time(request.args["from"]) if "from" in request.args else now - 86400
+        t_to = _parse_stats_time(request.args["to"]) if "to" in request.args else now
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+    start, end = int(t_from) // 3600, -(-int(t_to) // 3600)
+    if end <= start:
+        return jsonify({"ok": False, "error": "'to' must be after 'from'"}), 400
+    if end - start > 24 * 366:
+        return jsonify({"ok": False, "error": "range is limited to one year"}), 400
+    stats = get_stats(start, end, bucket)
+    return jsonify({"ok": True, "bucket": bucket, "from": _hour_label(start),
+                    "to": _hour_label(end), **stats})
+
+
+EXPORT_TABLES = {"crossings": "CROSSING_LOGS", "violations": "JAYWALKING_VIOLATIONS"}
+
+
+@app.route("/api/export", methods=["GET"])
+@limited("export")
+def api_export():
+    """Stream a table as CSV / NDJSON / Parquet without buffering the result.
+
+    ?table=crossings|violations &format=csv|ndjson|parquet &from=&to= (UTC)
+    plus column filters (pedestrian_type / severity, location, pedestrian_id).
+    Violation photos are only included with &include_images=1.
+    """
+    args = request.args
+    table = EXPORT_TABLES.get(args.get("table", "crossings").lower())
+    fmt = args.get("format", "csv").lower()
+    if table is None:
+        return jsonify({"ok": False, "error": "table must be 'crossings' or 'violations'"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"ok": False, "error": f"format must be one of {sorted(EXPORT_FORMATS)}"}), 400
+    unknown = set(args) - {"table", "format", "from", "to", "include_images", *EXPORT_FILTERS[table]}
+    if unknown:
+        return jsonify({"ok": False, "error": f"Unknown parameter(s): {', '.join(sorted(unknown))}"}), 400
+    try:
+        t_from, t_to = (
+            datetime.fromtimestamp(_parse_stats_time(args[k]), timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            if k in args else None
+            for k in ("from", "to"))
+    except ValueError as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 400
+    include_images = table == "JAYWALKING_VIOLATIONS" and args.get("include_images") in ("1", "true")
+    filters = {c: args[c] for c in EXPORT_FILTERS[table] if c in args}
+
+    columns = export_columns(table, include_images)
+    batches = iter_export_batches(table, filters, t_from, t_to, include_images)
+    body = EXPORT_WRITERS[fmt](columns, batches)
     try:
-        return jsonify(get_recent_violations(limit))
+        first = next(body, b"")     # surface connection / missing-package errors as JSON
+    except ExportUnavailable as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 501
     except Exception as exc:
         return jsonify({"ok": False, "error": str(exc)}), 500
 
+    def stream():
+        yield first
+        try:
+            yield from body
+        except Exception as exc:
+            print(f"[export]    ERROR - stream aborted: {exc}")
+            raise
+
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    filename = f"smartcross-{args.get('table', 'crossings').lower()}.{ext}"
+    return app.response_class(stream(), mimetype=mimetype,
+                              headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.route("/api/violations", methods=["GET"])
+@limited("feeds")
+def api_violations():
+    resp = _feed_response("JAYWALKING_VIOLATIONS", default_limit=50)
+    if isinstance(resp, tuple):
+        return resp
+    # Lets the dashboard skip thumbnail <img>s that could only 501.
+    resp.headers["X-Thumbnails"] = "available" if THUMBNAILS_AVAILABLE else "unavailable"
+    return resp
+
+
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+def _cache_forever(resp, etag):
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = IMAGE_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp
+
 
 @app.route("/api/violations/<violation_id>/image", methods=["GET"])
+@limited("images")
 def api_violation_image(violation_id):
+    """Violation photo with ETag / If-None-Match, Range and immutable caching."""
+    cached = image_meta_cache.get(violation_id)
+    if cached is NO_IMAGE:
+        return jsonify({"error": "Image not found"}), 404
+    if cached and cached.etag in request.if_none_match:
+        return _cache_forever(app.response_class(status=304), cached.etag)
     try:
-        image_bytes, filename = get_violation_image(violation_id)
-        if not image_bytes:
+        image = get_violation_image(violation_id)
+        if image is None:
             return jsonify({"error": "Image not found"}), 404
-        return send_file(
-            io.BytesIO(image_bytes),
-            mimetype="image/png",
+        resp = send_file(
+            image.source if isinstance(image.source, str) else io.BytesIO(image.source),
+            mimetype=image.mimetype,
             as_attachment=True,
-            download_name=filename,
+            download_name=image.filename,
+            conditional=True,
+            etag=image.etag,
+            max_age=IMAGE_MAX_AGE,
         )
+        return _cache_forever(resp, image.etag)
+    except HTTPException:
+        raise       # e.g. 416 for a Range past the end of the photo
     except Exception as exc:
         return jsonify({"ok": False, "error": str(exc)}), 500
 
 
-@app.route("/api/crossings", methods=["GET"])
-def api_crossings():
-    limit = int(request.args.get("limit", 100))
+@app.route("/api/violations/<violation_id>/thumbnail", methods=["GET"])
+@limited("images")
+def api_violation_thumbnail(violation_id):
+    """Scaled JPEG preview of a violation photo: ?size=<px>&quality=<1-95>."""
+    if not THUMBNAILS_AVAILABLE:
+        return jsonify({"ok": False, "error": "Thumbnails need Pillow: pip install pillow"}), 501
+    cfg = THUMBNAIL_CONFIG
+    try:
+        size = int(request.args.get("size", cfg["default_size"]))
+        quality = int(request.args.get("quality", cfg["default_quality"]))
+    except ValueError:
+        return jsonify({"ok": False, "error": "size and quality must be integers"}), 400
+    size = max(cfg["min_size"], min(cfg["max_size"], size))
+    quality = max(1, min(95, quality))
+
+    cached = image_meta_cache.get(violation_id)
+    if cached is NO_IMAGE:
+        return jsonify({"error": "Image not found"}), 404
+    if cached:
+        etag = f"{cached.etag}-{size}-q{quality}"
+        if etag in request.if_none_match:
+            return _cache_forever(app.response_class(status=304), etag)
     try:
-        return jsonify(get_recent_crossings(limit))
+        data, source_etag = get_thumbnail(violation_id, size, quality)
+        if data is None:
+            return jsonify({"error": "Image not found"}), 404
+        resp = app.response_class(data, mimetype="image/jpeg")
+        return _cache_forever(resp, f"{source_etag}-{size}-q{quality}")
+    except ThumbnailUnavailable as exc:
+        return jsonify({"ok": False, "error": str(exc)}), 501
     except Exception as exc:
         return jsonify({"ok": False, "error": str(exc)}), 500
 
 
+@app.route("/api/crossings", methods=["GET"])
+@limited("feeds")
+def api_crossings():
+    return _feed_response("CROSSING_LOGS", default_limit=100)
+
+
+@app.route("/api/events/stream", methods=["GET"])
+def api_event_stream():
+    """Server-sent events: one per accepted crossing / violation.
+
+    Not under limited(): the stream never touches Snowflake and would hold
+    a route slot for as long as the dashboard stays open. ?location= (may
+    repeat) narrows it; EventSource resumes with the Last-Event-ID header,
+    and ?last_event_id= does the same for a fresh connection.
+    """
+    locations = set(request.args.getlist("location")) or None
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    stream = event_hub.stream(last_event_id, locations)
+    if stream is None:
+        return jsonify({"ok": False, "error": "Too many open event streams"}), \
+            503, {"Retry-After": "10"}
+    resp = app.response_class(stream, mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"    # don't let a reverse proxy hold events back
+    return resp
+
+
 @app.route("/api/health", methods=["GET"])
 def api_health():
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT CURRENT_USER(), CURRENT_ACCOUNT(), CURRENT_TIMESTAMP()")
-        row = cur.fetchone()
-        conn.close()
-        return jsonify({"ok": True, "status": "Snowflake connected",
-                        "user": row[0], "account": row[1], "time": str(row[2])})
-    except Exception as exc:
-        return jsonify({"ok": False, "status": f"Snowflake error: {exc}"}), 500
+    """Warehouse status from the background probe (same shape as before)."""
+    snap = health_prober.snapshot(wait=health_prober.first_probe_wait)
+    if snap is None:
+        return jsonify({"ok": False, "status": "Snowflake status not known yet"}), 503
+    if not snap["ok"]:
+        return jsonify({"ok": False, "status": f"Snowflake error: {snap['error']}",
+                        "age_seconds": snap["age_seconds"]}), 500
+    return jsonify({"ok": True, "status": "Snowflake connected",
+                    "user": snap["user"], "account": snap["account"], "time": snap["time"],
+                    "age_seconds": snap["age_seconds"], "latency_ms": snap["latency_ms"],
+                    "pool": pool.stats()})
+
+
+@app.route("/api/health/live", methods=["GET"])
+def api_health_live():
+    """Liveness: the process is up and serving. Never touches Snowflake."""
+    return jsonify({"ok": True, "pid": os.getpid(),
+                    "uptime_seconds": round(time.time() - _server_state["started"], 1),
+                    "draining": _server_state["draining"],
+                    "in_flight": _server_state["in_flight"]})
+
+
+@app.route("/api/health/ready", methods=["GET"])
+def api_health_ready():
+    """Readiness: bootstrap done, cached probe recent and good, not draining."""
+    snap = health_prober.snapshot()
+    ready = (bool(snap and snap["ready"]) and warehouse_ready.is_set()
+             and not _server_state["draining"])
+    body = {"ok": ready, "draining": _server_state["draining"], "probe": snap,
+            "boot": boot_stats(), "spool_pending": spool.has_pending()}
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route("/api/pool", methods=["GET"])
+def api_pool():
+    """Connection pool size, checkout and wait-time statistics."""
+    return jsonify({"ok": True, "pool": pool.stats()})
+
+
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Prometheus text exposition of request, Snowflake, image and error metrics."""
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route("/api/serving", methods=["GET"])
+def api_serving():
+    """In-flight requests and per-route-group limit counters."""
+    return jsonify({"ok": True, "serving": serving_stats()})
+
+
+@app.route("/api/ingest", methods=["GET"])
+def api_ingest():
+    """Write-behind queue and stage loader statistics."""
+    return jsonify({"ok": True, "mode": INGEST_CONFIG["mode"], "queue": ingest_queue.stats(),
+                    "stage": stage_loader.stats()})
+
+
+@app.route("/api/spool", methods=["GET"])
+def api_spool():
+    """Local spool size, oldest row age and replay throughput."""
+    return jsonify({"ok": True, "spool": spool.stats()})
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # ENTRY POINT
 # ─────────────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hen-Tersection Snowflake backend")
+    parser.add_argument("--migrate-images", action="store_true",
+                        help="move base64 image_data rows into the image store, then exit")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="rows per batch for --migrate-images (default 100)")
+    parser.add_argument("--server", choices=["dev", "prod"], default="dev",
+                        help="dev = Flask development server; prod = waitress, or gunicorn with --workers > 1")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--workers", type=int, default=SERVE_CONFIG["workers"],
+                        help="worker processes for --server prod (default %(default)s)")
+    parser.add_argument("--threads", type=int, default=SERVE_CONFIG["threads"],
+                        help="request threads per process for --server prod (default %(default)s)")
+    parser.add_argument("--drain-timeout", type=int, default=SERVE_CONFIG["drain_timeout"],
+                        help="seconds to let in-flight requests finish on shutdown (default %(default)s)")
+    parser.add_argument("--ingest-mode", choices=["direct", "write_behind", "stage"],
+                        default=INGEST_CONFIG["mode"], help="how accepted rows reach Snowflake")
+    parser.add_argument("--setup-schema", action="store_true",
+                        help="run the CREATE/ALTER statements even if the boot state says they're current")
+    args = parser.parse_args()
+
+    INGEST_CONFIG["mode"] = args.ingest_mode
+
     print("=" * 60)
     print("  Hen-Tersection  |  Snowflake Backend")
     print("=" * 60)
 
-    if not test_connection():
-        print("\nCould not connect to Snowflake. Fix the error above and try again.")
-        sys.exit(1)
-
-    print("\nSetting up Snowflake schema...")
-    setup_schema()
+    if args.migrate_images:
+        if not bootstrap_warehouse(force_schema=args.setup_schema, retry=False):
+            print("\nCould not connect to Snowflake. Fix the error above and try again.")
+            sys.exit(1)
+        print("\nMigrating violation images out of Snowflake...")
+        migrate_images(args.batch_size)
+        pool.close_all()
+        sys.exit(0)
 
-    print("\nStarting Flask API server on http://localhost:5050")
+    print(f"\nStarting Flask API server on http://localhost:{args.port}  (ingest mode: {args.ingest_mode})")
     print("")
     print("  POST /api/snowflake              <-- log crossings & violations")
+    print("  POST /api/snowflake/batch        <-- bulk log (JSON array or NDJSON)")
+    print("  POST /api/violations             <-- log a violation with a binary photo")
     print("  GET  /api/violations             <-- list recent violations")
     print("  GET  /api/violations/<id>/image  <-- download a violation photo")
+    print("  GET  /api/violations/<id>/thumbnail <-- scaled preview (?size=&quality=)")
     print("  GET  /api/crossings              <-- list recent crossings")
+    print("  GET  /api/events/stream          <-- live crossings & violations (server-sent events)")
+    print("  GET  /api/stats                  <-- hourly / daily aggregates")
+    print("  GET  /api/export                 <-- stream CSV / NDJSON / Parquet")
     print("  GET  /api/settings               <-- get persisted settings")
     print("  POST /api/settings               <-- save settings to Snowflake")
+    print("  GET  /api/settings/cache         <-- settings cache statistics")
     print("  GET  /api/health                 <-- check Snowflake connection")
+    print("  GET  /api/health/live            <-- liveness (process state only)")
+    print("  GET  /api/health/ready           <-- readiness (bootstrap + cached warehouse probe)")
+    print("  GET  /api/pool                   <-- connection pool statistics")
+    print("  GET  /api/ingest                 <-- write-behind / stage loader statistics")
+    print("  GET  /api/spool                  <-- offline spool statistics")
+    print("  GET  /api/metrics                <-- Prometheus metrics")
+    print("  GET  /api/serving                <-- in-flight requests and route limits")
     print("")
     print("Keep this window open while index.html is running.")
     print("=" * 60 + "\n")
 
-    app.run(host="0.0.0.0", port=5050, debug=False)
+    # The warehouse login and schema check run in the background; until they
+    # finish, accepted rows go to the local spool.
+    if args.server == "dev" or args.workers <= 1:
+        start_bootstrap(force_schema=args.setup_schema)
+
+    try:
+        if args.server == "dev":
+            app.run(host=args.host, port=args.port, debug=False, threaded=True)
+        elif args.workers > 1:
+            serve_gunicorn(args.host, args.port, args.workers, args.threads, args.drain_timeout,
+                           force_schema=args.setup_schema)
+        else:
+            serve_waitress(args.host, args.port, args.threads, args.drain_timeout)
+    finally:
+        shutdown_background_services()
@@ -0,0 +1,399 @@
+"""
+bench.py  —  Hen-tersection load benchmark
+==========================================
+Runs the real Flask routes in Hen-tersection.py against the SQLite-backed
+stand-in in fake_snowflake.py, at a set of concurrency levels, and prints
+machine-readable results (req/s, p50/p95/p99 latency, peak RSS).
+
+No Snowflake account is needed; the fake adds a fixed delay per login and
+per statement so the warehouse round trip still shows up in the numbers.
+
+    python benchmarks/bench.py                                  # defaults
+    python benchmarks/bench.py --concurrency 1,8,32 --query-ms 40 --out bench.json
+    python benchmarks/bench.py --scenarios ingest_image,image --compare old.json
+    python benchmarks/bench.py --transport http                 # through waitress
+
+Everything runs in a scratch directory, so the spool, image store and
+stats checkpoint of a real install are never touched.
+"""
+
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(HERE), "Hen-tersection.py")
+sys.path.insert(0, HERE)
+
+import fake_snowflake   # noqa: E402
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PAYLOADS
+# ─────────────────────────────────────────────────────────────────────────────
+def make_png(kb):
+    """A valid PNG of roughly `kb` kilobytes (incompressible pixel noise)."""
+    def chunk(kind, data):
+        return (len(data).to_bytes(4, "big") + kind + data +
+                zlib.crc32(kind + data).to_bytes(4, "big"))
+    width = 256
+    height = max(1, kb * 1024 // (width * 3))
+    raw = b"".join(b"\x00" + os.urandom(width * 3) for _ in range(height))
+    ihdr = width.to_bytes(4, "big") + height.to_bytes(4, "big") + bytes([8, 2, 0, 0, 0])
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) +
+            chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+def crossing_record():
+    return {"table": "CROSSING_LOGS", "record": {
+        "pedestrian_type": random.choice(["adult", "child", "elderly", "wheelchair"]),
+        "duration_seconds": round(random.uniform(5, 40), 1),
+        "was_light_extended": random.random() < 0.3,
+        "persons_count": random.randint(1, 4),
+        "confidence_pct": round(random.uniform(60, 99), 1),
+        "notes": "bench",
+    }}
+
+def violation_record(data_url=None):
+    record = {"severity": random.choice(["LOW", "MEDIUM", "HIGH"]),
+              "description": "bench violation",
+              "pedestrian_id": str(uuid.uuid4())[:8]}
+    if data_url:
+        record["image_dataurl"] = data_url
+    return {"table": "JAYWALKING_VIOLATIONS", "record": record}
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SCENARIOS  (name -> function(ctx) returning (method, path, body))
+# A body is JSON-encoded, except bytes, which are sent raw as image/png.
+# ─────────────────────────────────────────────────────────────────────────────
+SCENARIOS = {
+    "ingest_crossing":  lambda ctx: ("POST", "/api/snowflake", crossing_record()),
+    "ingest_violation": lambda ctx: ("POST", "/api/snowflake", violation_record()),
+    "ingest_image":     lambda ctx: ("POST", "/api/snowflake", violation_record(ctx["data_url"])),
+    "upload_image":     lambda ctx: ("POST", "/api/violations?severity=HIGH&description=bench",
+                                     ctx["png"]),
+    "violations":       lambda ctx: ("GET", "/api/violations?limit=100", None),
+    "crossings":        lambda ctx: ("GET", "/api/crossings?limit=100", None),
+    "image":            lambda ctx: ("GET", f"/api/violations/{random.choice(ctx['image_ids'])}/image",
+                                     None),
+    "settings_get":     lambda ctx: ("GET", "/api/settings", None),
+    "settings_post":    lambda ctx: ("POST", "/api/settings",
+                                     {"settings": {"threshold": random.randint(1, 100),
+                                                   "mode": "bench"}}),
+}
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TRANSPORTS
+# ─────────────────────────────────────────────────────────────────────────────
+class WsgiTransport:
+    """Calls the app in-process through Flask's test client (no sockets)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        if isinstance(body, bytes):
+            resp = client.open(path, method=method, data=body, content_type="image/png")
+        else:
+            resp = client.open(path, method=method, json=body)
+        resp.get_data()
+        resp.close()
+        return resp.status_code
+
+    def close(self):
+        pass
+
+class HttpTransport:
+    """Serves the app with waitress on a free port and calls it over HTTP."""
+
+    def __init__(self, app, threads):
+        from waitress import create_server
+        self.server = create_server(app, host="127.0.0.1", port=0, threads=threads)
+        self.base = f"http://127.0.0.1:{self.server.effective_port}"
+        threading.Thread(target=self.server.run, name="bench-http", daemon=True).start()
+
+    def request(self, method, path, body):
+        if isinstance(body, bytes):
+            data, content_type = body, "image/png"
+        else:
+            data = json.dumps(body).encode() if body is not None else None
+            content_type = "application/json"
+        req = urllib.request.Request(self.base + path, data=data, method=method,
+                                     headers={"Content-Type": content_type})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code
+
+    def close(self):
+        # The serving thread is a daemon and ends with the process; closing
+        # the socket under its running select() loop only produces noise.
+        pass
+
+# ─────────────────────────────────────────────────────────────────────────────
+# MEASUREMENT
+# ─────────────────────────────────────────────────────────────────────────────
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+class RssSampler:
+    """Tracks the peak resident set size while a scenario runs."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def run_scenario(transport, name, ctx, concurrency, duration, warmup):
+    """Hammer one scenario from `concurrency` threads for `duration` seconds."""
+    make = SCENARIOS[name]
+    latencies, statuses, errors = [], {}, {}
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker():
+        mine, my_status, my_errors = [], {}, {}
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= stop_at:
+                break
+            method, path, body = make(ctx)
+            try:
+                status = transport.request(method, path, body)
+            except Exception as exc:
+                key = type(exc).__name__
+                my_errors[key] = my_errors.get(key, 0) + 1
+                continue
+            t1 = time.perf_counter()
+            if t0 >= start_at:
+                mine.append(t1 - t0)
+                my_status[status] = my_status.get(status, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for k, v in my_status.items():
+                statuses[str(k)] = statuses.get(str(k), 0) + v
+            for k, v in my_errors.items():
+                errors[k] = errors.get(k, 0) + v
+
+    threads = [threading.Thread(target=worker, name=f"bench-{i}") for i in range(concurrency)]
+    with RssSampler() as rss:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "req_per_s": round(len(latencies) / duration, 1),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "status": statuses,
+        "errors": errors,
+        "peak_rss_mb": round(rss.peak, 1),
+    }
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SETUP
+# ─────────────────────────────────────────────────────────────────────────────
+def load_app(args, workdir):
+    """Install the fake connector and import Hen-tersection.py inside `workdir`."""
+    fake = fake_snowflake.install(fake_snowflake.FakeSnowflake(
+        os.path.join(workdir, "warehouse.sqlite3"),
+        connect_ms=args.connect_ms, query_ms=args.query_ms))
+    # The backend keeps its spool, image store, stats checkpoint, stage dir
+    # and boot state next to its own file, so load a copy from the scratch dir.
+    app_copy = shutil.copy(APP_PATH, workdir)
+    os.chdir(workdir)
+    spec = importlib.util.spec_from_file_location("hen", app_copy)
+    hen = importlib.util.module_from_spec(spec)
+    sys.modules["hen"] = hen
+    spec.loader.exec_module(hen)
+
+    hen.INGEST_CONFIG["mode"] = args.ingest_mode
+    hen.METRICS_CONFIG["slow_request_ms"] = None
+    if not args.verbose:
+        hen.print = lambda *a, **k: None    # per-row log lines would dominate the profile
+    if not hen.bootstrap_warehouse(retry=False):
+        sys.exit("fake warehouse bootstrap failed")
+    return hen, fake
+
+def seed(hen, args, data_url):
+    """Pre-load rows so the read scenarios have something to return."""
+    crossings = [hen.row_from_record("CROSSING_LOGS", crossing_record()["record"])
+                 for _ in range(args.seed_rows)]
+    hen.insert_rows("CROSSING_LOGS", crossings)
+    violations = [hen.row_from_record("JAYWALKING_VIOLATIONS",
+                                      violation_record(data_url if i < args.seed_images else None)["record"])
+                  for i in range(args.seed_rows)]
+    hen.insert_rows("JAYWALKING_VIOLATIONS", violations)
+    hen.save_settings({"threshold": 50, "mode": "bench"})
+    return [v["violation_id"] for v in violations[:args.seed_images]]
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    for r in results:
+        old = baseline.get((r["scenario"], r["concurrency"]))
+        if not old:
+            continue
+        r["vs_baseline"] = {
+            key: round((r[key] - old[key]) / old[key] * 100, 1) if old.get(key) else None
+            for key in ("req_per_s", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+        }
+
+def run_all(hen, args, names, levels, ctx):
+    transport = (HttpTransport(hen.app, args.server_threads) if args.transport == "http"
+                 else WsgiTransport(hen.app))
+    results = []
+    try:
+        for name in names:
+            for level in levels:
+                r = run_scenario(transport, name, ctx, level, args.duration, args.warmup)
+                results.append(r)
+                print(f"{name:18s} c={level:<4d} {r['req_per_s']:>9.1f} req/s  "
+                      f"p50={r['p50_ms']}ms  p95={r['p95_ms']}ms  p99={r['p99_ms']}ms  "
+                      f"rss={r['peak_rss_mb']}MB  status={r['status']}", file=sys.stderr)
+    finally:
+        transport.close()
+        hen.shutdown_background_services()
+        hen.rollups.disable()   # checkpointed above; the scratch dir is gone by exit time
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Hen-tersection load benchmark (fake Snowflake)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="comma-separated client thread counts (default %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="measured seconds per scenario and concurrency level")
+    parser.add_argument("--warmup", type=float, default=1.0,
+                        help="unmeasured seconds before each run")
+    parser.add_argument("--query-ms", type=float, default=20.0,
+                        help="injected latency per Snowflake statement")
+    parser.add_argument("--connect-ms", type=float, default=300.0,
+                        help="injected latency per Snowflake login")
+    parser.add_argument("--ingest-mode", choices=["direct", "write_behind", "stage"], default="direct")
+    parser.add_argument("--transport", choices=["wsgi", "http"], default="wsgi",
+                        help="wsgi = in-process test client; http = real sockets via waitress")
+    parser.add_argument("--server-threads", type=int, default=16,
+                        help="waitress threads for --transport http")
+    parser.add_argument("--image-kb", type=int, default=200, help="size of uploaded test images")
+    parser.add_argument("--seed-rows", type=int, default=500)
+    parser.add_argument("--seed-images", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE_JSON",
+                        help="add percentage deltas against an earlier --out file")
+    parser.add_argument("--verbose", action="store_true", help="keep the backend's log lines")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="leave the scratch directory (fake warehouse, spool, images) behind")
+    args = parser.parse_args()
+
+    names = [s for s in args.scenarios.split(",") if s]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    if args.out:
+        args.out = os.path.abspath(args.out)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    random.seed(args.seed)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="hen-bench-")
+    try:
+        hen, fake = load_app(args, workdir)
+        png = make_png(args.image_kb)
+        data_url = "data:image/png;base64," + base64.b64encode(png).decode()
+        ctx = {"png": png, "data_url": data_url, "image_ids": seed(hen, args, data_url)}
+        results = run_all(hen, args, names, levels, ctx)
+    finally:
+        os.chdir(cwd)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.compare:
+        compare(results, args.compare)
+    report = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "transport": args.transport,
+            "ingest_mode": args.ingest_mode,
+            "query_ms": args.query_ms,
+            "connect_ms": args.connect_ms,
+            "duration": args.duration,
+            "image_kb": args.image_kb,
+            "seed_rows": args.seed_rows,
+            "fake_statements": fake.stats["statements"],
+            "fake_connects": fake.stats["connects"],
+            "workdir": workdir if args.keep_workdir else None,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
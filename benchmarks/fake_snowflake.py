@@ -0,0 +1,370 @@
+"""
+fake_snowflake.py  —  SQLite-backed stand-in for snowflake.connector
+=====================================================================
+Just enough of the connector API for Hen-tersection.py to run without a
+Snowflake account: connect(), cursors (plain and DictCursor), execute /
+executemany / fetch*, errors.ProgrammingError, and PUT / COPY INTO for the
+stage loader. The Snowflake SQL the backend sends is rewritten into SQLite
+on the way in.
+
+Every connect and every statement sleeps for a configurable time so the
+numbers look like a remote warehouse rather than a local file.
+
+    import fake_snowflake
+    fake_snowflake.install(FakeSnowflake("/tmp/bench.sqlite3", query_ms=40))
+    # ...then import Hen-tersection.py as usual
+"""
+
+import csv
+import gzip
+import importlib.machinery
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import types
+import uuid
+from datetime import datetime
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ERRORS  (same hierarchy names as snowflake.connector.errors)
+# ─────────────────────────────────────────────────────────────────────────────
+class Error(Exception):
+    def __init__(self, msg=None, errno=None, sqlstate=None):
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+        self.sqlstate = sqlstate
+
+class DatabaseError(Error):
+    pass
+
+class ProgrammingError(DatabaseError):
+    pass
+
+class InterfaceError(Error):
+    pass
+
+class IntegrityError(DatabaseError):
+    pass
+
+class OperationalError(DatabaseError):
+    pass
+
+def _wrap_sqlite_error(exc):
+    """Map to the connector class, errno and sqlstate Snowflake would use."""
+    msg = str(exc)
+    if isinstance(exc, sqlite3.IntegrityError):
+        if "NOT NULL" in msg:
+            return ProgrammingError(msg, errno=100072, sqlstate="22000")
+        return IntegrityError(msg, sqlstate="23000")
+    if isinstance(exc, sqlite3.OperationalError) and "locked" in msg:
+        return OperationalError(msg)
+    if "no such table" in msg:
+        return ProgrammingError(msg, errno=2003, sqlstate="42S02")
+    if "mismatch" in msg:
+        return ProgrammingError(msg, errno=100038, sqlstate="22018")
+    return ProgrammingError(msg, errno=1003, sqlstate="42000")
+
+class DictCursor:
+    """Marker class, passed to conn.cursor() like the real one."""
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SQL TRANSLATION
+# ─────────────────────────────────────────────────────────────────────────────
+_TO_CHAR_FORMATS = [("YYYY", "%Y"), ("MM", "%m"), ("DD", "%d"), ("HH24", "%H"),
+                    ("MI", "%M"), ("SS", "%S")]
+
+def _parse_ts(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("T", " "))
+
+def _to_char(value, fmt):
+    ts = _parse_ts(value)
+    if ts is None:
+        return None
+    frac = re.search(r"\.FF(\d)?", fmt)
+    out = fmt[:frac.start()] if frac else fmt
+    for token, directive in _TO_CHAR_FORMATS:
+        out = out.replace(token, directive)
+    out = ts.strftime(out)
+    if frac:
+        digits = int(frac.group(1) or 9)
+        out += "." + f"{ts.microsecond:06d}000"[:digits]
+    return out
+
+def _date_trunc(unit, value):
+    ts = _parse_ts(value)
+    if ts is None:
+        return None
+    unit = unit.upper()
+    if unit == "HOUR":
+        ts = ts.replace(minute=0, second=0, microsecond=0)
+    elif unit == "DAY":
+        ts = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        raise ValueError(f"DATE_TRUNC unit {unit} not supported by the fake")
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+def _date_part(part, value):
+    ts = _parse_ts(value)
+    if ts is None:
+        return None
+    if part.upper() == "EPOCH_SECOND":
+        return int((ts - datetime(1970, 1, 1)).total_seconds())
+    return getattr(ts, part.lower())
+
+_REWRITES = [
+    (re.compile(r"::\s*\w+"), ""),                                   # casts
+    (re.compile(r"%s"), "?"),                                        # paramstyle
+    (re.compile(r"\bCURRENT_TIMESTAMP\(\)", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bDEFAULT\s+current_timestamp\(\)", re.I), "DEFAULT CURRENT_TIMESTAMP"),
+    (re.compile(r"\bDEFAULT\s+uuid_string\(\)", re.I), ""),
+    (re.compile(r"\bDATE_PART\(\s*(\w+)\s*,", re.I), r"DATE_PART('\1',"),
+    (re.compile(r"\bCOUNT_IF\(([^()]*)\)", re.I), r"SUM(CASE WHEN \1 THEN 1 ELSE 0 END)"),
+]
+
+_USE = re.compile(r"^\s*USE\s", re.I)
+_ALTER_ADD = re.compile(
+    r"^\s*ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) (.+?)\s*$", re.I | re.S)
+_MERGE = re.compile(
+    r"MERGE INTO (\w+) AS target\s+USING \((SELECT .*?)\) AS src\s+"
+    r"ON target\.(\w+) = src\.\w+\s+"
+    r"WHEN MATCHED THEN UPDATE SET (.*?)\s+"
+    r"WHEN NOT MATCHED THEN INSERT \((.*?)\)\s+VALUES \((.*?)\)\s*$", re.I | re.S)
+_PUT = re.compile(r"^\s*PUT 'file://(.+?)' @%(\w+)", re.I)
+_COPY = re.compile(
+    r"^\s*COPY INTO (\w+) \((.*?)\)\s+FROM \(SELECT .*? FROM @%\w+\)\s+FILES = \((.*?)\)", re.I | re.S)
+
+def translate(sql):
+    """Rewrite one Snowflake statement into SQLite.
+
+    Returns ("sql", text) for ordinary statements, or (kind, match) for
+    the ones the fake handles itself ("noop", "alter_add", "put", "copy").
+    """
+    if _USE.match(sql):
+        return "noop", None
+    for kind, pattern in (("alter_add", _ALTER_ADD), ("put", _PUT), ("copy", _COPY)):
+        m = pattern.match(sql)
+        if m:
+            return kind, m
+    m = _MERGE.search(sql)
+    if m:
+        table, using, key, sets, cols, vals = m.groups()
+        sets = re.sub(r"src\.(\w+)", r"excluded.\1", sets)
+        vals = vals.replace("src.", "")
+        sql = (f"INSERT INTO {table} ({cols}) SELECT {vals} FROM ({using}) WHERE true "
+               f"ON CONFLICT({key}) DO UPDATE SET {sets}")
+    for pattern, repl in _REWRITES:
+        sql = pattern.sub(repl, sql)
+    return "sql", sql
+
+sqlite3.register_converter("BOOLEAN", lambda v: v != b"0")
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FAKE WAREHOUSE
+# ─────────────────────────────────────────────────────────────────────────────
+class FakeSnowflake:
+    """One SQLite file standing in for the warehouse, shared by every session."""
+
+    def __init__(self, path, connect_ms=0, query_ms=0, stage_dir=None):
+        self.path = path
+        self.connect_latency = connect_ms / 1000
+        self.query_latency = query_ms / 1000
+        self.stage_dir = stage_dir or path + "-stage"
+        self._lock = threading.Lock()
+        self._loaded = set()        # (table, file) pairs already COPYed
+        self._translations = {}
+        self.stats = {"connects": 0, "statements": 0}
+
+    def translate(self, sql):
+        hit = self._translations.get(sql)
+        if hit is None:
+            hit = self._translations[sql] = translate(sql)
+        return hit
+
+    def open_sqlite(self):
+        # PARSE_DECLTYPES so BOOLEAN columns come back as bool, as they do from Snowflake.
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False,
+                             detect_types=sqlite3.PARSE_DECLTYPES)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.create_function("CURRENT_USER", 0, lambda: "BENCH_USER")
+        db.create_function("CURRENT_ACCOUNT", 0, lambda: "BENCH_ACCOUNT")
+        db.create_function("UUID_STRING", 0, lambda: str(uuid.uuid4()))
+        db.create_function("IFF", 3, lambda cond, a, b: a if cond else b)
+        db.create_function("TO_CHAR", 2, _to_char)
+        db.create_function("DATE_TRUNC", 2, _date_trunc)
+        db.create_function("DATE_PART", 2, _date_part)
+        return db
+
+    def connect(self, **kwargs):
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self.stats["connects"] += 1
+        return Connection(self)
+
+    # -- statements the fake runs itself --------------------------------------
+    def alter_add(self, db, m):
+        table, column, coltype = m.groups()
+        existing = {r[1].lower() for r in db.execute(f"PRAGMA table_info({table})")}
+        if column.lower() not in existing:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {coltype}")
+        return []
+
+    def put(self, m):
+        src, table = m.groups()
+        dest = os.path.join(self.stage_dir, table)
+        os.makedirs(dest, exist_ok=True)
+        shutil.copyfile(src, os.path.join(dest, os.path.basename(src)))
+        size = os.path.getsize(src)
+        return [(os.path.basename(src), os.path.basename(src), size, size,
+                 "GZIP", "GZIP", "UPLOADED", "")]
+
+    def copy(self, db, m):
+        table, cols, files = m.groups()
+        cols = [c.strip() for c in cols.split(",")]
+        insert = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        skip_file = re.search(r"ON_ERROR\s*=\s*SKIP_FILE", m.string, re.I) is not None
+        results = []
+        for name in re.findall(r"'([^']+)'", files):
+            with self._lock:
+                if (table, name) in self._loaded:
+                    continue
+            path = os.path.join(self.stage_dir, table, name)
+            with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+                rows = [[None if v == "\\N" else {"True": 1, "False": 0}.get(v, v) for v in r]
+                        for r in csv.reader(f)]
+            db.execute("BEGIN")
+            try:
+                db.executemany(insert, rows)
+            except sqlite3.Error as exc:
+                db.execute("ROLLBACK")
+                if not skip_file:
+                    raise
+                results.append((name, "LOAD_FAILED", len(rows), 0, 1, 1, str(exc), None, None, None))
+                continue
+            db.execute("COMMIT")
+            with self._lock:
+                self._loaded.add((table, name))
+            os.remove(path)     # PURGE = TRUE
+            results.append((name, "LOADED", len(rows), len(rows), 1, 0, None, None, None, None))
+        return results
+
+def _bind(params):
+    if params is None:
+        return ()
+    return tuple(p.isoformat(" ") if isinstance(p, datetime) else p for p in params)
+
+class Cursor:
+    def __init__(self, conn, as_dict):
+        self._conn = conn
+        self._as_dict = as_dict
+        self._rows = []
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        fake = self._conn.fake
+        time.sleep(fake.query_latency)
+        with fake._lock:
+            fake.stats["statements"] += 1
+        kind, arg = fake.translate(sql)
+        db = self._conn.db
+        try:
+            if kind == "noop":
+                rows, desc = [], None
+            elif kind == "alter_add":
+                rows, desc = fake.alter_add(db, arg), None
+            elif kind == "put":
+                rows, desc = fake.put(arg), None
+            elif kind == "copy":
+                rows, desc = fake.copy(db, arg), None
+            else:
+                cur = db.execute(arg, _bind(params))
+                rows, desc = cur.fetchall(), cur.description
+                self.rowcount = cur.rowcount
+        except sqlite3.Error as exc:
+            raise _wrap_sqlite_error(exc) from exc
+        self.description = desc
+        if self._as_dict and desc:
+            names = [d[0].upper() for d in desc]
+            rows = [dict(zip(names, r)) for r in rows]
+        self._rows = rows
+        return self
+
+    def executemany(self, sql, seq):
+        fake = self._conn.fake
+        time.sleep(fake.query_latency)
+        kind, arg = fake.translate(sql)
+        try:
+            db = self._conn.db
+            db.execute("BEGIN")
+            db.executemany(arg, [_bind(p) for p in seq])
+            db.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if self._conn.db.in_transaction:
+                self._conn.db.execute("ROLLBACK")
+            raise _wrap_sqlite_error(exc) from exc
+        self._rows = []
+        return self
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        out, self._rows = self._rows[:size], self._rows[size:]
+        return out
+
+    def fetchall(self):
+        out, self._rows = self._rows, []
+        return out
+
+    def close(self):
+        self._rows = []
+
+class Connection:
+    def __init__(self, fake):
+        self.fake = fake
+        self.db = fake.open_sqlite()
+        self._closed = False
+
+    def cursor(self, cursor_class=None):
+        return Cursor(self, cursor_class is DictCursor)
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.db.close()
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INSTALL
+# ─────────────────────────────────────────────────────────────────────────────
+def install(fake):
+    """Register `snowflake` / `snowflake.connector` modules backed by `fake`."""
+    pkg = types.ModuleType("snowflake")
+    pkg.__path__ = []
+    pkg.__spec__ = importlib.machinery.ModuleSpec("snowflake", None, is_package=True)
+    connector = types.ModuleType("snowflake.connector")
+    connector.__spec__ = importlib.machinery.ModuleSpec("snowflake.connector", None)
+    errors = types.ModuleType("snowflake.connector.errors")
+    errors.__spec__ = importlib.machinery.ModuleSpec("snowflake.connector.errors", None)
+    for cls in (Error, DatabaseError, ProgrammingError, IntegrityError, OperationalError,
+                InterfaceError):
+        setattr(errors, cls.__name__, cls)
+        setattr(connector, cls.__name__, cls)
+    connector.connect = fake.connect
+    connector.DictCursor = DictCursor
+    connector.errors = errors
+    connector.paramstyle = "pyformat"
+    pkg.connector = connector
+    sys.modules.update({"snowflake": pkg, "snowflake.connector": connector,
+                        "snowflake.connector.errors": errors})
+    return fake
@@ -0,0 +1,54 @@
+"""
+Shared fixtures: Hen-tersection.py loaded once against fake_snowflake.py.
+
+The app is imported from a scratch copy (see benchmarks/bench.py), so its
+spool, stage dir and image store never touch a real install.
+"""
+
+import os
+import sqlite3
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "benchmarks"))
+
+import bench    # noqa: E402
+
+@pytest.fixture(scope="session")
+def loaded(tmp_path_factory):
+    cwd = os.getcwd()
+    args = types.SimpleNamespace(connect_ms=0, query_ms=0, ingest_mode="direct", verbose=False)
+    hen, fake = bench.load_app(args, str(tmp_path_factory.mktemp("app")))
+    os.chdir(cwd)
+    return hen, fake
+
+@pytest.fixture
+def hen(loaded):
+    return loaded[0]
+
+@pytest.fixture
+def fake(loaded):
+    fake = loaded[1]
+    fake.query_latency = 0
+    return fake
+
+@pytest.fixture
+def warehouse(hen, fake):
+    """The fake warehouse's SQLite file, with the event tables emptied."""
+    db = sqlite3.connect(fake.path, timeout=30, isolation_level=None)
+    for table in hen.TABLE_COLUMNS:
+        db.execute(f"DELETE FROM {table}")
+    for feed in hen.feeds.values():
+        feed.__init__(feed.table, **hen.FEED_CONFIG)
+    yield db
+    db.close()
+
+@pytest.fixture
+def image_store(hen, tmp_path, monkeypatch):
+    """An empty image store for this test."""
+    store = hen.FilesystemImageStore(str(tmp_path / "images"))
+    monkeypatch.setattr(hen, "image_store", store)
+    return store
@@ -0,0 +1,42 @@
+"""
+Row builders and polling helpers shared by the test modules.
+"""
+
+import base64
+import os
+import subprocess
+import time
+
+import bench
+
+def crossing(hen, **overrides):
+    row = hen.row_from_record("CROSSING_LOGS", bench.crossing_record()["record"])
+    row.update(overrides)
+    return row
+
+def count(db, table):
+    return db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def dead_pid():
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    return proc.pid
+
+def ingest_body():
+    return {"table": "CROSSING_LOGS", "record": bench.crossing_record()["record"]}
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def data_url(image, mimetype="image/png"):
+    return f"data:{mimetype};base64,{base64.b64encode(image).decode()}"
+
+def violation_body(**record):
+    return {"table": "JAYWALKING_VIOLATIONS",
+            "record": dict(bench.violation_record()["record"], **record)}
+
+def stored_files(store):
+    return sorted(name for _, _, names in os.walk(store.root) for name in names)
@@ -0,0 +1,94 @@
+"""
+Streaming JSON array / NDJSON parsing for /api/snowflake/batch.
+"""
+
+import io
+import json
+
+import pytest
+
+from helpers import ingest_body
+
+def parse_array(hen, body, chunk_size=64 * 1024):
+    return list(hen.iter_json_array(io.BytesIO(body), chunk_size))
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64 * 1024])
+def test_json_array_elements_across_chunks(hen, chunk_size):
+    body = ' [ {"a": [1, 2]}, 12345, "s\\u00e9", null , {"b": {"c": "]"}} ]\n'.encode()
+    assert parse_array(hen, body, chunk_size) == [{"a": [1, 2]}, 12345, "sé", None,
+                                                  {"b": {"c": "]"}}]
+
+def test_json_array_multibyte_split_across_chunks(hen):
+    body = '["café", "\U0001f414"]'.encode()
+    assert parse_array(hen, body, chunk_size=1) == ["café", "\U0001f414"]
+
+def test_json_array_empty(hen):
+    assert parse_array(hen, b"[ ]") == []
+
+@pytest.mark.parametrize("body, message", [
+    (b'[{"a": 1}] {"b": 2}', "after the JSON array"),
+    (b'[1, 2] x', "after the JSON array"),
+    (b'[1 2]', "expected ','"),
+    (b'[1, 2', "unexpected end"),
+    (b'[1, ]', "invalid JSON array element"),
+    (b'{"a": 1}', "JSON array or NDJSON"),
+])
+def test_json_array_rejects_malformed_bodies(hen, body, message):
+    with pytest.raises(ValueError, match=message):
+        parse_array(hen, body, chunk_size=2)
+
+@pytest.mark.parametrize("body, items", [
+    (b'  \n[{"a": 1}, {"a": 2}]', [{"a": 1}, {"a": 2}]),
+    (b'{"a": 1}\n{"a": 2}\n', [{"a": 1}, {"a": 2}]),
+    (b'\n{"a": 1}\r\n\n  {"a": 2}', [{"a": 1}, {"a": 2}]),
+])
+def test_batch_items_sniff_the_body(hen, body, items):
+    assert list(hen.iter_batch_items(io.BytesIO(body), chunk_size=4)) == items
+
+def test_batch_items_empty_body(hen):
+    with pytest.raises(ValueError, match="empty body"):
+        list(hen.iter_batch_items(io.BytesIO(b" \n ")))
+
+def ndjson(hen, body, chunk_size=4, max_line_bytes=1024):
+    """Parsed values, with each per-line error shortened to "error: line N"."""
+    items = hen.iter_ndjson(io.BytesIO(body), chunk_size, max_line_bytes=max_line_bytes)
+    return [f"error: {str(item).split(':')[0]}" if isinstance(item, ValueError) else item
+            for item in items]
+
+def test_ndjson_bad_line_costs_one_record(hen):
+    body = b'{"a": 1}\n{"a": \n[1, 2]\n\xff\xfe\n{"a": 2}\n'
+    assert ndjson(hen, body) == [{"a": 1}, "error: line 2", [1, 2], "error: line 4", {"a": 2}]
+
+def test_ndjson_overlong_line_is_skipped(hen):
+    body = b'{"a": 1}\n' + b'x' * 5000 + b'\n{"a": 2}\n' + b'y' * 5000
+    assert ndjson(hen, body, chunk_size=64, max_line_bytes=100) == [
+        {"a": 1}, "error: line 2", {"a": 2}, "error: line 4"]
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+def test_ndjson_reads_past_a_bad_line_lazily(hen):
+    good = json.dumps({"a": 1}).encode() + b"\n"
+    stream = CountingStream(good + b"{not json\n" + good * 100000)
+    items = hen.iter_ndjson(stream, chunk_size=1024)
+    assert next(items) == {"a": 1}
+    assert isinstance(next(items), ValueError)
+    assert stream.bytes_read <= 2048
+    assert sum(1 for _ in items) == 100000
+
+def test_batch_route_accepts_lines_around_a_bad_one(hen, warehouse):
+    lines = [json.dumps(ingest_body()).encode(), b'{"table": "CROSSING_LOGS", "record": ',
+             json.dumps(ingest_body()).encode()]
+    resp = hen.app.test_client().post("/api/snowflake/batch", data=b"\n".join(lines),
+                                      content_type="application/x-ndjson")
+    assert resp.status_code == 200
+    assert (resp.json["accepted"], resp.json["failed"]) == (2, 1)
+    assert [r["ok"] for r in resp.json["results"]] == [True, False, True]
+    assert resp.json["results"][1]["error"].startswith("line 2: invalid JSON")
@@ -0,0 +1,60 @@
+"""
+Benchmark harness: a short run of every scenario end to end.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench
+
+def run_bench(tmp_path, *extra):
+    out = tmp_path / "bench.json"
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    proc = subprocess.run(
+        [sys.executable, bench.__file__, "--concurrency", "1,2", "--duration", "0.1", "--warmup", "0",
+         "--query-ms", "0", "--connect-ms", "0", "--seed-rows", "10", "--seed-images", "2",
+         "--image-kb", "4", "--out", str(out), *extra],
+        cwd=tmp_path, env=dict(os.environ, TMPDIR=str(scratch)),
+        capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    assert "Traceback" not in proc.stderr
+    assert os.listdir(scratch) == []            # the scratch workdir is removed
+    with open(out) as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("ingest_mode", ["direct", "write_behind", "stage"])
+def test_every_scenario_runs_cleanly(tmp_path, ingest_mode):
+    report = run_bench(tmp_path, "--ingest-mode", ingest_mode)
+    results = report["results"]
+    assert [(r["scenario"], r["concurrency"]) for r in results] == \
+        [(name, level) for name in bench.SCENARIOS for level in (1, 2)]
+    for r in results:
+        assert r["requests"] > 0 and not r["errors"], r
+        assert set(r["status"]) <= {"200", "202"}, r
+        assert r["p50_ms"] <= r["p95_ms"] <= r["p99_ms"] <= r["max_ms"]
+    assert report["meta"]["ingest_mode"] == ingest_mode
+    assert report["meta"]["workdir"] is None
+
+def test_compare_adds_deltas_against_a_baseline(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": [
+        {"scenario": "crossings", "concurrency": 1, "req_per_s": 100.0, "p50_ms": 2.0,
+         "p95_ms": 4.0, "p99_ms": 8.0, "peak_rss_mb": 0}]}))
+    results = [{"scenario": "crossings", "concurrency": 1, "req_per_s": 150.0, "p50_ms": 1.0,
+                "p95_ms": 4.0, "p99_ms": 10.0, "peak_rss_mb": 50.0},
+               {"scenario": "image", "concurrency": 1}]
+    bench.compare(results, str(baseline))
+    assert results[0]["vs_baseline"] == {"req_per_s": 50.0, "p50_ms": -50.0, "p95_ms": 0.0,
+                                         "p99_ms": 25.0, "peak_rss_mb": None}
+    assert "vs_baseline" not in results[1]
+
+def test_percentile_interpolates():
+    assert bench.percentile([], 50) is None
+    assert bench.percentile([1.0], 99) == 1.0
+    assert bench.percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert bench.percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
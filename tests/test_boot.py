@@ -0,0 +1,111 @@
+"""
+Cold start: parallel account probing, the saved account and the schema marker.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+class Login:
+    def __init__(self, account):
+        self.account = account
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def boot_state(hen, tmp_path, monkeypatch):
+    """A fresh boot-state file and an unresolved account."""
+    path = tmp_path / "hen_boot.json"
+    monkeypatch.setitem(hen.BOOT_CONFIG, "state_path", str(path))
+    monkeypatch.setitem(hen.CONFIG, "account", hen.ACCOUNT_FORMATS[0])
+    monkeypatch.setattr(hen, "_account_resolved", False)
+    return path
+
+@pytest.fixture
+def logins(hen, monkeypatch):
+    """Only logins["format"] logs in, after logins["delay"]; every attempt is recorded."""
+    logins = {"format": None, "delay": 0.2, "attempts": []}
+    lock = threading.Lock()
+
+    def connect(account):
+        with lock:
+            logins["attempts"].append(account)
+        time.sleep(logins["delay"])
+        if account != logins["format"]:
+            raise hen.snowflake_connector().errors.DatabaseError(f"login failed for {account}")
+        return Login(account)
+    monkeypatch.setattr(hen, "_connect", connect)
+    return logins
+
+def test_probe_tries_every_format_at_once(hen, boot_state, logins):
+    logins["format"] = hen.ACCOUNT_FORMATS[3]
+    started = time.monotonic()
+    conn = hen.resolve_account()
+    assert time.monotonic() - started < 0.2 * len(hen.ACCOUNT_FORMATS) / 2
+    assert conn.account == hen.ACCOUNT_FORMATS[3]
+    assert sorted(logins["attempts"]) == sorted(hen.ACCOUNT_FORMATS)
+    assert hen.CONFIG["account"] == hen.ACCOUNT_FORMATS[3]
+    assert json.loads(boot_state.read_text())["account"] == hen.ACCOUNT_FORMATS[3]
+
+def test_saved_account_is_tried_alone(hen, boot_state, logins):
+    boot_state.write_text(json.dumps({"account": hen.ACCOUNT_FORMATS[4]}))
+    logins["format"] = hen.ACCOUNT_FORMATS[4]
+    assert hen.resolve_account().account == hen.ACCOUNT_FORMATS[4]
+    assert logins["attempts"] == [hen.ACCOUNT_FORMATS[4]]
+
+    hen.get_connection()        # resolved: no more probing
+    assert logins["attempts"] == [hen.ACCOUNT_FORMATS[4]] * 2
+
+def test_stale_saved_account_falls_back_to_probing(hen, boot_state, logins):
+    boot_state.write_text(json.dumps({"account": hen.ACCOUNT_FORMATS[4], "schema_version": 1}))
+    logins["format"] = hen.ACCOUNT_FORMATS[1]
+    assert hen.resolve_account().account == hen.ACCOUNT_FORMATS[1]
+    assert json.loads(boot_state.read_text()) == {"account": hen.ACCOUNT_FORMATS[1], "schema_version": 1}
+
+def test_late_logins_are_closed(hen, monkeypatch):
+    opened, release = [], threading.Event()
+
+    def connect(account):
+        if account != "fast":
+            release.wait(5)
+        opened.append(Login(account))
+        return opened[-1]
+    monkeypatch.setattr(hen, "_connect", connect)
+    account, conn = hen._probe_accounts(["slow", "fast"])
+    assert (account, conn.closed) == ("fast", False)
+    release.set()
+    deadline = time.monotonic() + 5
+    while len(opened) < 2 or not opened[1].closed:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_no_format_logs_in(hen, boot_state, logins):
+    logins["delay"] = 0
+    with pytest.raises(hen.snowflake_connector().errors.DatabaseError):
+        hen.resolve_account()
+    assert not hen._account_resolved
+    assert not boot_state.exists()
+
+def test_schema_ddl_runs_once_per_version_and_target(hen, fake, boot_state):
+    assert hen.setup_schema() is True
+    before = fake.stats["statements"]
+    assert hen.setup_schema() is False
+    assert fake.stats["statements"] == before
+
+    state = json.loads(boot_state.read_text())
+    boot_state.write_text(json.dumps(dict(state, schema_target="OTHER_DB.OTHER_SCHEMA")))
+    assert hen.setup_schema() is True
+    assert hen.setup_schema(force=True) is True
+    boot_state.write_text(json.dumps(dict(state, schema_version=hen.SCHEMA_VERSION - 1)))
+    assert hen.setup_schema() is True
+
+def test_failed_bootstrap_reports_without_retrying(hen, monkeypatch):
+    monkeypatch.setattr(hen, "test_connection", lambda: False)
+    monkeypatch.setattr(hen, "_boot_state", dict(hen._boot_state, attempts=0, last_error=None))
+    assert hen.bootstrap_warehouse(retry=False) is False
+    assert hen.boot_stats()["attempts"] == 1
+    assert "login failed" in hen.boot_stats()["last_error"]
@@ -0,0 +1,107 @@
+"""
+Event streams: Last-Event-ID resume, resync and the max_streams limit.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from helpers import crossing
+
+@pytest.fixture
+def hub(hen, monkeypatch):
+    hub = hen.EventHub(**dict(hen.EVENTS_CONFIG, history=5, max_streams=2, coalesce_ms=0))
+    monkeypatch.setattr(hen, "event_hub", hub)
+    yield hub
+    hub.close()
+
+def frames(chunk):
+    """(id, event, data) for each SSE frame in `chunk`."""
+    out = []
+    for block in chunk.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+        if "event" in fields:
+            out.append((fields["id"], fields["event"], json.loads(fields["data"])))
+    return out
+
+def test_stream_resumes_after_last_event_id(hen, hub):
+    hub.publish("CROSSING_LOGS", [crossing(hen, notes="a")])
+    seen = hub.stats()["last_event_id"]
+    hub.publish("CROSSING_LOGS", [crossing(hen, notes="b"), crossing(hen, notes="c")])
+
+    stream = hub.stream(seen)
+    (_, event, hello), = frames(next(stream))
+    assert (event, hello["resync"]) == ("hello", False)
+    assert [data["NOTES"] for _, _, data in frames(next(stream))] == ["b", "c"]
+    stream.close()
+    assert hub.stats()["resumed"] == 1
+
+@pytest.mark.parametrize("last_event_id", ["someotherepoch-1", "0-0", "garbage"])
+def test_stream_asks_unknown_ids_to_resync(hen, hub, last_event_id):
+    stream = hub.stream(last_event_id)
+    (_, _, hello), = frames(next(stream))
+    assert hello["resync"] is True
+    stream.close()
+
+def test_stream_resyncs_when_the_ring_moved_past_the_id(hen, hub):
+    hub.publish("CROSSING_LOGS", [crossing(hen)])
+    seen = hub.stats()["last_event_id"]
+    hub.publish("CROSSING_LOGS", [crossing(hen) for _ in range(10)])
+
+    stream = hub.stream(seen)
+    (_, _, hello), = frames(next(stream))
+    assert hello["resync"] is True
+    stream.close()
+
+def test_stream_filters_on_location(hen, hub):
+    stream = hub.stream(None, {"Main St"})
+    next(stream)
+    hub._append("JAYWALKING_VIOLATIONS", [{"LOCATION": "Elm St", "N": 1}, {"LOCATION": "Main St", "N": 2}])
+    assert [data["N"] for _, _, data in frames(next(stream))] == [2]
+    stream.close()
+
+def test_stream_limit_counts_streams_that_have_not_started(hen, hub):
+    client = hen.app.test_client()
+    first = client.get("/api/events/stream")
+    second = client.get("/api/events/stream")
+    assert (first.status_code, second.status_code) == (200, 200)
+    assert hub.stats()["open_streams"] == 2
+
+    refused = client.get("/api/events/stream")
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "10"
+
+    first.close()
+    assert hub.stats()["open_streams"] == 1
+    third = client.get("/api/events/stream")
+    assert third.status_code == 200
+    second.close()
+    third.close()
+    assert hub.stats()["open_streams"] == 0
+
+def test_stream_limit_holds_under_concurrent_connects(hen, hub, monkeypatch):
+    start = threading.Barrier(8)
+    responses = []
+
+    class SlowResponse(hen.app.response_class):
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)    # widen any gap between the limit check and the count
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(hen.app, "response_class", SlowResponse)
+
+    def connect():
+        client = hen.app.test_client()
+        start.wait()
+        responses.append(client.get("/api/events/stream"))
+    threads = [threading.Thread(target=connect) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(r.status_code for r in responses) == [200, 200] + [503] * 6
+    assert hub.stats()["open_streams"] == 2
+    for r in responses:
+        r.close()
@@ -0,0 +1,73 @@
+"""
+Streaming export: CSV / NDJSON / Parquet, filters, time ranges and photos.
+"""
+
+import base64
+import csv
+import io
+import json
+
+import pytest
+
+import bench
+from helpers import crossing, data_url, violation_body
+
+@pytest.fixture
+def crossings(hen, warehouse, monkeypatch):
+    monkeypatch.setitem(hen.EXPORT_CONFIG, "fetch_size", 2)     # several batches per export
+    rows = [crossing(hen, timestamp=f"2026-03-0{day} 12:00:00.000", notes=str(day),
+                     pedestrian_type="child" if day % 2 else "adult")
+            for day in (3, 1, 5, 2, 4)]
+    hen.insert_rows("CROSSING_LOGS", rows)
+    return rows
+
+def export(hen, query):
+    with hen.app.test_client().get(f"/api/export?{query}") as resp:
+        return resp.status_code, resp.headers, resp.get_data()
+
+def test_csv_export_streams_every_row_in_time_order(hen, crossings):
+    status, headers, body = export(hen, "table=crossings&format=csv")
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/csv")
+    assert headers["Content-Disposition"] == 'attachment; filename="smartcross-crossings.csv"'
+    rows = list(csv.DictReader(io.StringIO(body.decode())))
+    assert [r["notes"] for r in rows] == ["1", "2", "3", "4", "5"]
+    assert list(rows[0]) == hen.export_columns("CROSSING_LOGS")
+    assert rows[0]["timestamp"] == "2026-03-01 12:00:00.000"
+
+def test_ndjson_export_applies_filters_and_time_range(hen, crossings):
+    status, _, body = export(hen, "table=crossings&format=ndjson&pedestrian_type=child"
+                                  "&from=2026-03-02&to=2026-03-05")
+    assert status == 200
+    rows = [json.loads(line) for line in body.decode().splitlines()]
+    assert [(r["notes"], r["pedestrian_type"]) for r in rows] == [("3", "child")]
+
+def test_parquet_export_round_trips(hen, crossings):
+    pq = pytest.importorskip("pyarrow.parquet")
+    status, headers, body = export(hen, "table=crossings&format=parquet")
+    assert status == 200
+    table = pq.read_table(io.BytesIO(body))
+    assert table.column("notes").to_pylist() == ["1", "2", "3", "4", "5"]
+    assert table.schema.field("persons_count").type == "int64"
+    assert pq.ParquetFile(io.BytesIO(body)).num_row_groups == 3
+
+def test_parquet_export_without_pyarrow_is_501(hen, crossings, monkeypatch):
+    monkeypatch.setitem(__import__("sys").modules, "pyarrow", None)
+    status, _, body = export(hen, "table=crossings&format=parquet")
+    assert status == 501
+    assert "pip install pyarrow" in json.loads(body)["error"]
+
+def test_violation_photos_are_only_exported_on_request(hen, warehouse, image_store):
+    png = bench.make_png(4)
+    hen.app.test_client().post("/api/snowflake", json=violation_body(image_dataurl=data_url(png)))
+
+    _, _, body = export(hen, "table=violations&format=ndjson")
+    assert "image_base64" not in json.loads(body)
+    _, _, body = export(hen, "table=violations&format=ndjson&include_images=1")
+    assert base64.b64decode(json.loads(body)["image_base64"]) == png
+
+@pytest.mark.parametrize("query", [
+    "table=settings", "format=xml", "severity=high", "from=yesterday",
+])
+def test_bad_export_parameters_are_400(hen, query):
+    assert export(hen, query)[0] == 400
@@ -0,0 +1,71 @@
+"""
+Health checks: cached background probe, liveness and readiness.
+"""
+
+import time
+
+import pytest
+
+@pytest.fixture
+def prober(hen, monkeypatch):
+    prober = hen.HealthProber(**dict(hen.HEALTH_CONFIG, first_probe_wait=0))
+    prober.start = lambda: None     # tests call probe_once() themselves
+    monkeypatch.setattr(hen, "health_prober", prober)
+    return prober
+
+def down(hen, monkeypatch):
+    def db_connection():
+        raise hen.snowflake_connector().errors.OperationalError("connection reset")
+    monkeypatch.setattr(hen, "db_connection", db_connection)
+
+def test_health_is_served_from_the_cached_probe(hen, fake, prober):
+    prober.probe_once()
+    client = hen.app.test_client()
+
+    before = fake.stats["statements"]
+    for _ in range(5):
+        resp = client.get("/api/health")
+        assert resp.status_code == 200
+    assert fake.stats["statements"] == before
+    assert resp.json["user"] == "BENCH_USER"
+    assert resp.json["status"] == "Snowflake connected"
+    assert client.get("/api/health/ready").status_code == 200
+
+def test_health_before_the_first_probe_is_503(hen, prober):
+    assert hen.app.test_client().get("/api/health").status_code == 503
+    assert hen.app.test_client().get("/api/health/ready").status_code == 503
+
+def test_failed_probe_keeps_the_last_success(hen, prober, monkeypatch):
+    prober.probe_once()
+    down(hen, monkeypatch)
+    prober.probe_once()
+
+    resp = hen.app.test_client().get("/api/health")
+    assert resp.status_code == 500
+    assert "connection reset" in resp.json["status"]
+    snap = hen.app.test_client().get("/api/health/ready").json["probe"]
+    assert (snap["consecutive_failures"], snap["user"]) == (1, "BENCH_USER")
+    assert "last_ok_age_seconds" in snap
+
+def test_stale_probe_is_not_ready(hen, prober, monkeypatch):
+    prober.probe_once()
+    monkeypatch.setattr(prober, "stale_after", 0)
+    time.sleep(0.01)
+    resp = hen.app.test_client().get("/api/health/ready")
+    assert resp.status_code == 503
+    assert resp.json["probe"]["ok"]
+
+def test_liveness_never_touches_the_warehouse(hen, fake, prober, monkeypatch):
+    down(hen, monkeypatch)
+    before = fake.stats["statements"]
+    resp = hen.app.test_client().get("/api/health/live")
+    assert resp.status_code == 200
+    assert resp.json["ok"] and resp.json["draining"] is False
+    assert fake.stats["statements"] == before
+
+def test_draining_server_is_not_ready(hen, prober, monkeypatch):
+    prober.probe_once()
+    monkeypatch.setitem(hen._server_state, "draining", True)
+    resp = hen.app.test_client().get("/api/health/ready")
+    # New requests are refused while draining, health checks included.
+    assert resp.status_code == 503
@@ -0,0 +1,67 @@
+"""
+Violation photo delivery: ETag / 304, Range requests and legacy rows.
+"""
+
+import base64
+import hashlib
+
+import bench
+from helpers import violation_body, data_url
+
+def post_photo(hen, image):
+    resp = hen.app.test_client().post("/api/snowflake",
+                                      json=violation_body(image_dataurl=data_url(image)))
+    assert resp.status_code == 200
+    return resp.json["violation_id"]
+
+def test_photo_is_served_with_an_immutable_etag(hen, warehouse, image_store):
+    png = bench.make_png(16)
+    vid = post_photo(hen, png)
+
+    resp = hen.app.test_client().get(f"/api/violations/{vid}/image")
+    assert resp.status_code == 200
+    assert resp.data == png
+    assert resp.mimetype == "image/png"
+    assert resp.headers["ETag"] == f'"{hashlib.sha256(png).hexdigest()}"'
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert resp.cache_control.immutable and resp.cache_control.public
+    assert resp.headers["Content-Disposition"].startswith("attachment")
+
+def test_matching_etag_gets_304_without_a_query(hen, fake, warehouse, image_store):
+    vid = post_photo(hen, bench.make_png(16))
+    client = hen.app.test_client()
+    etag = client.get(f"/api/violations/{vid}/image").headers["ETag"]
+
+    before = fake.stats["statements"]
+    resp = client.get(f"/api/violations/{vid}/image", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert fake.stats["statements"] == before
+
+def test_range_request_gets_206_with_just_those_bytes(hen, warehouse, image_store):
+    png = bench.make_png(16)
+    vid = post_photo(hen, png)
+    client = hen.app.test_client()
+
+    with client.get(f"/api/violations/{vid}/image", headers={"Range": "bytes=10-19"}) as resp:
+        assert resp.status_code == 206
+        assert resp.data == png[10:20]
+        assert resp.headers["Content-Range"] == f"bytes 10-19/{len(png)}"
+
+    with client.get(f"/api/violations/{vid}/image",
+                    headers={"Range": f"bytes={len(png) + 10}-"}) as resp:
+        assert resp.status_code == 416
+
+def test_legacy_base64_photo_is_still_served(hen, warehouse, image_store):
+    png = bench.make_png(4)
+    vid = post_photo(hen, png)
+    warehouse.execute("UPDATE JAYWALKING_VIOLATIONS SET image_ref = NULL, image_data = ? "
+                      "WHERE violation_id = ?", (base64.b64encode(png).decode(), vid))
+
+    resp = hen.app.test_client().get(f"/api/violations/{vid}/image")
+    assert resp.status_code == 200
+    assert resp.data == png
+    assert resp.headers["ETag"] == f'"{hashlib.sha256(png).hexdigest()}"'
+
+def test_unknown_violation_is_404(hen, warehouse, image_store):
+    assert hen.app.test_client().get("/api/violations/no-such-id/image").status_code == 404
@@ -0,0 +1,62 @@
+"""
+Content-addressed image store and data-URL photo ingest.
+"""
+
+import io
+import json
+
+import pytest
+
+import bench
+from helpers import count, data_url, stored_files, violation_body
+
+def test_identical_images_are_stored_once(hen, image_store):
+    png = bench.make_png(4)
+    ref = image_store.put(png, "png")
+    assert image_store.put(png, "png") == ref
+    writer = image_store.open_writer()
+    for i in range(0, len(png), 1000):
+        writer.write(png[i:i + 1000])
+    assert writer.commit("png") == ref
+    assert stored_files(image_store) == [ref]
+    with open(image_store.path(ref), "rb") as f:
+        assert f.read() == png
+
+@pytest.mark.parametrize("ref", ["../../etc/passwd", "a" * 64 + "./png", "abc.png", "A" * 64 + ".png"])
+def test_store_rejects_refs_outside_it(hen, image_store, ref):
+    assert image_store.path(ref) is None
+
+def test_data_url_photo_goes_to_the_store(hen, warehouse, image_store):
+    png = bench.make_png(8)
+    resp = hen.app.test_client().post("/api/snowflake", json=violation_body(image_dataurl=data_url(png)))
+    assert resp.status_code == 200
+    ref, image_data = warehouse.execute(
+        "SELECT image_ref, image_data FROM JAYWALKING_VIOLATIONS WHERE violation_id = ?",
+        (resp.json["violation_id"],)).fetchone()
+    assert image_data is None
+    assert ref.endswith(".png")
+    with open(image_store.path(ref), "rb") as f:
+        assert f.read() == png
+
+@pytest.mark.parametrize("url, message", [
+    ("data:image/png;base64,@@@", "not valid base64"),
+    ("data:image/png;base64,aGVsbG8=!", "not valid base64"),
+    ("data:image/png;base64,", "no image data"),
+    ("data:image/png;base64,aGVsbG8gd29ybGQ=", "not a PNG, JPEG, GIF or WebP"),
+    ("data:image/png,%89PNG", "base64 data: URL"),
+    ("data:image/png;base64", "base64 data: URL"),
+])
+def test_bad_data_url_is_rejected_before_the_store(hen, warehouse, image_store, url, message):
+    resp = hen.app.test_client().post("/api/snowflake", json=violation_body(image_dataurl=url))
+    assert resp.status_code == 400
+    assert message in resp.json["error"]
+    assert stored_files(image_store) == []
+    assert count(warehouse, "JAYWALKING_VIOLATIONS") == 0
+
+def test_bad_data_url_fails_only_its_batch_record(hen, warehouse, image_store):
+    body = "\n".join(json.dumps(b) for b in [
+        violation_body(image_dataurl=data_url(bench.make_png(1))),
+        violation_body(image_dataurl="data:image/png;base64,@@@")])
+    resp = hen.app.test_client().post("/api/snowflake/batch", data=io.BytesIO(body.encode()))
+    assert [r["ok"] for r in resp.json["results"]] == [True, False]
+    assert len(stored_files(image_store)) == 1
@@ -0,0 +1,77 @@
+"""
+IngestQueue: batching by size and age, backpressure, fallback and drain.
+"""
+
+import threading
+
+import pytest
+
+from helpers import count, ingest_body, wait_for
+
+@pytest.fixture
+def make_queue(hen):
+    queues = []
+
+    def make_queue(insert=None, **config):
+        calls, spooled = [], []
+        def record(table, rows):
+            calls.append((table, len(rows)))
+        q = hen.IngestQueue(insert or record, lambda table, rows: spooled.append((table, len(rows))),
+                            **dict(hen.INGEST_CONFIG, **config))
+        q.calls, q.spooled = calls, spooled
+        queues.append(q)
+        return q
+    yield make_queue
+    for q in queues:
+        q.stop(timeout=5)
+
+def test_queue_flushes_full_batches_without_waiting(make_queue):
+    q = make_queue(max_batch=3, max_age_seconds=30)
+    q.submit("CROSSING_LOGS", [{}] * 3)
+    wait_for(lambda: q.calls)
+    assert q.calls == [("CROSSING_LOGS", 3)]
+
+def test_queue_flushes_a_partial_batch_once_it_is_old(make_queue):
+    q = make_queue(max_batch=100, max_age_seconds=0.05)
+    q.submit("CROSSING_LOGS", [{}])
+    q.submit("JAYWALKING_VIOLATIONS", [{}, {}])
+    q.submit("CROSSING_LOGS", [{}])
+    wait_for(lambda: q.stats()["flushes"] == 2)
+    assert q.calls == [("CROSSING_LOGS", 2), ("JAYWALKING_VIOLATIONS", 2)]
+
+def test_queue_spools_a_batch_that_fails_to_insert(make_queue):
+    def down(table, rows):
+        raise OSError("connection reset")
+    q = make_queue(insert=down, max_age_seconds=0.01)
+    q.submit("CROSSING_LOGS", [{}, {}])
+    wait_for(lambda: q.spooled)
+    assert q.spooled == [("CROSSING_LOGS", 2)]
+    assert (q.stats()["flush_errors"], q.stats()["spooled_rows"]) == (1, 2)
+
+def test_queue_rejects_whole_submits_when_full(hen, make_queue):
+    release = threading.Event()
+    q = make_queue(insert=lambda table, rows: release.wait(5), max_batch=1,
+                   max_queue_depth=3, put_timeout=0.05)
+    q.submit("CROSSING_LOGS", [{}])             # held by the flusher
+    wait_for(lambda: q.stats()["in_flight"] == 1)
+    q.submit("CROSSING_LOGS", [{}, {}])
+    with pytest.raises(hen.IngestQueueFull):
+        q.submit("CROSSING_LOGS", [{}, {}])     # only one row of room: nothing is queued
+    q.submit("CROSSING_LOGS", [{}])
+    assert (q.stats()["depth"], q.stats()["rejected"]) == (3, 2)
+    release.set()
+
+def test_queue_stop_flushes_what_is_queued(make_queue):
+    q = make_queue(max_batch=2, max_age_seconds=30)
+    for _ in range(5):
+        q.submit("CROSSING_LOGS", [{}])
+    q.stop(timeout=5)
+    assert sum(n for _, n in q.calls) == 5
+    assert not q.stats()["running"]
+
+def test_write_behind_mode_answers_202_and_inserts_later(hen, warehouse, monkeypatch):
+    monkeypatch.setitem(hen.INGEST_CONFIG, "mode", "write_behind")
+    resp = hen.app.test_client().post("/api/snowflake", json=ingest_body())
+    assert resp.status_code == 202
+    assert resp.get_json()["queued"] is True
+    wait_for(lambda: count(warehouse, "CROSSING_LOGS") == 1)
@@ -0,0 +1,69 @@
+"""
+Metrics: Prometheus rendering, per-route and per-query histograms.
+"""
+
+import re
+
+import pytest
+
+@pytest.fixture
+def registry(hen, monkeypatch):
+    """Metrics created in a test go here instead of the app's /api/metrics."""
+    metrics = []
+    monkeypatch.setattr(hen, "_metrics", metrics)
+    return metrics
+
+def sample(text, name, **labels):
+    """Value of the sample `name{labels}` in Prometheus text, or None."""
+    for line in text.splitlines():
+        m = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+        if m and m[1] == name and dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m[2] or "")) == labels:
+            return float(m[3])
+    return None
+
+def test_histogram_renders_cumulative_buckets(hen, registry):
+    h = hen.Histogram("t_seconds", "Test.", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        h.observe(value, "/x")
+    text = hen.render_metrics()
+    assert "# TYPE t_seconds histogram" in text
+    assert [sample(text, "t_seconds_bucket", route="/x", le=le) for le in ("0.1", "1", "+Inf")] == [2, 3, 4]
+    assert sample(text, "t_seconds_count", route="/x") == 4
+    assert sample(text, "t_seconds_sum", route="/x") == pytest.approx(3.65)
+
+def test_counter_escapes_label_values(hen, registry):
+    c = hen.Counter("t_total", "Test.", ("where",))
+    c.inc('a "quoted"\nvalue')
+    c.inc('a "quoted"\nvalue', value=2)
+    assert 't_total{where="a \\"quoted\\"\\nvalue"} 3' in hen.render_metrics().splitlines()
+
+def test_failing_gauge_is_left_out(hen, registry):
+    hen.Gauge("t_ok", "Test.", lambda: 7)
+    hen.Gauge("t_broken", "Test.", lambda: 1 / 0)
+    text = hen.render_metrics()
+    assert sample(text, "t_ok") == 7
+    assert "t_broken" not in text
+
+def test_metrics_endpoint_counts_routes_and_queries(hen, warehouse):
+    client = hen.app.test_client()
+    client.get("/api/settings?key=metrics-test")
+    client.get("/api/no-such-route").close()
+
+    resp = client.get("/api/metrics")
+    assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = resp.get_data(as_text=True)
+    assert sample(text, "hen_http_requests_total", route="/api/settings", method="GET", status="200") >= 1
+    assert sample(text, "hen_http_requests_total", route="unmatched", method="GET", status="404") >= 1
+    assert sample(text, "hen_http_request_duration_seconds_count", route="/api/settings", method="GET") >= 1
+    assert sample(text, "hen_snowflake_query_seconds_count", type="select", phase="execute") >= 1
+    assert sample(text, "hen_pool_open") is not None
+
+def test_slow_requests_are_logged_with_their_phases(hen, warehouse, monkeypatch):
+    lines = []
+    monkeypatch.setattr(hen, "print", lambda *a, **k: lines.append(" ".join(map(str, a))), raising=False)
+    monkeypatch.setitem(hen.METRICS_CONFIG, "slow_request_ms", 0)
+    hen.settings_cache.invalidate("metrics-test")
+    hen.app.test_client().get("/api/settings?key=metrics-test")
+    line = [l for l in lines if l.startswith("[slow]")][-1]
+    assert "GET /api/settings 200" in line
+    assert "execute=" in line and "checkout=" in line
@@ -0,0 +1,104 @@
+"""
+ConnectionPool: LIFO reuse, the size cap, eviction and broken sessions.
+"""
+
+import threading
+import time
+
+import pytest
+
+class Session:
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def is_closed(self):
+        return self.closed or not self.alive
+
+    def cursor(self):
+        if not self.alive:
+            raise OSError("connection reset")
+        return self
+
+    def execute(self, sql):
+        pass
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def make_pool(hen):
+    def make_pool(**config):
+        return hen.ConnectionPool(Session, **dict(hen.POOL_CONFIG, **config))
+    return make_pool
+
+def test_pool_reuses_the_most_recent_session(make_pool):
+    pool = make_pool()
+    a, b = pool.checkout(), pool.checkout()
+    pool.checkin(a)
+    pool.checkin(b)
+    assert pool.checkout() is b
+    stats = pool.stats()
+    assert (stats["created"], stats["checkouts"], stats["open"], stats["idle"]) == (2, 3, 2, 1)
+
+def test_pool_times_out_when_every_session_is_busy(hen, make_pool):
+    pool = make_pool(max_size=1, checkout_timeout=0.05)
+    pool.checkout()
+    with pytest.raises(hen.PoolTimeout):
+        pool.checkout()
+    assert pool.stats()["timeouts"] == 1
+
+def test_pool_hands_a_returned_session_to_a_waiter(make_pool):
+    pool = make_pool(max_size=1, checkout_timeout=5)
+    held = pool.checkout()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.checkin(held)
+    waiter.join()
+    assert got == [held]
+    assert pool.stats()["waits"] == 1
+
+def test_pool_closes_sessions_past_their_idle_or_lifetime_limit(make_pool):
+    for config in ({"max_idle_seconds": 0}, {"max_lifetime_seconds": 0}):
+        pool = make_pool(**config)
+        old = pool.checkout()
+        pool.checkin(old)
+        time.sleep(0.01)
+        assert pool.checkout() is not old
+        assert old.conn.closed
+        assert pool.stats()["recycled"] == 1
+
+def test_pool_replaces_sessions_that_fail_validation(make_pool):
+    pool = make_pool(validate_after_seconds=0)
+    old = pool.checkout()
+    pool.checkin(old)
+    old.conn.alive = False
+    time.sleep(0.01)
+    assert pool.checkout() is not old
+    stats = pool.stats()
+    assert (stats["failed_validations"], stats["recycled"], stats["open"]) == (1, 1, 1)
+
+def test_pool_keeps_the_session_after_a_data_error(hen, make_pool):
+    pool = make_pool()
+    errors = hen.snowflake_connector().errors
+    with pytest.raises(errors.ProgrammingError):
+        with pool.connection():
+            raise errors.ProgrammingError("NULL result in a non-nullable column",
+                                          errno=100072, sqlstate="22000")
+    with pytest.raises(errors.OperationalError):
+        with pool.connection() as conn:
+            raise errors.OperationalError("connection reset")
+    assert conn.closed
+    stats = pool.stats()
+    assert (stats["created"], stats["recycled"], stats["open"]) == (1, 1, 0)
+
+def test_pool_frees_the_slot_when_a_login_fails(hen):
+    def factory():
+        raise OSError("login failed")
+    pool = hen.ConnectionPool(factory, max_size=1, checkout_timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            pool.checkout()
+    assert pool.stats()["open"] == 0
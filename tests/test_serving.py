@@ -0,0 +1,119 @@
+"""
+Route concurrency limits, deadlines and the request-thread budget.
+"""
+
+import threading
+import time
+
+from helpers import count, ingest_body, wait_for
+
+def test_limited_holds_the_slot_until_the_view_finishes(hen, fake, warehouse, monkeypatch):
+    limit = hen.route_limits["feeds"]
+    monkeypatch.setattr(limit, "timeout", 0.1)
+    fake.query_latency = 0.5
+    monkeypatch.setitem(hen.FEED_CONFIG, "serve_from_memory", False)
+    free = limit.sem._value
+
+    resp = hen.app.test_client().get("/api/crossings")
+    assert resp.status_code == 504
+    assert limit.sem._value == free - 1     # the query is still running
+
+    fake.query_latency = 0
+    wait_for(lambda: limit.sem._value == free)
+
+def test_limited_rejects_when_the_group_is_full(hen, fake, warehouse, monkeypatch):
+    limit = hen.route_limits["ingest"]
+    monkeypatch.setattr(limit, "sem", threading.BoundedSemaphore(1))
+    monkeypatch.setitem(hen.SERVE_CONFIG, "queue_wait", 0.05)
+    fake.query_latency = 0.3
+
+    statuses = []
+    def post():
+        statuses.append(hen.app.test_client().post("/api/snowflake", json=ingest_body()).status_code)
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(statuses) == [200, 503]
+    assert count(warehouse, "CROSSING_LOGS") == 1
+
+def test_thread_budget_keeps_health_routes_reachable(hen, fake, warehouse, monkeypatch):
+    monkeypatch.setitem(hen.SERVE_CONFIG, "reserved_threads", 4)
+    monkeypatch.setitem(hen._thread_budget, "sem", None)
+    monkeypatch.setitem(hen._thread_budget, "size", None)
+    hen.budget_request_threads(6)
+    fake.query_latency = 0.3
+
+    statuses = []
+    def post():
+        statuses.append(hen.app.test_client().post("/api/snowflake", json=ingest_body()).status_code)
+    threads = [threading.Thread(target=post) for _ in range(3)]
+    for t in threads:
+        t.start()
+    wait_for(lambda: hen._thread_budget["sem"]._value == 0)
+
+    started = time.monotonic()
+    assert hen.app.test_client().get("/api/health/live").status_code == 200
+    assert time.monotonic() - started < 0.2
+    for t in threads:
+        t.join()
+    assert sorted(statuses) == [200, 200, 503]
+    assert hen._thread_budget["sem"]._value == 2
+
+def test_limited_export_releases_on_close(hen, warehouse, monkeypatch):
+    monkeypatch.setitem(hen._thread_budget, "sem", None)
+    monkeypatch.setitem(hen._thread_budget, "size", None)
+    hen.budget_request_threads(8)
+    limit = hen.route_limits["export"]
+    free = limit.sem._value
+
+    resp = hen.app.test_client().get("/api/export?table=crossings&format=csv")
+    assert resp.status_code == 200
+    assert limit.sem._value == free - 1
+    resp.close()
+    assert limit.sem._value == free
+    assert hen._thread_budget["sem"]._value == hen._thread_budget["size"]
+
+def test_slow_group_does_not_delay_another(hen, fake, warehouse, monkeypatch):
+    release, running = threading.Event(), []
+    def slow_image(violation_id):
+        running.append(violation_id)
+        release.wait(5)
+    monkeypatch.setattr(hen, "get_violation_image", slow_image)
+
+    readers = [threading.Thread(target=hen.app.test_client().get, args=(f"/api/violations/v{i}/image",))
+               for i in range(hen.route_limits["images"].max_concurrent)]
+    for t in readers:
+        t.start()
+    try:
+        wait_for(lambda: len(running) == len(readers))
+        started = time.monotonic()
+        assert hen.app.test_client().post("/api/snowflake", json=ingest_body()).status_code == 200
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        for t in readers:
+            t.join()
+
+def test_streamed_response_is_in_flight_until_closed(hen, warehouse):
+    before = hen.serving_stats()["in_flight"]
+    resp = hen.app.test_client().get("/api/export?table=crossings&format=csv")
+    assert resp.status_code == 200
+    assert hen.serving_stats()["in_flight"] == before + 1
+    resp.close()
+    assert hen.serving_stats()["in_flight"] == before
+
+def test_drain_waits_for_open_event_streams(hen, monkeypatch):
+    monkeypatch.setitem(hen._server_state, "draining", False)
+    resp = hen.app.test_client().get("/api/events/stream")
+    assert resp.status_code == 200
+    assert hen.serving_stats()["in_flight"] >= 1
+    closer = threading.Timer(0.2, resp.close)
+    closer.start()
+    # drain() ends the hub's streams; the request only leaves once its body is closed.
+    monkeypatch.setattr(hen.event_hub, "close", lambda: None)
+    started = time.monotonic()
+    assert hen.drain(timeout=5) == 0
+    assert time.monotonic() - started >= 0.15
+    closer.join()
@@ -0,0 +1,71 @@
+"""
+Settings cache: ETag / 304, write-through, and stale reads during an outage.
+"""
+
+import uuid
+
+import pytest
+
+@pytest.fixture
+def key():
+    return f"test-{uuid.uuid4().hex}"
+
+def save(hen, key, settings):
+    resp = hen.app.test_client().post("/api/settings", json={"key": key, "settings": settings})
+    assert resp.status_code == 200
+    return resp.headers["ETag"]
+
+def test_saved_settings_come_back_with_the_same_etag(hen, fake, key):
+    etag = save(hen, key, {"theme": "dark"})
+    client = hen.app.test_client()
+
+    before = fake.stats["statements"]
+    resp = client.get(f"/api/settings?key={key}")
+    assert resp.json == {"ok": True, "settings": {"theme": "dark"}}
+    assert resp.headers["ETag"] == etag
+    assert resp.cache_control.no_cache
+
+    resp = client.get(f"/api/settings?key={key}", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert fake.stats["statements"] == before      # both answered from the cache
+
+def test_a_save_changes_the_etag(hen, key):
+    old = save(hen, key, {"theme": "dark"})
+    new = save(hen, key, {"theme": "light"})
+    assert new != old
+    resp = hen.app.test_client().get(f"/api/settings?key={key}", headers={"If-None-Match": old})
+    assert resp.status_code == 200
+    assert resp.json["settings"] == {"theme": "light"}
+
+def test_a_miss_reads_through_once(hen, fake, key):
+    save(hen, key, {"theme": "dark"})
+    hen.settings_cache.invalidate(key)
+    client = hen.app.test_client()
+
+    before = fake.stats["statements"]
+    assert client.get(f"/api/settings?key={key}").json["settings"] == {"theme": "dark"}
+    assert client.get(f"/api/settings?key={key}").json["settings"] == {"theme": "dark"}
+    assert fake.stats["statements"] == before + 1
+
+def test_a_failed_save_keeps_the_cached_settings(hen, key, monkeypatch):
+    save(hen, key, {"theme": "dark"})
+
+    def down():
+        raise OSError("connection reset")
+    monkeypatch.setattr(hen, "db_connection", down)
+    resp = hen.app.test_client().post("/api/settings", json={"key": key, "settings": {"theme": "light"}})
+    assert resp.status_code == 500
+    assert hen.app.test_client().get(f"/api/settings?key={key}").json["settings"] == {"theme": "dark"}
+
+def test_expired_settings_are_served_stale_while_the_warehouse_is_down(hen, key, monkeypatch):
+    save(hen, key, {"theme": "dark"})
+    monkeypatch.setattr(hen.settings_cache, "ttl_seconds", 0)
+
+    def down(key):
+        raise OSError("connection reset")
+    monkeypatch.setattr(hen, "load_settings", down)
+    resp = hen.app.test_client().get(f"/api/settings?key={key}")
+    assert resp.json == {"ok": True, "settings": {"theme": "dark"}, "stale": True}
+
+    hen.settings_cache.invalidate(key)
+    assert hen.app.test_client().get(f"/api/settings?key={key}").status_code == 500
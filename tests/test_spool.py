@@ -0,0 +1,73 @@
+"""
+Spool: ordered replay, duplicate skipping and dead-lettering.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+from helpers import count, crossing
+
+@pytest.fixture
+def spool(hen, tmp_path):
+    spool = hen.Spool(str(tmp_path / "spool.sqlite3"), replay_batch=100)
+    spool.start = lambda: None      # tests drive replay_once() themselves
+    return spool
+
+def test_spool_replays_in_order(hen, warehouse, spool):
+    rows = [crossing(hen, notes=str(i)) for i in range(5)]
+    spool.append("CROSSING_LOGS", rows[:3])
+    spool.append("CROSSING_LOGS", rows[3:])
+    assert spool.depth() == 5
+
+    assert spool.replay_once() == 5
+    assert spool.replay_once() == 0
+    assert spool.depth() == 0
+    assert [r[0] for r in warehouse.execute("SELECT notes FROM CROSSING_LOGS ORDER BY rowid")] == \
+        ["0", "1", "2", "3", "4"]
+
+def test_spool_skips_rows_already_in_the_warehouse(hen, warehouse, spool):
+    rows = [crossing(hen) for _ in range(3)]
+    hen.insert_rows("CROSSING_LOGS", rows[:2])   # crash between INSERT and DELETE
+    spool.append("CROSSING_LOGS", rows)
+
+    spool.replay_once()
+    assert count(warehouse, "CROSSING_LOGS") == 3
+    assert spool.stats()["duplicates_skipped"] == 2
+
+def test_spool_dead_letters_rows_the_warehouse_rejects(hen, warehouse, spool):
+    good = [crossing(hen) for _ in range(2)]
+    bad = crossing(hen, timestamp=None)
+    spool.append("CROSSING_LOGS", [good[0], bad, good[1]])
+
+    assert spool.replay_once() == 3
+    stats = spool.stats()
+    assert (stats["depth"], stats["dead"], stats["replayed"]) == (0, 1, 2)
+    assert count(warehouse, "CROSSING_LOGS") == 2
+
+def test_spool_keeps_rows_when_the_warehouse_is_down(hen, warehouse, spool, monkeypatch):
+    spool.append("CROSSING_LOGS", [crossing(hen)])
+
+    def down(table, rows):
+        raise hen.snowflake_connector().errors.OperationalError("connection reset")
+    monkeypatch.setattr(hen, "insert_rows", down)
+    with pytest.raises(Exception, match="connection reset"):
+        spool.replay_once()
+    assert spool.depth() == 1
+    assert spool.stats()["dead"] == 0
+
+def test_spool_replays_once_across_processes(spool):
+    holder = subprocess.Popen(
+        [sys.executable, "-c", "import fcntl, sys, time\n"
+                         "f = open(sys.argv[1], 'w')\n"
+                         "fcntl.flock(f, fcntl.LOCK_EX)\n"
+                         "print('locked', flush=True)\n"
+                         "time.sleep(30)", spool.path + ".lock"],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        assert spool.replay_once() == 0
+    finally:
+        holder.kill()
+        holder.wait()
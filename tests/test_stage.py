@@ -0,0 +1,193 @@
+"""
+StageLoader: buffering, sealing, PUT/COPY and crash recovery.
+"""
+
+import gzip
+import os
+
+import pytest
+
+from helpers import count, crossing, dead_pid
+
+class RecordingStageClient:
+    """StageClient that keeps PUT files in memory and can be told to fail."""
+
+    def __init__(self):
+        self.staged = {}        # name -> CSV lines
+        self.fail_put = False
+
+    def put(self, table, local_path):
+        if self.fail_put:
+            raise OSError("PUT failed")
+        with gzip.open(local_path, "rt", newline="") as f:
+            self.staged[os.path.basename(local_path)] = f.read().splitlines()
+
+    def copy(self, table, columns, filenames):
+        return set(filenames)
+
+@pytest.fixture
+def stage_dir(tmp_path):
+    return str(tmp_path / "stage")
+
+def make_loader(hen, client, stage_dir, **kwargs):
+    loader = hen.StageLoader(client, stage_dir, **kwargs)
+    loader.start = lambda: None     # tests drive process() themselves
+    return loader
+
+def states(loader):
+    return dict(loader._manifest().execute("SELECT name, state FROM files").fetchall())
+
+def test_stage_seals_and_rotates_at_max_rows(hen, stage_dir):
+    loader = make_loader(hen, RecordingStageClient(), stage_dir, max_rows=3)
+    loader.add("CROSSING_LOGS", [crossing(hen) for _ in range(2)])
+    assert list(states(loader).values()) == ["open"]
+
+    loader.add("CROSSING_LOGS", [crossing(hen)])
+    assert list(states(loader).values()) == ["sealed"]
+    assert loader.stats()["open_files"] == {}
+
+    loader.add("CROSSING_LOGS", [crossing(hen)])
+    assert sorted(states(loader).values()) == ["open", "sealed"]
+
+def test_stage_seals_aged_files_and_loads_them(hen, stage_dir):
+    client = RecordingStageClient()
+    loader = make_loader(hen, client, stage_dir, max_age_seconds=0)
+    loader.add("CROSSING_LOGS", [crossing(hen) for _ in range(4)])
+    loader.process()
+
+    assert states(loader) == {}
+    name, = client.staged
+    assert len(client.staged[name]) == 4
+    assert not os.path.exists(os.path.join(stage_dir, name))
+    assert loader.stats()["rows_loaded"] == 4
+
+def test_stage_puts_and_copies_through_the_connector(hen, warehouse, stage_dir):
+    loader = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    loader.add("CROSSING_LOGS", [crossing(hen, notes=None) for _ in range(5)])
+    loader.flush()
+
+    assert states(loader) == {}
+    assert count(warehouse, "CROSSING_LOGS") == 5
+    assert warehouse.execute("SELECT COUNT(*) FROM CROSSING_LOGS WHERE notes IS NULL").fetchone()[0] == 5
+
+def test_stage_failed_copy_is_retried_without_another_put(hen, warehouse, stage_dir):
+    loader = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    copy = loader.client.copy
+    loader.client.copy = lambda *a: (_ for _ in ()).throw(RuntimeError("warehouse suspended"))
+    loader.add("CROSSING_LOGS", [crossing(hen) for _ in range(3)])
+    loader.flush()
+
+    assert list(states(loader).values()) == ["uploaded"]
+    assert loader.stats()["copy_errors"] == 1
+    assert count(warehouse, "CROSSING_LOGS") == 0
+
+    put_calls = []
+    loader.client.put = lambda *a: put_calls.append(a)
+    loader.client.copy = copy
+    loader.process()
+    assert states(loader) == {}
+    assert put_calls == []
+    assert count(warehouse, "CROSSING_LOGS") == 3
+
+def test_stage_repeated_copy_does_not_duplicate_rows(hen, warehouse, stage_dir, monkeypatch):
+    loader = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    loader.add("CROSSING_LOGS", [crossing(hen) for _ in range(3)])
+    # A crash after COPY but before the manifest update leaves the file 'uploaded'.
+    monkeypatch.setattr(loader, "_loaded", lambda name, rows: None)
+    loader.flush()
+    name, = states(loader)
+    assert states(loader)[name] == "uploaded"
+    assert count(warehouse, "CROSSING_LOGS") == 3
+
+    monkeypatch.undo()
+    loader.process()
+    assert states(loader) == {}
+    assert count(warehouse, "CROSSING_LOGS") == 3
+
+def test_stage_failed_put_keeps_file_sealed(hen, stage_dir):
+    client = RecordingStageClient()
+    client.fail_put = True
+    loader = make_loader(hen, client, stage_dir)
+    loader.add("CROSSING_LOGS", [crossing(hen)])
+    loader.flush()
+    assert list(states(loader).values()) == ["sealed"]
+    assert loader.stats()["put_errors"] == 1
+
+    client.fail_put = False
+    loader.process()
+    assert states(loader) == {}
+
+def test_stage_recovers_open_file_of_dead_process(hen, warehouse, stage_dir):
+    crashed = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    crashed.add("CROSSING_LOGS", [crossing(hen) for _ in range(3)])
+    name, = states(crashed)
+    # The process dies mid-row: the gzip has no trailer and ends in a partial line.
+    gz = crashed._open["CROSSING_LOGS"]["gz"]
+    gz.write("half-written,row")
+    gz.flush()
+    crashed._manifest().execute("UPDATE files SET owner_pid = ?", (dead_pid(),))
+
+    survivor = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    survivor.process()
+    assert name not in states(survivor)
+    assert count(warehouse, "CROSSING_LOGS") == 3
+
+def test_stage_leaves_open_file_of_live_process(hen, warehouse, stage_dir):
+    writer = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    writer.add("CROSSING_LOGS", [crossing(hen) for _ in range(2)])
+
+    other = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    other.process()
+    assert list(states(other).values()) == ["open"]
+
+    writer.add("CROSSING_LOGS", [crossing(hen)])
+    writer.flush()
+    assert count(warehouse, "CROSSING_LOGS") == 3
+
+def test_stage_loads_sealed_files_left_by_a_restart(hen, warehouse, stage_dir):
+    before = make_loader(hen, hen.SnowflakeStageClient(), stage_dir, max_rows=2)
+    before.add("CROSSING_LOGS", [crossing(hen) for _ in range(2)])
+    assert list(states(before).values()) == ["sealed"]
+
+    after = make_loader(hen, hen.SnowflakeStageClient(), stage_dir)
+    after.process()
+    assert states(after) == {}
+    assert count(warehouse, "CROSSING_LOGS") == 2
+
+def test_stage_bad_file_is_skipped_then_set_aside(hen, warehouse, stage_dir):
+    loader = make_loader(hen, hen.SnowflakeStageClient(), stage_dir, max_rows=2, max_copy_attempts=2)
+    loader.add("CROSSING_LOGS", [crossing(hen), crossing(hen, timestamp=None)])
+    bad, = states(loader)
+    loader.add("CROSSING_LOGS", [crossing(hen) for _ in range(2)])
+    loader.process()
+
+    # The good file loads in the same COPY; the bad one waits for a retry.
+    assert states(loader) == {bad: "uploaded"}
+    assert count(warehouse, "CROSSING_LOGS") == 2
+
+    loader.process()
+    assert states(loader) == {bad: "dead"}
+    assert os.path.exists(os.path.join(stage_dir, bad))
+    assert loader.stats()["files_dead"] == 1
+
+    loader.add("CROSSING_LOGS", [crossing(hen) for _ in range(2)])
+    loader.process()
+    assert states(loader) == {bad: "dead"}
+    assert count(warehouse, "CROSSING_LOGS") == 4
+
+def test_stage_statement_failure_is_not_blamed_on_files(hen, stage_dir):
+    client = RecordingStageClient()
+    client.copy = lambda *a: (_ for _ in ()).throw(RuntimeError("warehouse suspended"))
+    loader = make_loader(hen, client, stage_dir, max_copy_attempts=1)
+    loader.add("CROSSING_LOGS", [crossing(hen)])
+    for _ in range(3):
+        loader.flush()
+    assert list(states(loader).values()) == ["uploaded"]
+
+def test_stage_manifest_forgets_loaded_files(hen, stage_dir):
+    loader = make_loader(hen, RecordingStageClient(), stage_dir, max_rows=1)
+    for _ in range(20):
+        loader.add("CROSSING_LOGS", [crossing(hen)])
+    loader.process()
+    assert loader._manifest().execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+    assert loader.stats()["files_loaded"] == 20
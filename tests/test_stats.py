@@ -0,0 +1,82 @@
+"""
+Rollups: memory vs Snowflake hours, other writers and dead-lettered rows.
+"""
+
+import time
+
+import pytest
+
+from helpers import crossing
+
+@pytest.fixture
+def rollups(hen, tmp_path, monkeypatch):
+    rollups = hen.Rollups(**dict(hen.STATS_CONFIG, checkpoint_path=str(tmp_path / "stats.json")))
+    rollups.start = lambda: None    # tests call reconcile() / checkpoint() themselves
+    monkeypatch.setattr(hen, "rollups", rollups)
+    return rollups
+
+def hour_ts(hen, hour, minute=30):
+    return hen._hour_label(hour)[:14] + f"{minute:02d}:00.000"
+
+def test_stats_answer_covered_hours_from_memory(hen, warehouse, rollups):
+    now_hour = int(time.time()) // 3600
+    rows = [crossing(hen, timestamp=hour_ts(hen, now_hour + 1), persons_count=2) for _ in range(3)]
+    hen.insert_rows("CROSSING_LOGS", rows)
+    rollups.record("CROSSING_LOGS", rows)
+
+    stats = hen.get_stats(now_hour, now_hour + 2)
+    # The boot hour is only partly seen, so it still comes from Snowflake.
+    assert (stats["memory_hours"], stats["snowflake_hours"]) == (1, 1)
+    assert stats["totals"]["crossings"] == 3
+    assert stats["totals"]["persons_total"] == 6
+
+def test_reconcile_folds_in_other_writers(hen, warehouse, rollups):
+    now_hour = int(time.time()) // 3600
+    mine = crossing(hen, timestamp=hour_ts(hen, now_hour - 2))
+    hen.insert_rows("CROSSING_LOGS", [mine])
+    rollups.record("CROSSING_LOGS", [mine])
+    # Another unit writing to the same warehouse never calls record().
+    hen.insert_rows("CROSSING_LOGS", [crossing(hen, timestamp=hour_ts(hen, now_hour - 2)),
+                                      crossing(hen, timestamp=hour_ts(hen, now_hour - 1))])
+    rollups.record("CROSSING_LOGS", [crossing(hen, timestamp=hour_ts(hen, now_hour - 1)),
+                                     crossing(hen, timestamp=hour_ts(hen, now_hour - 1))])   # never landed
+    assert rollups.hours(now_hour - 2, now_hour)[1] == [now_hour - 2, now_hour - 1]
+
+    assert rollups.reconcile()
+    hourly, missing = rollups.hours(now_hour - 2, now_hour + 2)
+    assert missing == []
+    assert hourly[now_hour - 2]["crossings"] == 2
+    assert hourly[now_hour - 1]["crossings"] == 1
+    assert hen.get_stats(now_hour - 2, now_hour + 2)["snowflake_hours"] == 0
+
+def test_reconcile_keeps_memory_when_snowflake_is_down(hen, warehouse, rollups, monkeypatch):
+    now_hour = int(time.time()) // 3600
+    rollups.record("CROSSING_LOGS", [crossing(hen, timestamp=hour_ts(hen, now_hour + 1))])
+
+    def down(start, end):
+        raise hen.snowflake_connector().errors.OperationalError("connection reset")
+    monkeypatch.setattr(hen, "query_hourly_stats", down)
+    assert not rollups.reconcile()
+    hourly, missing = rollups.hours(now_hour + 1, now_hour + 2)
+    assert hourly[now_hour + 1]["crossings"] == 1
+
+def test_dead_lettered_rows_are_taken_out(hen, warehouse, rollups, tmp_path, monkeypatch):
+    now_hour = int(time.time()) // 3600
+    rows = [crossing(hen, timestamp=hour_ts(hen, now_hour + 1), notes=n) for n in ("ok", "bad", "ok")]
+    spool = hen.Spool(str(tmp_path / "spool.sqlite3"), replay_batch=100)
+    spool.start = lambda: None
+    spool.append("CROSSING_LOGS", rows)
+    rollups.record("CROSSING_LOGS", rows)
+
+    insert_rows = hen.insert_rows
+    def reject_bad(table, batch):
+        if any(r["notes"] == "bad" for r in batch):
+            raise hen.snowflake_connector().errors.ProgrammingError(
+                "Numeric value 'bad' is not recognized", errno=100038, sqlstate="22018")
+        insert_rows(table, batch)
+    monkeypatch.setattr(hen, "insert_rows", reject_bad)
+    spool.replay_once()
+
+    assert spool.stats()["dead"] == 1
+    hourly, _ = rollups.hours(now_hour + 1, now_hour + 2)
+    assert hourly[now_hour + 1]["crossings"] == 2
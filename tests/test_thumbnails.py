@@ -0,0 +1,78 @@
+"""
+Thumbnails, and keeping rows without a photo away from the warehouse.
+"""
+
+import io
+
+import pytest
+
+import bench
+from helpers import data_url, violation_body
+
+PIL = pytest.importorskip("PIL.Image")
+
+def post_violation(hen, **record):
+    resp = hen.app.test_client().post("/api/snowflake", json=violation_body(**record))
+    assert resp.status_code == 200
+    return resp.json["violation_id"]
+
+def statements(fake):
+    return fake.stats["statements"]
+
+def test_thumbnail_is_a_scaled_jpeg_with_a_stable_etag(hen, fake, warehouse, image_store):
+    vid = post_violation(hen, image_dataurl=data_url(bench.make_png(64)))
+    client = hen.app.test_client()
+
+    resp = client.get(f"/api/violations/{vid}/thumbnail?size=64&quality=50")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/jpeg"
+    assert max(PIL.open(io.BytesIO(resp.data)).size) == 64
+    etag = resp.headers["ETag"]
+
+    before = statements(fake)
+    again = client.get(f"/api/violations/{vid}/thumbnail?size=64&quality=50",
+                       headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert statements(fake) == before
+
+def test_thumbnail_size_is_clamped(hen, warehouse, image_store):
+    vid = post_violation(hen, image_dataurl=data_url(bench.make_png(64)))
+    resp = hen.app.test_client().get(f"/api/violations/{vid}/thumbnail?size=5")
+    assert max(PIL.open(io.BytesIO(resp.data)).size) == hen.THUMBNAIL_CONFIG["min_size"]
+    assert hen.app.test_client().get(f"/api/violations/{vid}/thumbnail?size=big").status_code == 400
+
+def test_row_without_photo_has_no_filename_and_no_image_flag(hen, warehouse, image_store):
+    vid = post_violation(hen)
+    assert warehouse.execute("SELECT image_filename FROM JAYWALKING_VIOLATIONS WHERE violation_id = ?",
+                             (vid,)).fetchone() == (None,)
+    with_photo = post_violation(hen, image_dataurl=data_url(bench.make_png(1)))
+
+    feed = hen.feeds["JAYWALKING_VIOLATIONS"]
+    from_memory = {row["VIOLATION_ID"]: row["HAS_IMAGE"] for _, row in feed.read(10)[0]}
+    from_warehouse = {row["VIOLATION_ID"]: row["HAS_IMAGE"]
+                      for _, row in hen.query_feed("JAYWALKING_VIOLATIONS", 10)}
+    assert from_memory == from_warehouse == {vid: False, with_photo: True}
+
+def test_missing_photo_is_looked_up_once(hen, fake, warehouse, image_store):
+    vid = post_violation(hen)
+    client = hen.app.test_client()
+    assert client.get(f"/api/violations/{vid}/thumbnail?size=64").status_code == 404
+
+    before = statements(fake)
+    for path in ("thumbnail?size=64", "thumbnail?size=160", "image"):
+        assert client.get(f"/api/violations/{vid}/{path}").status_code == 404
+    assert statements(fake) == before
+
+def test_unknown_violation_is_not_cached_as_missing(hen, fake, warehouse, image_store):
+    client = hen.app.test_client()
+    assert client.get("/api/violations/not-loaded-yet/image").status_code == 404
+    assert hen.image_meta_cache.get("not-loaded-yet") is None
+
+def test_no_pillow_means_501_without_a_query(hen, fake, warehouse, image_store, monkeypatch):
+    vid = post_violation(hen, image_dataurl=data_url(bench.make_png(1)))
+    monkeypatch.setattr(hen, "THUMBNAILS_AVAILABLE", False)
+    before = statements(fake)
+    assert hen.app.test_client().get(f"/api/violations/{vid}/thumbnail").status_code == 501
+    assert statements(fake) == before
+    resp = hen.app.test_client().get("/api/violations?limit=1")
+    assert resp.headers["X-Thumbnails"] != "available"
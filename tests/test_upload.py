@@ -0,0 +1,94 @@
+"""
+Binary violation uploads: multipart and raw bodies, sniffing and size limits.
+"""
+
+import io
+
+import pytest
+
+import bench
+from helpers import count, stored_files
+
+@pytest.fixture(autouse=True)
+def small_chunks(hen, monkeypatch):
+    monkeypatch.setitem(hen.UPLOAD_CONFIG, "chunk_size", 1000)     # several reads per upload
+
+def stored_row(warehouse, violation_id):
+    return warehouse.execute(
+        "SELECT severity, location, image_ref, image_data FROM JAYWALKING_VIOLATIONS "
+        "WHERE violation_id = ?", (violation_id,)).fetchone()
+
+def post_form(hen, image, **fields):
+    data = dict(fields)
+    if image is not None:
+        data["image"] = (io.BytesIO(image), "photo.bin")
+    return hen.app.test_client().post("/api/violations", data=data, content_type="multipart/form-data")
+
+def test_multipart_photo_is_streamed_into_the_store(hen, warehouse, image_store):
+    png = bench.make_png(16)
+    resp = post_form(hen, png, severity="HIGH", location="Main St")
+    assert resp.status_code == 200
+    assert resp.json["image"] == {"bytes": len(png), "mimetype": "image/png"}
+    severity, location, ref, image_data = stored_row(warehouse, resp.json["violation_id"])
+    assert (severity, location, image_data) == ("HIGH", "Main St", None)
+    with open(image_store.path(ref), "rb") as f:
+        assert f.read() == png
+
+def test_raw_body_takes_fields_from_the_query_string(hen, warehouse, image_store):
+    png = bench.make_png(16)
+    resp = hen.app.test_client().post("/api/violations?severity=LOW&location=Elm%20St", data=png,
+                                      content_type="image/jpeg")     # the header is ignored
+    assert resp.status_code == 200
+    assert resp.json["image"]["mimetype"] == "image/png"
+    severity, location, ref, _ = stored_row(warehouse, resp.json["violation_id"])
+    assert (severity, location) == ("LOW", "Elm St")
+    assert ref.endswith(".png")
+
+def test_violation_without_a_photo(hen, warehouse, image_store):
+    resp = post_form(hen, None, severity="LOW")
+    assert resp.status_code == 200
+    assert "image" not in resp.json
+    assert stored_row(warehouse, resp.json["violation_id"])[2] is None
+    assert stored_files(image_store) == []
+
+def test_non_image_is_415_and_nothing_is_stored(hen, warehouse, image_store):
+    resp = post_form(hen, b"#!/bin/sh\necho not a photo\n" * 10, severity="HIGH")
+    assert resp.status_code == 415
+    assert stored_files(image_store) == []
+    assert count(warehouse, "JAYWALKING_VIOLATIONS") == 0
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_oversized_photo_is_413_while_streaming(hen, warehouse, image_store, monkeypatch, raw):
+    monkeypatch.setitem(hen.UPLOAD_CONFIG, "max_bytes", 5000)
+    png = bench.make_png(16)
+    if raw:
+        resp = hen.app.test_client().post("/api/violations?severity=HIGH", data=png)
+    else:
+        resp = post_form(hen, png, severity="HIGH")
+    assert resp.status_code == 413
+    assert stored_files(image_store) == []
+    assert count(warehouse, "JAYWALKING_VIOLATIONS") == 0
+
+def test_oversized_form_fields_are_413(hen, warehouse, image_store, monkeypatch):
+    monkeypatch.setitem(hen.UPLOAD_CONFIG, "max_form_bytes", 100)
+    resp = post_form(hen, bench.make_png(1), description="x" * 500)
+    assert resp.status_code == 413
+    assert stored_files(image_store) == []
+
+def test_declared_length_over_the_limit_is_refused_up_front(hen, image_store, monkeypatch):
+    monkeypatch.setitem(hen.UPLOAD_CONFIG, "max_bytes", 1000)
+    monkeypatch.setitem(hen.UPLOAD_CONFIG, "max_form_bytes", 0)
+    resp = hen.app.test_client().post("/api/violations", data=b"x" * 2000)
+    assert resp.status_code == 413
+    assert "larger than 1000 bytes" in resp.json["error"]
+
+@pytest.mark.parametrize("content_type, body", [
+    ("multipart/form-data", b"--x\r\n"),
+    ("multipart/form-data; boundary=x",
+     b'--x\r\nContent-Disposition: form-data; name="image"; filename="a.png"\r\n\r\n'
+     + bench.make_png(4)[:3000]),
+])
+def test_malformed_multipart_is_400(hen, warehouse, image_store, content_type, body):
+    resp = hen.app.test_client().post("/api/violations", data=body, content_type=content_type)
+    assert resp.status_code == 400
+    assert stored_files(image_store) == []